@@ -1,4 +1,4 @@
-from flask import Flask
+from flask import Flask, Request, current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from datetime import timedelta
@@ -6,8 +6,21 @@ import os
 
 db = SQLAlchemy()
 
+# Ezek a végpontok nagy fájlokat fogadnak (a többire a MAX_CONTENT_LENGTH érvényes)
+LARGE_UPLOAD_ENDPOINTS = {'api.import_gedcom', 'api.import_json'}
+
+
+class FamilyTreeRequest(Request):
+    @property
+    def max_content_length(self):
+        if self.endpoint in LARGE_UPLOAD_ENDPOINTS:
+            return current_app.config['MAX_IMPORT_CONTENT_LENGTH']
+        return super().max_content_length
+
+
 def create_app():
     app = Flask(__name__, static_folder='../static', template_folder='../templates')
+    app.request_class = FamilyTreeRequest
     
     # Alap útvonalak
     base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -37,10 +50,12 @@ def create_app():
     
     # Konfiguráció
     app.config['SECRET_KEY'] = secret_key
+    app.config['DATA_DIR'] = data_dir
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(data_dir, 'familytree.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['UPLOAD_FOLDER'] = os.path.join(base_dir, '..', 'static', 'uploads')
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max fájlméret
+    app.config['MAX_IMPORT_CONTENT_LENGTH'] = 512 * 1024 * 1024  # GEDCOM / JSON import
     
     # Session konfiguráció
     app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=31)
@@ -57,6 +72,19 @@ def create_app():
     # Adatbázis inicializálás
     db.init_app(app)
     
+    # SQLite PRAGMA-k (WAL, busy timeout, cache...) minden új kapcsolatra
+    from app.sqlite_tuning import init_engine
+    with app.app_context():
+        init_engine(app, db.engine)
+    
+    # Adatváltozás-követés (memóriabeli indexek, cache-ek érvénytelenítése)
+    from app.changes import change_tracker
+    change_tracker.init_app(app, db.session)
+    
+    # Változásnapló (pont-időpontra visszaállítás, inkrementális mentés)
+    from app.journal import journal
+    journal.init_app(app, db.session)
+    
     # Blueprint-ek regisztrálása
     from app.routes import main_bp, api_bp
     app.register_blueprint(main_bp)
@@ -65,5 +93,13 @@ def create_app():
     # Adatbázis táblák létrehozása
     with app.app_context():
         db.create_all()
+        
+        # Meglévő adatbázisok sémájának frissítése (verziózott migrációk)
+        from app.migrations import run_migrations
+        run_migrations(db.engine, lock_dir=data_dir)
+    
+    # CLI parancsok (flask --app run <parancs>)
+    from app.commands import register_commands
+    register_commands(app)
     
     return app
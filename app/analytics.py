@@ -0,0 +1,346 @@
+"""
+Demográfiai elemzések (/api/analytics).
+
+A szükséges oszlopok a persons, marriages és events táblákból egyszer,
+három lekérdezéssel töltődnek be tömör oszloptömbökbe (array modul: a
+dátumok ordinális napként, 0 = ismeretlen; a szülői család sorindexként).
+Ezután minden mutató egy-egy lineáris menet a tömbökön - soronkénti SQL
+és objektum példányosítás nélkül:
+
+  - élettartam eloszlás születési évtizedenként
+  - átlagos életkor a házasságkötéskor és az első gyermek születésekor
+  - vezeték- és keresztnév gyakoriság évtizedenként
+  - valódi generációmélység a szülői gráfból
+
+Születési dátum hiányában a keresztelő (baptism esemény) dátuma pótolja.
+Az eredmény az adatverzióig cache-elve van (VersionedCache).
+"""
+
+from array import array
+from collections import Counter, defaultdict
+from datetime import date
+
+from sqlalchemy import case, func, select
+
+from app import db
+from app.changes import VersionedCache
+
+
+DAYS_PER_YEAR = 365.2425
+TOP_NAMES = 10
+MAX_PLAUSIBLE_AGE = 120
+LIFESPAN_BUCKET = 10  # év
+MARRIAGE_TYPES = ('marriage', 'civil_partnership')
+
+_GENDER_CODES = {'male': 1, 'female': 2}
+_GENDER_NAMES = {1: 'male', 2: 'female'}
+
+
+# ==================== BETÖLTÉS ====================
+
+class _Families:
+    """A családok oszloptömbjei"""
+
+    def __init__(self):
+        self.partner1 = array('l')  # személy sorindex, -1 = ismeretlen/törölt
+        self.partner2 = array('l')
+        self.wedding = array('l')   # házasságkötés ordinális napja (csak házasság típusnál)
+        self.wedding_decade = array('l')
+
+
+class _Columns:
+    """A személyek oszloptömbjei (a sorindex a személy pozíciója; 0 = ismeretlen dátum/évtized)"""
+
+    def __init__(self):
+        self.ids = array('q')
+        self.gender = array('b')
+        self.birth = array('l')          # ordinális nap
+        self.birth_decade = array('l')
+        self.death = array('l')
+        self.parent_family = array('l')  # family sorindex, -1 = nincs
+        self.surnames = []
+        self.given_names = []
+        self.baptism_fallbacks = 0
+
+
+def _days(values):
+    """ISO dátum szövegek (ahogy az SQLite tárolja) -> ordinális napok tömbje (0 = ismeretlen)"""
+    parse = date.fromisoformat
+    return array('l', (parse(value).toordinal() if value else 0 for value in values))
+
+
+def _decades(values):
+    return array('l', (int(value[:4]) // 10 * 10 if value else 0 for value in values))
+
+
+def _columns(connection, statement):
+    """
+    Lekérdezés oszlopokra bontva, közvetlenül a DBAPI kurzorral: 100k sornál
+    a SQLAlchemy Result sorfeldolgozása a teljes számítással vetekedne.
+    A lekérdezésekben csak modul-konstansok szerepelnek, így literal_binds biztonságos.
+    """
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    cursor = connection.connection.cursor()
+    try:
+        rows = cursor.execute(sql).fetchall()
+    finally:
+        cursor.close()
+    return list(zip(*rows)) if rows else None
+
+
+def _load():
+    from app.models import Person, Marriage, Event
+
+    connection = db.session.connection()
+    baptism = (
+        select(Event.person_id, func.min(Event.event_date).label('event_date'))
+        .where(Event.event_type == 'baptism', Event.event_date.isnot(None), Event.deleted_at.is_(None))
+        .group_by(Event.person_id)
+        .subquery()
+    )
+    person_columns = _columns(connection, (
+        select(Person.id, Person.gender, Person.parent_family_id,
+               func.coalesce(Person.birth_date, baptism.c.event_date), Person.death_date,
+               func.trim(func.coalesce(func.nullif(Person.maiden_name, ''), Person.last_name, '')),
+               func.trim(func.coalesce(Person.first_name, '')),
+               Person.birth_date.is_(None) & baptism.c.event_date.isnot(None))
+        .outerjoin(baptism, baptism.c.person_id == Person.id)
+        .where(Person.deleted_at.is_(None))
+    ))
+    family_columns = _columns(connection, (
+        # Minden család kell (a szülői gráfhoz); házasságkötés csak a házasság típusúaknál van
+        select(Marriage.id, Marriage.person1_id, Marriage.person2_id,
+               case((func.coalesce(Marriage.relationship_type, 'marriage').in_(MARRIAGE_TYPES), Marriage.start_date),
+                    else_=None))
+        .where(Marriage.deleted_at.is_(None))
+    ))
+
+    cols = _Columns()
+    families = _Families()
+    family_ids = family_columns[0] if family_columns else ()
+    family_index = {family_id: i for i, family_id in enumerate(family_ids)}
+
+    if person_columns:
+        ids, genders, parent_families, births, deaths, surnames, given_names, from_baptism = person_columns
+        cols.ids = array('q', ids)
+        cols.gender = array('b', (_GENDER_CODES.get(gender, 0) for gender in genders))
+        cols.parent_family = array('l', (family_index.get(family_id, -1) for family_id in parent_families))
+        cols.birth = _days(births)
+        cols.birth_decade = _decades(births)
+        cols.death = _days(deaths)
+        cols.surnames = list(surnames)
+        cols.given_names = list(given_names)
+        cols.baptism_fallbacks = sum(map(bool, from_baptism))
+
+    if family_columns:
+        person_index = {pid: i for i, pid in enumerate(cols.ids)}
+        _, partners1, partners2, weddings = family_columns
+        families.partner1 = array('l', (person_index.get(pid, -1) for pid in partners1))
+        families.partner2 = array('l', (person_index.get(pid, -1) for pid in partners2))
+        families.wedding = _days(weddings)
+        families.wedding_decade = _decades(weddings)
+
+    return cols, families
+
+
+# ==================== SEGÉDFÜGGVÉNYEK ====================
+
+def _age(start_day, end_day):
+    return (end_day - start_day) / DAYS_PER_YEAR
+
+
+def _summary(values):
+    """Darabszám, átlag, medián, kvartilisek (évben, 1 tizedesre)"""
+    if not values:
+        return {'count': 0, 'mean': None, 'median': None, 'p25': None, 'p75': None,
+                'min': None, 'max': None}
+    values = sorted(values)
+    n = len(values)
+
+    def quantile(q):
+        return round(values[min(n - 1, int(q * n))], 1)
+
+    return {
+        'count': n,
+        'mean': round(sum(values) / n, 1),
+        'median': quantile(0.5),
+        'p25': quantile(0.25),
+        'p75': quantile(0.75),
+        'min': round(values[0], 1),
+        'max': round(values[-1], 1),
+    }
+
+
+def _grouped(groups, key_name='decade'):
+    return [dict(_summary(groups[key]), **{key_name: key}) for key in sorted(groups)]
+
+
+def _by_gender(ages, genders):
+    result = {'overall': _summary(ages)}
+    for code, name in _GENDER_NAMES.items():
+        result[name] = _summary([age for age, g in zip(ages, genders) if g == code])
+    return result
+
+
+def _plausible(age):
+    return 0 <= age <= MAX_PLAUSIBLE_AGE
+
+
+# ==================== MUTATÓK ====================
+
+def _lifespans(cols):
+    by_decade = defaultdict(list)
+    histogram = Counter()
+    ages = []
+    for birth, decade, death in zip(cols.birth, cols.birth_decade, cols.death):
+        if not birth or not death:
+            continue
+        age = _age(birth, death)
+        if not _plausible(age):
+            continue
+        ages.append(age)
+        by_decade[decade].append(age)
+        histogram[int(age) // LIFESPAN_BUCKET] += 1
+
+    return {
+        'overall': _summary(ages),
+        'by_birth_decade': _grouped(by_decade),
+        'histogram': [
+            {'from': bucket * LIFESPAN_BUCKET, 'to': (bucket + 1) * LIFESPAN_BUCKET - 1,
+             'count': histogram[bucket]}
+            for bucket in sorted(histogram)
+        ],
+    }
+
+
+def _marriage_ages(cols, families):
+    ages, genders = [], []
+    by_decade = defaultdict(list)
+    birth = cols.birth
+    for day, decade, p1, p2 in zip(families.wedding, families.wedding_decade,
+                                   families.partner1, families.partner2):
+        if not day:
+            continue
+        for person in (p1, p2):
+            if person < 0 or not birth[person]:
+                continue
+            age = _age(birth[person], day)
+            if not _plausible(age):
+                continue
+            ages.append(age)
+            genders.append(cols.gender[person])
+            by_decade[decade].append(age)
+
+    return dict(_by_gender(ages, genders), by_marriage_decade=_grouped(by_decade))
+
+
+def _first_child_ages(cols, families):
+    # Családonként a legkorábbi gyermek születése, majd szülőnként a legkorábbi család
+    partner1, partner2 = families.partner1, families.partner2
+    first_child = array('l', bytes(len(partner1) * array('l').itemsize))
+    for family, day in zip(cols.parent_family, cols.birth):
+        if family >= 0 and day and (not first_child[family] or day < first_child[family]):
+            first_child[family] = day
+
+    parent_first = {}
+    for family, day in enumerate(first_child):
+        if not day:
+            continue
+        for person in (partner1[family], partner2[family]):
+            if person >= 0 and (person not in parent_first or day < parent_first[person]):
+                parent_first[person] = day
+
+    ages, genders = [], []
+    by_decade = defaultdict(list)
+    birth = cols.birth
+    for person, day in parent_first.items():
+        if not birth[person]:
+            continue
+        age = _age(birth[person], day)
+        if not _plausible(age):
+            continue
+        ages.append(age)
+        genders.append(cols.gender[person])
+        by_decade[cols.birth_decade[person]].append(age)
+
+    return dict(_by_gender(ages, genders), by_parent_birth_decade=_grouped(by_decade))
+
+
+def _name_frequency(names, decades):
+    overall = Counter(name for name in names if name)
+    by_decade = defaultdict(Counter)
+    for name, decade in zip(names, decades):
+        if name and decade:
+            by_decade[decade][name] += 1
+
+    def top(counter):
+        return [{'name': name, 'count': count} for name, count in counter.most_common(TOP_NAMES)]
+
+    return {
+        'overall': top(overall),
+        'by_birth_decade': [{'decade': decade, 'top': top(by_decade[decade])} for decade in sorted(by_decade)],
+    }
+
+
+def _generation_depth(cols, families):
+    """
+    Mélység = a leghosszabb felmenő lánc hossza (akinek nincs ismert szülője: 1).
+    Iteratív bejárás memóriával; hibás (ciklikus) adatnál a ciklus megszakad.
+    """
+    n = len(cols.ids)
+    depth = array('l', bytes(n * array('l').itemsize))  # 0 = még nem számolt
+    on_stack = bytearray(n)
+    # A két szülő sorindexe személyenként (-1 = ismeretlen)
+    parent1 = array('l', (families.partner1[f] if f >= 0 else -1 for f in cols.parent_family))
+    parent2 = array('l', (families.partner2[f] if f >= 0 else -1 for f in cols.parent_family))
+
+    # Születési sorrendben a szülők többnyire már kiszámoltak, így a verem ritkán mélyül
+    for start in sorted(range(n), key=cols.birth.__getitem__):
+        if depth[start]:
+            continue
+        stack = [start]
+        on_stack[start] = 1
+        while stack:
+            person = stack[-1]
+            a, b = parent1[person], parent2[person]
+            # Egyszerre csak egy szülő kerül a verembe, így az on_stack pontosan
+            # az aktuális utat jelöli (ami rajta van, az valódi ciklus)
+            if a >= 0 and not depth[a] and not on_stack[a]:
+                on_stack[a] = 1
+                stack.append(a)
+                continue
+            if b >= 0 and not depth[b] and not on_stack[b]:
+                on_stack[b] = 1
+                stack.append(b)
+                continue
+            stack.pop()
+            on_stack[person] = 0
+            depth[person] = 1 + max(depth[a] if a >= 0 else 0, depth[b] if b >= 0 else 0)
+
+    distribution = Counter(depth)
+    deepest = max(range(n), key=depth.__getitem__) if n else None
+    return {
+        'max_depth': depth[deepest] if n else 0,
+        'deepest_person_id': cols.ids[deepest] if n else None,
+        'roots': distribution.get(1, 0),
+        'distribution': [{'depth': d, 'count': distribution[d]} for d in sorted(distribution)],
+    }
+
+
+def compute_analytics():
+    """Az összes mutató kiszámítása (cache nélkül)"""
+    cols, families = _load()
+    return {
+        'persons': len(cols.ids),
+        'birth_from_baptism': cols.baptism_fallbacks,
+        'lifespan': _lifespans(cols),
+        'marriage_age': _marriage_ages(cols, families),
+        'first_child_age': _first_child_ages(cols, families),
+        'surnames': _name_frequency(cols.surnames, cols.birth_decade),
+        'given_names': _name_frequency(cols.given_names, cols.birth_decade),
+        'generations': _generation_depth(cols, families),
+    }
+
+
+# Singleton instance
+analytics_cache = VersionedCache(compute_analytics)
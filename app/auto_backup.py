@@ -0,0 +1,216 @@
+"""
+Változásvezérelt, késleltetett (debounced) automatikus mentés.
+
+Minden családfa-adatot módosító commit növeli a közös adatverziót
+(app/changes.py) - ez jelzi, hogy az adatbázis "piszkos". A workerek közül
+egyetlen, fájlzárral választott vezető figyeli a verziót, és akkor készít
+EGY mentést, ha az utolsó módosítás óta QUIET_PERIOD ideig nem volt írás
+(egy szerkesztési sorozat így egyetlen mentés), vagy ha a legrégebbi
+mentetlen módosítás MAX_DELAY-nél régebbi (folyamatos szerkesztés mellett
+is legyen friss mentés).
+
+A mentés általában inkrementális: csak a változásnapló új szakasza kerül
+ki (app/journal.py). Teljes mentés akkor készül, ha a legutóbbi régebbi
+egy napnál, vagy azóta tömeges művelet (import) történt.
+
+Az állapot (utoljára mentett adatverzió, mióta piszkos, mentési késés) a
+backups/.auto_backup.json fájlban van, így bármelyik worker lekérdezheti.
+Ha a vezető folyamat leáll, a zárat egy másik worker veszi át.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from app.backup import backup_manager
+from app.changes import change_tracker
+from app.journal import journal
+
+try:
+    import fcntl
+except ImportError:  # Windows fejlesztői környezet: minden folyamat vezető
+    fcntl = None
+
+
+class AutoBackupCoordinator:
+    """Folyamatok között egyeztetett automatikus mentés"""
+
+    QUIET_PERIOD = 60  # Ennyi írás nélküli idő után indul a mentés (másodperc)
+    MAX_DELAY = 300  # Legfeljebb eddig maradhat mentetlen egy módosítás (másodperc)
+    POLL_INTERVAL = 5  # Ilyen gyakran nézi a vezető az adatverziót (másodperc)
+
+    def __init__(self):
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._lock_file = None
+        self._baseline = None
+
+    @property
+    def state_path(self):
+        return os.path.join(backup_manager.backup_dir, '.auto_backup.json')
+
+    # ---------- Állapot ----------
+
+    def _read_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_state(self, state):
+        tmp_path = f'{self.state_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    @staticmethod
+    def _last_change_time():
+        """Az utolsó adatmódosítás ideje (a verziófájl módosítási ideje)"""
+        try:
+            return os.path.getmtime(change_tracker.version_path)
+        except (OSError, TypeError):
+            return None
+
+    def get_status(self):
+        """Az automatikus mentés állapota (a mentési késés metrikával)"""
+        state = self._read_state() or {}
+        version = change_tracker.version
+        backed_up = state.get('backed_up_version')
+        dirty = backed_up is not None and version != backed_up
+        dirty_since = state.get('dirty_since') if dirty else None
+        if dirty and dirty_since is None:
+            dirty_since = self._last_change_time()
+
+        return {
+            'leader_pid': state.get('leader_pid'),
+            'data_version': version,
+            'backed_up_version': backed_up,
+            'dirty': dirty,
+            'pending_changes': version - backed_up if dirty else 0,
+            'dirty_since': datetime.fromtimestamp(dirty_since).isoformat() if dirty_since else None,
+            'lag_seconds': round(time.time() - dirty_since, 1) if dirty_since else 0,
+            'last_backup_at': state.get('last_backup_at'),
+            'last_backup_lag_seconds': state.get('last_backup_lag_seconds'),
+            'last_backup_changes': state.get('last_backup_changes'),
+            'last_backup_kind': state.get('last_backup_kind'),
+            'last_error': state.get('last_error'),
+        }
+
+    # ---------- Vezető választás ----------
+
+    def _try_lead(self):
+        """Nem blokkoló fájlzár: aki megszerzi, az a vezető, amíg a folyamat él"""
+        if self._lock_file is not None:
+            return True
+        if fcntl is None:
+            self._lock_file = True
+            return True
+        lock_file = open(os.path.join(backup_manager.backup_dir, '.auto_backup.lock'), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    # ---------- Háttérszál ----------
+
+    def on_change(self, old_version, new_version, changes):
+        """change_tracker listener: az első írásnál elindítja a figyelő szálat"""
+        if self._thread is None:
+            try:
+                app = current_app._get_current_object()
+            except RuntimeError:
+                return  # Alkalmazás kontextus nélkül (pl. szkriptből) nincs mit indítani
+            with self._start_lock:
+                if self._thread is None:
+                    self._baseline = old_version
+                    self._thread = threading.Thread(target=self._run, args=(app,), name='auto-backup', daemon=True)
+                    self._thread.start()
+        self._wake.set()
+
+    def _run(self, app):
+        while True:
+            self._wake.wait(self.POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                if self._try_lead():
+                    self._tick(app)
+            except Exception:
+                app.logger.exception('Automatikus mentés hiba')
+
+    def _tick(self, app):
+        state = self._read_state()
+        version = change_tracker.version
+        if state is None:
+            # Első indulás: az ebben a folyamatban látott első írás előtti állapot a kiindulás
+            state = {'backed_up_version': version if self._baseline is None else self._baseline}
+        if version == state['backed_up_version']:
+            if state.get('leader_pid') != os.getpid() or state.get('dirty_since') is not None:
+                state.update(leader_pid=os.getpid(), dirty_since=None)
+                self._write_state(state)
+            return
+        state['leader_pid'] = os.getpid()
+
+        now = time.time()
+        if now < state.get('retry_at', 0):
+            return  # Sikertelen mentés után várunk az újrapróbálással
+        last_change = self._last_change_time() or now
+        if state.get('dirty_since') is None:
+            # Legkésőbb az utolsó módosításkor lett piszkos (POLL_INTERVAL pontossággal)
+            state['dirty_since'] = last_change
+            self._write_state(state)
+
+        quiet = now - last_change >= self.QUIET_PERIOD
+        overdue = now - state['dirty_since'] >= self.MAX_DELAY
+        if not (quiet or overdue):
+            return
+
+        # A mentés közbeni írások a következő körben újra piszkossá teszik
+        changes = version - state['backed_up_version']
+        with app.app_context():
+            from app import db
+            try:
+                if journal.needs_full_backup():
+                    kind = 'full'
+                    result = backup_manager.create_backup(
+                        trigger='auto', description=f'Automatikus mentés ({changes} módosítás után)'
+                    )
+                    if 'error' not in result:
+                        backup_manager.prune()
+                else:
+                    kind = 'incremental'
+                    result = journal.ship() or {'success': True}
+            except Exception as e:
+                app.logger.exception('Automatikus mentés hiba')
+                result = {'error': str(e)}
+            finally:
+                db.session.remove()
+
+        if 'error' in result:
+            state.update(last_error=result['error'], retry_at=time.time() + self.QUIET_PERIOD)
+        else:
+            finished = time.time()
+            state.update(
+                backed_up_version=version,
+                dirty_since=None,
+                last_backup_at=datetime.fromtimestamp(finished).isoformat(),
+                last_backup_lag_seconds=round(finished - state['dirty_since'], 1),
+                last_backup_changes=changes,
+                last_backup_kind=kind,
+                last_error=None,
+                retry_at=0,
+            )
+        self._write_state(state)
+
+
+# Singleton instance
+auto_backup_coordinator = AutoBackupCoordinator()
+change_tracker.subscribe(auto_backup_coordinator.on_change)
@@ -1,25 +1,67 @@
 """
 Backup rendszer a családfa adatbázishoz.
-Automatikus mentés minden módosításnál, és visszaállítási lehetőség.
+Kézi és automatikus mentés (app/auto_backup.py), és visszaállítási lehetőség.
+
+A mentés az SQLite online backup API-jával készül (sqlite3.Connection.backup),
+lapcsoportonként: a lépések között az írók nem blokkolódnak, a WAL-ban lévő
+friss tranzakciók is bekerülnek, és a másolat mindig konzisztens (ha közben
+írás történik, az SQLite újrakezdi a másolást). Az elkészült fájlon
+integritás ellenőrzés fut, csak utána kapja meg a végleges nevét.
+
+A kész másolat nem teljes fájlként marad meg, hanem a deduplikált,
+tömörített blokk tárolóba kerül (app/backup_store.py): a mentés egy
+manifest, a változatlan blokkok a mentések között közösek. A régi, teljes
+fájlos mentések továbbra is listázhatók, visszaállíthatók és törölhetők.
+
+A mentés manifestje a mentéskori változásnapló sorszámot is tárolja: a
+visszaállítás ebből a naplóval (app/journal.py) egy adott időpontig
+előregörgethető.
+
+Visszaállításkor az új adatbázis az élő mellett épül fel (visszaépítés,
+előregörgetés, séma migráció), majd egyetlen írási tranzakcióban kerül az
+élő fájlba: nem kell a workereket vagy a kapcsolatokat újraindítani.
+
+A kézi és az automatikus mentés háttérszálon fut: a kliens job ID-t kap,
+és a /api/backups/jobs/<id> végponton kérdezheti le az állapotot.
+A régi mentések ritkítása (nagyapa-apa-fiú megőrzés: óránkénti, napi, heti,
+havi szint) nem a mentés közben, hanem utána, háttérben fut (prune()).
 """
 
 import os
 import shutil
 import json
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
 from datetime import datetime, timedelta
-from functools import wraps
 from flask import current_app
+from sqlalchemy import create_engine, delete, func, select
+from sqlalchemy.pool import NullPool
+
+from app.backup_store import ChunkStore, ChunkStoreError, MANIFEST_SUFFIX
+from app.changes import change_tracker
+
+try:
+    import fcntl
+except ImportError:  # Windows fejlesztői környezet
+    fcntl = None
 
 
 class BackupManager:
     """Adatbázis backup kezelő"""
     
-    MAX_BACKUPS = 100  # Maximum tárolt backup-ok száma
-    AUTO_BACKUP_INTERVAL = 300  # 5 perc - minimum idő két automatikus backup között
+    # Nagyapa-apa-fiú megőrzés: szintenként ennyi legutóbbi időszak legfrissebb mentése marad
+    RETENTION = {'hourly': 24, 'daily': 7, 'weekly': 4, 'monthly': 12}
+    RETENTION_KEEP_ALL = timedelta(hours=1)  # Az ennél frissebb mentések mind megmaradnak
+    PAGES_PER_STEP = 256  # Ennyi lapot másol egy backup lépés (utána elengedi a zárat)
+    STEP_SLEEP = 0.01  # Szünet két lépés között (másodperc)
+    JOB_RETENTION = timedelta(days=1)  # Ennyi ideig kérdezhető le egy befejezett job
     
     def __init__(self, app=None):
         self.app = app
-        self._last_auto_backup = None
+        self._store = None
         
     def init_app(self, app):
         self.app = app
@@ -38,13 +80,69 @@ class BackupManager:
         base_dir = os.path.dirname(os.path.abspath(__file__))
         return os.path.join(base_dir, '..', 'data', 'familytree.db')
     
-    def create_backup(self, trigger='manual', description=None):
+    @property
+    def jobs_dir(self):
+        """Backup job állapotfájlok (fájlban, hogy minden worker lássa)"""
+        jobs_path = os.path.join(self.backup_dir, '.jobs')
+        os.makedirs(jobs_path, exist_ok=True)
+        return jobs_path
+    
+    @property
+    def store(self):
+        """A deduplikált blokk tároló (első használatkor jön létre)"""
+        if self._store is None:
+            self._store = ChunkStore(self.backup_dir)
+        return self._store
+    
+    def _legacy_path(self, filename):
+        """Régi, teljes fájlos mentés útvonala"""
+        return os.path.join(self.backup_dir, filename)
+    
+    def backup_exists(self, filename):
+        return self.store.has_backup(filename) or os.path.exists(self._legacy_path(filename))
+    
+    def _new_filename(self):
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f'familytree_backup_{timestamp}.db'
+        counter = 1
+        while self.backup_exists(filename):
+            counter += 1
+            filename = f'familytree_backup_{timestamp}_{counter}.db'
+        return filename
+    
+    def _copy_database(self, target_path, progress=None):
         """
-        Backup létrehozása.
+        Online másolat az SQLite backup API-val, majd integritás ellenőrzés.
+        
+        Returns:
+            str: az integrity_check eredménye ('ok', ha hibátlan)
+        """
+        source = sqlite3.connect(self.db_path, isolation_level=None)
+        target = sqlite3.connect(target_path)
+        try:
+            source.execute('PRAGMA busy_timeout = 30000')
+            # Nyitott olvasó tranzakció: a lépések ugyanazt a pillanatképet látják
+            # (WAL), így a közbeni írások nem indítják újra a másolást
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            source.backup(target, pages=self.PAGES_PER_STEP, progress=progress, sleep=self.STEP_SLEEP)
+            source.execute('COMMIT')
+            # Önálló fájl legyen (ne kelljen mellé -wal); a megnyitáskor úgyis WAL-ra vált
+            target.execute('PRAGMA journal_mode = DELETE')
+            rows = target.execute('PRAGMA integrity_check').fetchall()
+            return '; '.join(str(row[0]) for row in rows[:10])
+        finally:
+            target.close()
+            source.close()
+    
+    def create_backup(self, trigger='manual', description=None, progress=None):
+        """
+        Backup létrehozása (a hívó szálon, a befejezésig).
         
         Args:
             trigger: 'auto', 'manual', 'scheduled'
             description: Opcionális leírás
+            progress: Opcionális callback(másolt lapok, összes lap)
             
         Returns:
             dict: Backup információk
@@ -55,65 +153,177 @@ class BackupManager:
         if not os.path.exists(self.db_path):
             return {'error': 'Adatbázis fájl nem található'}
         
-        # Fájlnév generálása
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'familytree_backup_{timestamp}.db'
-        backup_path = os.path.join(self.backup_dir, filename)
+        filename = self._new_filename()
+        partial_path = os.path.join(self.backup_dir, filename + '.part')
         
         try:
-            # Fájl másolása
-            shutil.copy2(self.db_path, backup_path)
-            file_size = os.path.getsize(backup_path)
+            def report(status, remaining, total):
+                if progress:
+                    progress(total - remaining, total)
+            
+            integrity = self._copy_database(partial_path, report)
+            if integrity != 'ok':
+                os.remove(partial_path)
+                return {'error': f'A mentés integritás ellenőrzése sikertelen: {integrity}', 'integrity': integrity}
+            # A mentéskori napló sorszám: innen görgethető előre időpontra
+            from app.journal import journal
+            journal_seq = journal.snapshot_seq(partial_path)
+            # A mentés által hivatkozott feltöltések: a takarítás ezeket megtartja
+            from app.upload_store import database_references
+            uploads = database_references(partial_path)
+            
+            # Blokkokra bontás; a teljes másolatra ezután nincs szükség
+            created_at = datetime.utcnow()
+            manifest = self.store.store(partial_path, filename, {
+                'trigger': trigger, 'description': description, 'created_at': created_at.isoformat(),
+                'journal_seq': journal_seq, 'uploads': uploads
+            })
+            os.remove(partial_path)
+            file_size = manifest['size']
             
             # Napló bejegyzés
             log = BackupLog(
                 filename=filename,
                 file_size=file_size,
                 trigger=trigger,
-                description=description
+                description=description,
+                created_at=created_at
             )
             db.session.add(log)
             db.session.commit()
             
-            # Régi backup-ok törlése
-            self._cleanup_old_backups()
-            
             return {
                 'success': True,
+                'backup_id': log.id,
                 'filename': filename,
                 'file_size': file_size,
+                'stored_size': manifest['new_bytes'],
+                'integrity': integrity,
+                'journal_seq': journal_seq,
                 'created_at': datetime.now().isoformat()
             }
             
         except Exception as e:
+            for path in (partial_path, partial_path + '-journal'):
+                if os.path.exists(path):
+                    os.remove(path)
             return {'error': str(e)}
     
-    def auto_backup(self, description=None):
+    # ---------- Háttér job-ok ----------
+    
+    def _job_path(self, job_id):
+        return os.path.join(self.jobs_dir, f'{job_id}.json')
+    
+    def _write_job(self, job):
+        path = self._job_path(job['job_id'])
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+    
+    def get_job(self, job_id):
+        """Backup job állapota, vagy None, ha nincs ilyen"""
+        try:
+            uuid.UUID(job_id)
+            with open(self._job_path(job_id), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def _prune_jobs(self):
+        """A JOB_RETENTION-nél régebbi állapotfájlok és félbemaradt (.part) mentések törlése"""
+        limit = (datetime.now() - self.JOB_RETENTION).timestamp()
+        paths = [os.path.join(self.jobs_dir, name) for name in os.listdir(self.jobs_dir)]
+        paths += [os.path.join(self.backup_dir, name) for name in os.listdir(self.backup_dir) if '.part' in name]
+        for path in paths:
+            try:
+                if os.path.getmtime(path) < limit:
+                    os.remove(path)
+            except OSError:
+                pass
+    
+    def start_backup(self, trigger='manual', description=None):
         """
-        Automatikus backup - throttled, hogy ne legyen túl sok.
-        Csak akkor fut, ha elég idő telt el az utolsó óta.
+        Backup indítása háttérszálon.
+        
+        Returns:
+            dict: a job kezdeti állapota (job_id-vel)
         """
-        now = datetime.now()
+        app = current_app._get_current_object()
+        self._prune_jobs()
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'status': 'running',
+            'trigger': trigger,
+            'description': description,
+            'started_at': datetime.now().isoformat(),
+            'pages_copied': 0,
+            'pages_total': None,
+        }
+        self._write_job(job)
+        
+        def progress(copied, total):
+            job.update(pages_copied=copied, pages_total=total)
+            self._write_job(job)
+        
+        def run():
+            from app import db
+            
+            with app.app_context():
+                try:
+                    result = self.create_backup(trigger=trigger, description=description, progress=progress)
+                except Exception as e:
+                    app.logger.exception('Backup hiba')
+                    result = {'error': str(e)}
+                finally:
+                    db.session.remove()
+            job.update(result, status='error' if 'error' in result else 'done',
+                       finished_at=datetime.now().isoformat())
+            self._write_job(job)
+            
+            # Megőrzési szabály a job lezárása után (a kliensnek nem kell rá várnia)
+            with app.app_context():
+                try:
+                    self.prune()
+                except Exception:
+                    app.logger.exception('Backup ritkítás hiba')
+                finally:
+                    db.session.remove()
         
-        if self._last_auto_backup:
-            elapsed = (now - self._last_auto_backup).total_seconds()
-            if elapsed < self.AUTO_BACKUP_INTERVAL:
-                return None  # Még nem telt el elég idő
+        threading.Thread(target=run, name='backup', daemon=True).start()
+        return dict(job)
+    
+    def _scan_backup_dir(self):
+        """
+        A backup könyvtár egyszeri bejárása.
         
-        self._last_auto_backup = now
-        return self.create_backup(trigger='auto', description=description)
+        Returns:
+            tuple: (a meglévő mentések fájlnevei, a régi teljes fájlos mentések összmérete)
+        """
+        available, legacy_bytes = set(), 0
+        for entry in os.scandir(self.backup_dir):
+            if entry.name.endswith(MANIFEST_SUFFIX):
+                available.add(entry.name[:-len(MANIFEST_SUFFIX)])
+            elif entry.name.endswith('.db') and entry.is_file():
+                available.add(entry.name)
+                legacy_bytes += entry.stat().st_size
+        return available, legacy_bytes
     
-    def list_backups(self):
-        """Összes backup listázása"""
+    def list_backups(self, limit=None, offset=0):
+        """Backup-ok listázása (legújabb elöl), opcionálisan lapozva"""
         from app.models import BackupLog
         
-        backups = BackupLog.query.order_by(BackupLog.created_at.desc()).all()
+        query = BackupLog.query.order_by(BackupLog.created_at.desc(), BackupLog.id.desc())
+        if offset:
+            query = query.offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
         
-        # Ellenőrizzük, hogy a fájlok léteznek-e
+        # A fájlok létezése egyetlen könyvtár bejárásból (nem soronkénti stat)
+        available, _ = self._scan_backup_dir()
         result = []
-        for backup in backups:
-            backup_path = os.path.join(self.backup_dir, backup.filename)
-            exists = os.path.exists(backup_path)
+        for backup in query:
+            exists = backup.filename in available
             
             data = backup.to_dict()
             data['exists'] = exists
@@ -122,50 +332,158 @@ class BackupManager:
         
         return result
     
-    def restore_backup(self, backup_id):
+    def restore_backup(self, backup_id, until=None):
         """
         Backup visszaállítása.
         Először készít egy mentést a jelenlegi állapotról!
         
         Args:
             backup_id: A visszaállítandó backup ID-ja
+            until: Opcionális UTC időpont: a mentés a változásnaplóból eddig görgetődik előre
             
         Returns:
             dict: Eredmény
         """
         from app.models import BackupLog
+        from app.journal import journal, JournalError
         from app import db
         
         backup = BackupLog.query.get(backup_id)
         if not backup:
             return {'error': 'Backup nem található'}
         
-        backup_path = os.path.join(self.backup_dir, backup.filename)
-        if not os.path.exists(backup_path):
+        if not self.backup_exists(backup.filename):
             return {'error': 'Backup fájl nem található'}
         
+        # A pre-restore mentés commitja és a session lezárása után a példány már nem olvasható
+        filename, created_at = backup.filename, backup.created_at
+        restore_path = None
         try:
+            # A blokkokból visszaépített fájl (ellenőrzőösszeggel) az élő adatbázis mellett,
+            # mielőtt bármihez nyúlnánk
+            restore_path = f'{self.db_path}.restore.{os.getpid()}'
+            if self.store.has_backup(filename):
+                self.store.materialize(filename, restore_path)
+            else:
+                shutil.copy2(self._legacy_path(filename), restore_path)
+            
+            # Előregörgetés a naplóból (még az élő adatbázis érintése előtt)
+            replayed = None
+            if until is not None:
+                try:
+                    replayed = journal.replay(restore_path, until)
+                except JournalError as e:
+                    return {'error': str(e)}
+            restored_seq = journal.snapshot_seq(restore_path)
+            
+            # Régebbi mentés sémája a csere ELŐTT frissül: a workerek egy pillanatig sem látnak régi sémát
+            self._migrate_file(restore_path)
+            
             # Először mentjük a jelenlegi állapotot
             self.create_backup(
                 trigger='auto', 
                 description=f'Automatikus mentés visszaállítás előtt (#{backup_id})'
             )
             
-            # Adatbázis kapcsolatok bezárása
             db.session.remove()
-            db.engine.dispose()
+            swap_ms = self._swap_database(restore_path)
             
-            # Fájl visszamásolása
-            shutil.copy2(backup_path, self.db_path)
+            # Minden worker memóriabeli indexe és cache-e újraépül
+            change_tracker.bump(None)
             
-            return {
+            # A visszaállított pont utáni napló szegmensek és mentések egy elhagyott idővonalhoz tartoznak
+            journal.branch(restored_seq or 0, filename)
+            
+            # A visszaállított napló nem ismeri a később készült mentéseket
+            self._sync_backup_log()
+            
+            result = {
                 'success': True,
-                'message': f'Sikeresen visszaállítva: {backup.filename}',
-                'restored_from': backup.created_at.isoformat()
+                'message': f'Sikeresen visszaállítva: {filename}',
+                'restored_from': created_at.isoformat(),
+                'swap_ms': swap_ms
             }
+            if replayed is not None:
+                result.update(restored_until=until.isoformat(), replayed_changes=replayed['applied'])
+            return result
             
         except Exception as e:
             return {'error': str(e)}
+        finally:
+            if restore_path and os.path.exists(restore_path):
+                os.remove(restore_path)
+    
+    def _migrate_file(self, path):
+        """Hiányzó táblák és a még nem alkalmazott migrációk egy (nem élő) adatbázis fájlon"""
+        from app import db
+        from app.migrations import run_migrations
+        
+        engine = create_engine(f'sqlite:///{path}', poolclass=NullPool)
+        try:
+            db.metadata.create_all(engine)
+            run_migrations(engine)
+        finally:
+            engine.dispose()
+    
+    def _swap_database(self, source_path):
+        """
+        Az élő adatbázis tartalmának cseréje a source_path fájléra, egyetlen
+        írási tranzakcióban (SQLite backup API az élő adatbázisba).
+        
+        A fájl nem cserélődik ki a workerek alól: minden kapcsolat (bármelyik
+        workerben) ugyanazt a fájlt használja tovább, az olvasók a commitig a
+        régi, utána az új tartalmat látják - félig cserélt állapotot soha. Az
+        írók a csere idejére várnak (busy_timeout), utána az új adatbázisra írnak.
+        
+        Returns:
+            float: a csere ideje (ms)
+        """
+        started = time.perf_counter()
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            source.backup(target)  # Egy lépés = egy tranzakció
+            target.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        finally:
+            target.close()
+            source.close()
+        return round((time.perf_counter() - started) * 1000, 1)
+    
+    def restore_to_time(self, until):
+        """
+        Pont-időpontra visszaállítás: a legutolsó, until előtt készült (naplós)
+        teljes mentés, előregörgetve a változásnaplóból until-ig.
+        
+        Args:
+            until: UTC időpont (datetime)
+        """
+        from app.journal import journal
+        
+        for log, seq in journal.snapshots():
+            if log.created_at and log.created_at <= until:
+                return self.restore_backup(log.id, until=until)
+        return {'error': 'Nincs a megadott időpont előtti, változásnaplóval rendelkező mentés'}
+    
+    def _sync_backup_log(self):
+        """A tárolóban meglévő, de a naplóból hiányzó mentések visszavétele (manifest adataiból)"""
+        from app.models import BackupLog
+        from app import db
+        
+        known = {filename for (filename,) in db.session.query(BackupLog.filename)}
+        for filename in self.store.list_backups():
+            if filename in known:
+                continue
+            manifest = self.store.load_manifest(filename)
+            metadata = manifest.get('metadata', {})
+            created_at = metadata.get('created_at')
+            db.session.add(BackupLog(
+                filename=filename,
+                file_size=manifest['size'],
+                trigger=metadata.get('trigger'),
+                description=metadata.get('description'),
+                created_at=datetime.fromisoformat(created_at) if created_at else None
+            ))
+        db.session.commit()
     
     def delete_backup(self, backup_id):
         """Backup törlése"""
@@ -176,10 +494,11 @@ class BackupManager:
         if not backup:
             return {'error': 'Backup nem található'}
         
-        backup_path = os.path.join(self.backup_dir, backup.filename)
+        backup_path = self._legacy_path(backup.filename)
         
         try:
-            # Fájl törlése
+            # Manifest törlése (a már sehol nem hivatkozott blokkokkal), vagy a régi fájl
+            self.store.delete(backup.filename)
             if os.path.exists(backup_path):
                 os.remove(backup_path)
             
@@ -192,28 +511,147 @@ class BackupManager:
         except Exception as e:
             return {'error': str(e)}
     
-    def _cleanup_old_backups(self):
-        """Régi backup-ok törlése, ha túl sok van"""
+    def referenced_uploads(self):
+        """
+        A meglévő mentések által hivatkozott feltöltött fájlnevek.
+        A lista nélküli (régebbi) manifesteknél a mentés visszaépítéséből
+        számoljuk, és a manifestbe írjuk; a régi teljes fájlokat közvetlenül olvassuk.
+        
+        Returns:
+            set: fájlnevek (static/uploads alatt)
+        """
+        from app.upload_store import database_references
+        
+        names = set()
+        for filename in self.store.list_backups():
+            try:
+                uploads = self.store.load_manifest(filename).get('metadata', {}).get('uploads')
+                if uploads is None:
+                    fd, scan_path = tempfile.mkstemp(prefix='.uploads-', suffix='.tmp', dir=self.backup_dir)
+                    os.close(fd)
+                    try:
+                        self.store.materialize(filename, scan_path)
+                        uploads = database_references(scan_path)
+                    finally:
+                        os.remove(scan_path)
+                    self.store.update_metadata(filename, uploads=uploads)
+            except ChunkStoreError:
+                # Közben törölt (ritkított) mentés kimaradhat; egy sérült nem:
+                # a hívó (takarítás) ilyenkor inkább nem töröl semmit
+                if self.store.has_backup(filename):
+                    raise
+                continue
+            names.update(uploads)
+        
+        available, _ = self._scan_backup_dir()
+        for filename in available:
+            legacy_path = self._legacy_path(filename)
+            if not self.store.has_backup(filename) and os.path.isfile(legacy_path):
+                names.update(database_references(legacy_path))
+        return names
+    
+    # ---------- Megőrzési szabály ----------
+    
+    @staticmethod
+    def _period(tier, created_at):
+        """A mentés időszaka az adott szinten (óra, nap, ISO hét, hónap)"""
+        if tier == 'hourly':
+            return created_at.strftime('%Y-%m-%d %H')
+        if tier == 'daily':
+            return created_at.date()
+        if tier == 'weekly':
+            return created_at.isocalendar()[:2]
+        return created_at.year, created_at.month
+    
+    def retained_backups(self, backups, now=None):
+        """
+        A megőrzési szabály szerint megtartandó mentések.
+        
+        Args:
+            backups: (id, created_at) párok, legújabb elöl
+            now: viszonyítási időpont (UTC)
+            
+        Returns:
+            dict: id -> a megtartás oka ('recent', 'hourly', 'daily', 'weekly', 'monthly')
+        """
+        now = now or datetime.utcnow()
+        keep = {}
+        for backup_id, created_at in backups:
+            if created_at is None or now - created_at < self.RETENTION_KEEP_ALL:
+                keep[backup_id] = 'recent'
+        
+        for tier, count in self.RETENTION.items():
+            periods = set()
+            for backup_id, created_at in backups:
+                if created_at is None:
+                    continue
+                period = self._period(tier, created_at)
+                if period in periods:
+                    continue
+                if len(periods) >= count:
+                    break
+                periods.add(period)
+                keep.setdefault(backup_id, tier)
+        return keep
+    
+    def prune(self):
+        """
+        A megőrzési szabályon kívül eső mentések törlése (háttérben futtatandó).
+        Egyszerre csak egy folyamat ritkít; ha más már fut, kihagyjuk.
+        
+        Returns:
+            dict: törölt és megmaradt mentések száma, vagy None, ha más folyamat ritkít
+        """
         from app.models import BackupLog
         from app import db
         
-        count = BackupLog.query.count()
+        lock_file = None
+        if fcntl:
+            lock_file = open(os.path.join(self.backup_dir, '.prune.lock'), 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return None
         
-        if count > self.MAX_BACKUPS:
-            # A legrégebbi backup-ok törlése
-            old_backups = BackupLog.query.order_by(
-                BackupLog.created_at.asc()
-            ).limit(count - self.MAX_BACKUPS).all()
+        try:
+            backups = db.session.execute(
+                select(BackupLog.id, BackupLog.filename, BackupLog.created_at)
+                .order_by(BackupLog.created_at.desc(), BackupLog.id.desc())
+            ).all()
+            keep = self.retained_backups([(b.id, b.created_at) for b in backups])
+            expired = [b for b in backups if b.id not in keep]
+            
+            # Előbb a tárolt adatok (egy index tranzakcióban), utána a napló sorok
+            self.store.delete_many([b.filename for b in expired])
+            for backup in expired:
+                legacy_path = self._legacy_path(backup.filename)
+                if os.path.exists(legacy_path):
+                    os.remove(legacy_path)
+            ids = [b.id for b in expired]
+            for start in range(0, len(ids), 500):
+                db.session.execute(delete(BackupLog).where(BackupLog.id.in_(ids[start:start + 500])))
+            db.session.commit()
             
-            for backup in old_backups:
-                self.delete_backup(backup.id)
+            return {'deleted': len(expired), 'kept': len(keep)}
+        finally:
+            if lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
     
     def get_backup_stats(self):
-        """Backup statisztikák"""
+        """Backup statisztikák (SQL aggregátumokkal, egy könyvtár bejárással)"""
         from app.models import BackupLog
+        from app import db
+        
+        total, total_size = db.session.execute(
+            select(func.count(BackupLog.id), func.coalesce(func.sum(BackupLog.file_size), 0))
+        ).one()
         
-        total = BackupLog.query.count()
-        total_size = sum([b.file_size or 0 for b in BackupLog.query.all()])
+        # Tényleges lemezfoglalás: blokkok + manifestek + régi teljes fájlok
+        store_stats = self.store.stats()
+        _, legacy_bytes = self._scan_backup_dir()
+        disk_size = store_stats['stored_bytes'] + legacy_bytes
         
         last_backup = BackupLog.query.order_by(
             BackupLog.created_at.desc()
@@ -221,36 +659,14 @@ class BackupManager:
         
         return {
             'total_backups': total,
-            'total_size_mb': round(total_size / (1024 * 1024), 2),
-            'max_backups': self.MAX_BACKUPS,
+            'total_size_mb': round(total_size / (1024 * 1024), 2),  # Logikai méret (visszaállítva)
+            'disk_size_mb': round(disk_size / (1024 * 1024), 2),
+            'dedup_ratio': round(total_size / disk_size, 2) if disk_size else None,
+            'chunk_count': store_stats['chunk_count'],
+            'retention': self.RETENTION,
             'last_backup': last_backup.to_dict() if last_backup else None
         }
 
-
 # Singleton instance
 backup_manager = BackupManager()
 
-
-def auto_backup_on_change(description=None):
-    """
-    Dekorátor, ami automatikus backup-ot készít adatmódosító műveletek után.
-    
-    Használat:
-        @auto_backup_on_change("Személy módosítva")
-        def update_person(...):
-            ...
-    """
-    def decorator(f):
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            result = f(*args, **kwargs)
-            # Csak sikeres művelet után
-            if result and not isinstance(result, tuple):
-                backup_manager.auto_backup(description)
-            elif isinstance(result, tuple) and len(result) >= 2:
-                response, status_code = result[0], result[1]
-                if 200 <= status_code < 300:
-                    backup_manager.auto_backup(description)
-            return result
-        return decorated_function
-    return decorator
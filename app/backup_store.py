@@ -0,0 +1,270 @@
+"""
+Deduplikált, tömörített backup tároló (tartalom-címzett blokkok).
+
+Egy mentés nem teljes fájlmásolat, hanem egy manifest: az adatbázis fájl
+CHUNK_SIZE méretű (az SQLite lapmérettel osztható) blokkjainak SHA-256
+hash-ei sorrendben. A blokkok zlib-bel tömörítve, a hash alapján
+tárolódnak (chunks/ab/abcdef...), így az egymást követő mentések
+változatlan blokkjai egyszer foglalnak helyet.
+
+A blokkok hivatkozásszámlálója egy külön kis SQLite adatbázisban van
+(chunks/index.db) - nem a fő adatbázisban, hogy egy visszaállítás ne írja
+felül. Mentés törlésekor a 0-ra csökkenő blokkok törlődnek.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import zlib
+from collections import Counter
+
+
+MANIFEST_VERSION = 1
+CHUNK_SIZE = 64 * 1024  # 16 db 4 KB-os SQLite lap
+COMPRESSION_LEVEL = 6
+MANIFEST_SUFFIX = '.manifest'
+
+
+class ChunkStoreError(Exception):
+    """Sérült vagy hiányzó backup blokk / manifest"""
+
+
+class ChunkStore:
+    """Blokk tároló egy backup könyvtárban"""
+
+    def __init__(self, backup_dir):
+        self.backup_dir = backup_dir
+        self.chunks_dir = os.path.join(backup_dir, 'chunks')
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        self._index_path = os.path.join(self.chunks_dir, 'index.db')
+        with self._connect() as index:
+            index.conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    hash TEXT PRIMARY KEY,
+                    refcount INTEGER NOT NULL,
+                    stored_size INTEGER NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        conn = sqlite3.connect(self._index_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode = WAL')
+        return _Index(conn)
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def manifest_path(self, filename):
+        return os.path.join(self.backup_dir, filename + MANIFEST_SUFFIX)
+
+    def has_backup(self, filename):
+        return os.path.exists(self.manifest_path(filename))
+
+    # ---------- Írás ----------
+
+    def _read_chunks(self, path):
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    return
+                yield hashlib.sha256(data).hexdigest(), data
+
+    def _write_chunk(self, digest, data):
+        path = self._chunk_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(data, COMPRESSION_LEVEL)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+        return len(compressed)
+
+    def store(self, source_path, filename, metadata=None):
+        """
+        Egy (kész, ellenőrzött) adatbázis fájl mentése blokkokként.
+        metadata: a manifestbe írt adatok (trigger, leírás, időpont)
+
+        Returns:
+            dict: a manifest (méret, új blokkok száma és tárolt mérete is)
+        """
+        digests = []
+        whole = hashlib.sha256()
+        new_chunks = new_bytes = 0
+        with self._connect() as index:
+            # Írási zár a teljes mentésre: egy párhuzamos törlés nem szedheti
+            # ki alólunk a már meglévőnek látott blokkokat
+            index.begin()
+            known = set()
+            for digest, data in self._read_chunks(source_path):
+                whole.update(data)
+                digests.append(digest)
+                if digest in known:
+                    continue
+                known.add(digest)
+                if not index.exists(digest) or not os.path.exists(self._chunk_path(digest)):
+                    stored_size = self._write_chunk(digest, data)
+                    index.add(digest, stored_size)
+                    new_chunks += 1
+                    new_bytes += stored_size
+            index.retain(known)
+            index.commit()
+
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'filename': filename,
+            'chunk_size': CHUNK_SIZE,
+            'size': os.path.getsize(source_path),
+            'sha256': whole.hexdigest(),
+            'chunks': digests,
+            'new_chunks': new_chunks,
+            'new_bytes': new_bytes,
+            'metadata': metadata or {},
+        }
+        self._write_manifest(filename, manifest)
+        return manifest
+
+    def _write_manifest(self, filename, manifest):
+        path = self.manifest_path(filename)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(path + '.tmp', path)
+
+    def update_metadata(self, filename, **values):
+        """A manifest metadata mezőinek módosítása (a blokkok változatlanok)"""
+        manifest = self.load_manifest(filename)
+        manifest.setdefault('metadata', {}).update(values)
+        self._write_manifest(filename, manifest)
+
+    # ---------- Olvasás ----------
+
+    def list_backups(self):
+        """A manifesttel rendelkező mentések fájlnevei"""
+        return sorted(name[:-len(MANIFEST_SUFFIX)] for name in os.listdir(self.backup_dir)
+                      if name.endswith(MANIFEST_SUFFIX))
+
+    def load_manifest(self, filename):
+        try:
+            with open(self.manifest_path(filename), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise ChunkStoreError(f'A manifest nem olvasható: {filename}') from e
+
+    def materialize(self, filename, target_path):
+        """A mentés visszaépítése egy teljes adatbázis fájllá (hash ellenőrzéssel)"""
+        manifest = self.load_manifest(filename)
+        whole = hashlib.sha256()
+        with open(target_path, 'wb') as out:
+            for digest in manifest['chunks']:
+                try:
+                    with open(self._chunk_path(digest), 'rb') as f:
+                        data = zlib.decompress(f.read())
+                except (OSError, zlib.error) as e:
+                    raise ChunkStoreError(f'Hiányzó vagy sérült blokk: {digest}') from e
+                if hashlib.sha256(data).hexdigest() != digest:
+                    raise ChunkStoreError(f'Sérült blokk: {digest}')
+                whole.update(data)
+                out.write(data)
+        if whole.hexdigest() != manifest['sha256']:
+            raise ChunkStoreError(f'A visszaépített fájl ellenőrzőösszege eltér: {filename}')
+        return target_path
+
+    # ---------- Törlés ----------
+
+    def delete(self, filename):
+        """A manifest törlése; a már nem hivatkozott blokkok is törlődnek"""
+        return self.delete_many([filename])
+
+    def delete_many(self, filenames):
+        """
+        Több manifest törlése egyetlen index tranzakcióban.
+
+        Returns:
+            int: a törölt (már nem hivatkozott) blokkok száma
+        """
+        released = Counter()
+        manifests = []
+        for filename in filenames:
+            try:
+                released.update(set(self.load_manifest(filename)['chunks']))
+            except ChunkStoreError:
+                continue
+            manifests.append(filename)
+        if not manifests:
+            return 0
+
+        with self._connect() as index:
+            index.begin()
+            orphans = index.release(released)
+            # A blokk fájlok még az írási zár alatt törlődnek: a zár elengedése
+            # után egy párhuzamos store() hiányzónak látná és újraírná őket
+            for digest in orphans:
+                try:
+                    os.remove(self._chunk_path(digest))
+                except OSError:
+                    pass
+            index.commit()
+        for filename in manifests:
+            os.remove(self.manifest_path(filename))
+        return len(orphans)
+
+    # ---------- Statisztika ----------
+
+    def stats(self):
+        """Tárolt blokkok száma és a tényleges lemezfoglalás (blokkok + manifestek)"""
+        with self._connect() as index:
+            chunk_count, chunk_bytes = index.totals()
+        manifest_bytes = sum(
+            entry.stat().st_size for entry in os.scandir(self.backup_dir) if entry.name.endswith(MANIFEST_SUFFIX)
+        )
+        return {'chunk_count': chunk_count, 'stored_bytes': chunk_bytes + manifest_bytes}
+
+
+class _Index:
+    """A blokk hivatkozásszámláló tábla műveletei egy kapcsolaton"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.conn.in_transaction:
+            self.conn.execute('ROLLBACK')
+        self.conn.close()
+
+    def begin(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        self.conn.execute('COMMIT')
+
+    def exists(self, digest):
+        return self.conn.execute('SELECT 1 FROM chunks WHERE hash = ?', (digest,)).fetchone() is not None
+
+    def add(self, digest, stored_size):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO chunks (hash, refcount, stored_size) '
+            'VALUES (?, COALESCE((SELECT refcount FROM chunks WHERE hash = ?), 0), ?)',
+            (digest, digest, stored_size)
+        )
+
+    def retain(self, digests):
+        self.conn.executemany(
+            'UPDATE chunks SET refcount = refcount + 1 WHERE hash = ?', [(d,) for d in digests]
+        )
+
+    def release(self, counts):
+        """Hivatkozások csökkentése (hash -> darab); a 0-ra esett blokkok hash-ei"""
+        self.conn.executemany(
+            'UPDATE chunks SET refcount = refcount - ? WHERE hash = ?', [(n, d) for d, n in counts.items()]
+        )
+        orphans = [row[0] for row in self.conn.execute('SELECT hash FROM chunks WHERE refcount <= 0')]
+        self.conn.execute('DELETE FROM chunks WHERE refcount <= 0')
+        return orphans
+
+    def totals(self):
+        count, size = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(stored_size), 0) FROM chunks').fetchone()
+        return count, size
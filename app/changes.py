@@ -0,0 +1,191 @@
+"""
+Adatváltozás-követés a családfa adatbázishoz.
+
+Minden sikeres commit után, amely családfa-adatot módosított, növeljük a
+közös adatverziót (egy kis fájl a data mappában), így a gunicorn workerek
+mindegyike észreveszi, ha egy másik worker írt az adatbázisba.
+A memóriabeli indexek és cache-ek feliratkoznak a változásokra, és
+inkrementálisan frissülnek vagy érvénytelenítik magukat.
+"""
+
+import os
+import threading
+
+from sqlalchemy import event, inspect as sa_inspect
+
+try:
+    import fcntl
+except ImportError:  # Windows fejlesztői környezet
+    fcntl = None
+
+
+# Ezeknek a tábláknak a módosítása NEM számít adatváltozásnak
+UNTRACKED_TABLES = {'app_settings', 'backup_logs', 'duplicate_candidates', 'change_journal'}
+
+
+class ChangeTracker:
+    """Commit-szintű változáskövető, folyamatok között megosztott verziószámmal"""
+
+    def __init__(self):
+        self.version_path = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._registered = False
+
+    def init_app(self, app, session):
+        data_dir = app.config['DATA_DIR']
+        self.version_path = os.path.join(data_dir, '.data_version')
+
+        if self._registered:
+            return
+        self._registered = True
+        event.listen(session, 'after_flush', self._after_flush)
+        event.listen(session, 'do_orm_execute', self._do_orm_execute)
+        event.listen(session, 'after_commit', self._after_commit)
+        event.listen(session, 'after_rollback', self._after_rollback)
+
+    def subscribe(self, listener):
+        """
+        Feliratkozás a változásokra.
+
+        A listener hívása: listener(old_version, new_version, changes), ahol
+        changes a (tábla, id, értékek) hármasok listája, vagy None, ha a
+        változás nem követhető soronként (bulk művelet) - ilyenkor teljes
+        újraépítés szükséges.
+        """
+        self._listeners.append(listener)
+
+    # ---------- Verziószám ----------
+
+    @property
+    def version(self):
+        """Az aktuális adatverzió (olcsó: egy kis fájl beolvasása)"""
+        try:
+            with open(self.version_path, 'r') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError, TypeError):
+            return 0
+
+    def bump(self, changes=None):
+        """
+        Adatverzió növelése és a feliratkozók értesítése.
+        Bulk műveletek után (pl. import) changes=None-nal kell hívni.
+        """
+        with self._lock:
+            lock_file = None
+            try:
+                if fcntl and self.version_path:
+                    lock_file = open(self.version_path + '.lock', 'a')
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+                old_version = self.version
+                new_version = old_version + 1
+                if self.version_path:
+                    tmp_path = f'{self.version_path}.{os.getpid()}.tmp'
+                    with open(tmp_path, 'w') as f:
+                        f.write(str(new_version))
+                    os.replace(tmp_path, self.version_path)
+
+                # A feliratkozók a zár alatt frissülnek, így a verziószám
+                # és az inkrementális módosítás sorrendje konzisztens marad
+                for listener in self._listeners:
+                    listener(old_version, new_version, changes)
+            finally:
+                if lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+
+        return new_version
+
+    # ---------- Session események ----------
+
+    @staticmethod
+    def _pending(session):
+        return session.info.setdefault('pending_changes', [])
+
+    def _after_flush(self, session, flush_context):
+        pending = self._pending(session)
+
+        for obj in session.new:
+            self._record(pending, obj, deleted=False)
+        for obj in session.dirty:
+            if session.is_modified(obj, include_collections=False):
+                self._record(pending, obj, deleted=False)
+        for obj in session.deleted:
+            self._record(pending, obj, deleted=True)
+
+    def _record(self, pending, obj, deleted):
+        table = getattr(obj, '__tablename__', None)
+        if not table or table in UNTRACKED_TABLES:
+            return
+
+        # Az oszlopértékeket most rögzítjük: commit után az objektumok lejárnak
+        state = sa_inspect(obj)
+        values = None
+        if not deleted:
+            # Csak a betöltött attribútumok: a hiányzó kulcs "ismeretlen", nem NULL
+            values = {
+                attr.key: state.dict[attr.key]
+                for attr in state.mapper.column_attrs
+                if attr.key in state.dict
+            }
+        entity_id = state.identity[0] if state.identity else (values or {}).get('id')
+        pending.append((table, entity_id, values))
+
+    def _do_orm_execute(self, orm_execute_state):
+        # Query.delete() / update() / insert(): soronként nem követhető
+        if orm_execute_state.is_delete or orm_execute_state.is_update or orm_execute_state.is_insert:
+            tables = {
+                mapper.local_table.name
+                for mapper in orm_execute_state.all_mappers
+            } if orm_execute_state.all_mappers else set()
+            if not tables or tables - UNTRACKED_TABLES:
+                orm_execute_state.session.info['bulk_change'] = True
+
+    def _after_commit(self, session):
+        pending = session.info.pop('pending_changes', None)
+        bulk = session.info.pop('bulk_change', False)
+
+        if bulk:
+            self.bump(None)
+        elif pending:
+            self.bump(pending)
+
+    def _after_rollback(self, session):
+        session.info.pop('pending_changes', None)
+        session.info.pop('bulk_change', None)
+
+
+class VersionedCache:
+    """
+    Egyetlen kiszámított érték folyamatszintű cache-e az adatverzióhoz kötve.
+    Bármelyik worker írása növeli a verziót, így a következő get() újraszámol.
+    """
+
+    def __init__(self, compute):
+        self._compute = compute
+        self._lock = threading.Lock()
+        self._version = None
+        self._value = None
+
+    def get(self):
+        # A verziót a számítás ELŐTT olvassuk: egy közben történt írás a
+        # következő hívásnál újraszámolást vált ki
+        version = change_tracker.version
+        if self._version == version and self._value is not None:
+            return self._value
+
+        with self._lock:
+            if self._version != version or self._value is None:
+                self._value = self._compute()
+                self._version = version
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+            self._value = None
+
+
+# Singleton instance
+change_tracker = ChangeTracker()
@@ -0,0 +1,177 @@
+"""
+Karbantartási CLI parancsok.
+
+Használat: flask --app run <parancs>
+"""
+
+import sqlite3
+
+import click
+from sqlalchemy import select, text
+
+from app import db
+
+
+# A fő lekérdezések, amelyek a migrációs indexekre támaszkodnak
+EXPLAIN_QUERIES = [
+    ('Család gyerekei', 'SELECT id FROM persons WHERE parent_family_id = 1 AND deleted_at IS NULL'),
+    ('Partneri családok', 'SELECT id FROM marriages WHERE person1_id = 1 OR person2_id = 1'),
+    ('Személy eseményei', 'SELECT * FROM events WHERE person_id = 1 AND deleted_at IS NULL'),
+    ('Személy dokumentumai', 'SELECT * FROM documents WHERE person_id = 1 AND deleted_at IS NULL'),
+    ('Mentett pozíciók', 'SELECT * FROM node_positions WHERE root_person_id = 1'),
+    ('Lomtár keresés', "SELECT id FROM deleted_records WHERE entity_type = 'person' AND entity_id = 1"),
+]
+
+
+def _print_plans(conn, title):
+    from app.lineage import _ANCESTORS_SQL, _DESCENDANTS_SQL
+
+    click.echo(f'\n===== {title} =====')
+    queries = EXPLAIN_QUERIES + [
+        ('Felmenők (rekurzív)', str(_ANCESTORS_SQL)),
+        ('Leszármazottak (rekurzív)', str(_DESCENDANTS_SQL)),
+    ]
+    for label, sql in queries:
+        params = {'root_id': 1, 'max_depth': 10} if ':root_id' in sql else {}
+        click.echo(f'\n-- {label}')
+        for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall():
+            click.echo(f'   {row[3]}')
+
+
+def register_commands(app):
+    """CLI parancsok regisztrálása"""
+
+    @app.cli.command('explain-queries')
+    @click.option('--before/--no-before', default=True,
+                  help='A terv megjelenítése az idegen kulcs indexek nélkül is (visszagörgetett tranzakcióban).')
+    def explain_queries(before):
+        """EXPLAIN QUERY PLAN a fő lekérdezésekre, indexekkel és nélkülük"""
+        from app.migrations import FOREIGN_KEY_INDEXES
+
+        conn = sqlite3.connect(db.engine.url.database, isolation_level=None)
+        try:
+            if before:
+                # Az indexek eldobása csak egy tranzakción belül, amit visszagörgetünk
+                conn.execute('BEGIN')
+                for table, column in FOREIGN_KEY_INDEXES:
+                    conn.execute(f'DROP INDEX IF EXISTS ix_{table}_{column}')
+                _print_plans(conn, 'ELŐTTE (idegen kulcs indexek nélkül)')
+                conn.execute('ROLLBACK')
+
+            _print_plans(conn, 'UTÁNA (jelenlegi séma)')
+        finally:
+            conn.close()
+
+    @app.cli.command('rebuild-search-index')
+    @click.option('--optimize/--no-optimize', default=True, help='Az index szegmenseinek összevonása utána.')
+    def rebuild_search_index(optimize):
+        """Az FTS5 személykereső index (újra)építése a persons táblából"""
+        from app.search import FTS_TABLE, create_search_index, optimize_search_index
+
+        with db.engine.begin() as conn:
+            if not create_search_index(conn):
+                raise click.ClickException('Az SQLite nem támogatja az FTS5-öt')
+            if optimize:
+                optimize_search_index(conn)
+            count = conn.execute(text(f'SELECT COUNT(*) FROM {FTS_TABLE}_docsize')).scalar()
+
+        click.echo(f'Keresőindex újraépítve: {count} személy')
+
+    @app.cli.command('find-duplicates')
+    @click.option('--threshold', default=None, type=float, help='Minimális pontszám (0-1).')
+    @click.option('--workers', default=None, type=int, help='Pontozó folyamatok száma (alapból CPU szám).')
+    def find_duplicates(threshold, workers):
+        """Duplikált személyek keresése (ugyanaz, mint a /api/duplicates/scan)"""
+        from app.duplicates import DEFAULT_THRESHOLD, find_duplicates as run
+
+        result = run(threshold or DEFAULT_THRESHOLD, max_workers=workers)
+        click.echo(
+            f"Személyek: {result['persons']}, blokkok: {result['blocks']}, "
+            f"összehasonlítások: {result['comparisons']}, párok: {result['pairs']}, "
+            f"idő: {result['duration_ms']} ms"
+        )
+
+    @app.cli.command('import-gedcom')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    def import_gedcom(path):
+        """GEDCOM fájl importálása a meglévő fába (egy tranzakcióban)"""
+        import os
+
+        from app.gedcom_import import import_gedcom as run
+
+        with click.progressbar(length=os.path.getsize(path), label='GEDCOM import') as bar:
+            def progress(stats):
+                bar.update(stats['bytes_read'] - bar.pos)
+
+            result = run(path, progress)
+
+        click.echo(
+            f"Személyek: {result['persons']}, családok: {result['families']}, "
+            f"események: {result['events']}, kihagyott rekordok: {result['skipped_records']}, "
+            f"idő: {result['duration_ms']} ms"
+        )
+
+    @app.cli.command('generate-thumbnails')
+    @click.option('--force', is_flag=True, help='A naprakész bélyegképek újragenerálása is.')
+    @click.option('--workers', default=None, type=int, help='Képfeldolgozó folyamatok száma (alapból CPU szám).')
+    def generate_thumbnails(force, workers):
+        """Bélyegképek utólagos generálása a meglévő profilképekhez (static/uploads)"""
+        from flask import current_app
+
+        from app.models import Person
+        from app.thumbnails import ThumbnailError, backfill
+
+        photo_paths = db.session.execute(
+            select(Person.photo_path).where(Person.photo_path.is_not(None))
+        ).scalars().all()
+        try:
+            result = backfill(photo_paths, current_app.config['UPLOAD_FOLDER'], force=force, max_workers=workers)
+        except ThumbnailError as e:
+            raise click.ClickException(str(e))
+
+        for error in result['failed']:
+            click.echo(f'Hiba: {error}', err=True)
+        click.echo(
+            f"Fotók: {result['photos']}, elkészült: {result['generated']}, "
+            f"naprakész: {result['skipped']}, hiányzó fájl: {result['missing']}, "
+            f"hibás: {len(result['failed'])}, idő: {result['duration_ms']} ms"
+        )
+
+    @app.cli.command('migrate-uploads')
+    def migrate_uploads():
+        """A név szerint tárolt feltöltések átalakítása tartalom-címzett (deduplikált) blobokká"""
+        from flask import current_app
+
+        from app.models import Person
+        from app.thumbnails import backfill, is_available
+        from app.upload_store import migrate_legacy
+
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        result = migrate_legacy(upload_folder)
+        click.echo(
+            f"Átalakított hivatkozások: {result['converted']}, új blobok: {result['blobs']}, "
+            f"hiányzó fájlok: {result['missing']}, törölt régi fájlok: {result['removed_files']}"
+        )
+
+        # A blob nevű profilképek bélyegképei
+        if is_available():
+            photo_paths = db.session.execute(
+                select(Person.photo_path).where(Person.photo_path.is_not(None))
+            ).scalars().all()
+            thumbs = backfill(photo_paths, upload_folder)
+            click.echo(f"Bélyegképek: {thumbs['generated']} elkészült")
+
+    @app.cli.command('collect-uploads')
+    @click.option('--grace', default=600, type=int, help='Ennél frissebb (másodperc) blobok nem törlődnek.')
+    def collect_uploads(grace):
+        """Nem hivatkozott feltöltött fájlok törlése (ugyanaz, mint a háttér takarítás)"""
+        from flask import current_app
+
+        from app.upload_store import collect_garbage
+
+        result = collect_garbage(current_app.config['UPLOAD_FOLDER'], grace)
+        click.echo(
+            f"Elavult hivatkozások: {result['stale_refs']}, törölt fájlok: {result['removed_blobs']}, "
+            f"felszabadult: {result['freed_bytes'] / 1024 / 1024:.1f} MB, "
+            f"türelmi időn belül: {result['deferred_blobs']}"
+        )
@@ -0,0 +1,425 @@
+"""
+Duplikált személyek keresése (több rokon importjából összefésült fák).
+
+1. Blokkolás: a személyek csak a saját blokkjukon belül hasonlítódnak össze.
+   A blokk kulcs: (fonetikus vezetéknév kód, keresztnév kezdőhang, születési
+   évtized). A szomszédos évtizedek is összevetésre kerülnek (1899 vs 1901),
+   a születési év nélküliek pedig az azonos nevű blokkok mindegyikével.
+   Leánykori névvel rögzített személy a leánykori nevén is bekerül.
+2. Pontozás: trigram névhasonlóság (ékezet nélkül, így "Nagy Jánosné" =
+   "Nagy Janosne"), születési/halálozási dátum, születési hely és közös szülő.
+   A blokkpárok pontozása ProcessPoolExecutor-ban, párhuzamosan fut.
+3. Az eredmény a duplicate_candidates táblába kerül; az elvetett
+   (dismissed) párokat az újrafuttatás megtartja és nem hozza újra.
+
+A futás állapota az app_settings 'duplicate_scan' kulcsában (JSON) van,
+így minden gunicorn worker látja.
+"""
+
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, select
+
+from app import db
+from app.suggest import normalize
+
+try:
+    import fcntl
+except ImportError:  # Windows fejlesztői környezet: egy folyamat, a szál elég
+    fcntl = None
+
+
+JOB_SETTING_KEY = 'duplicate_scan'
+LOCK_FILENAME = '.duplicate_scan.lock'
+DEFAULT_THRESHOLD = 0.75
+NAME_MIN_SIMILARITY = 0.5
+MAX_BIRTH_YEAR_DIFF = 10
+STALE_JOB_AFTER = timedelta(hours=1)
+
+# Ennyi összehasonlítás alatt nem éri meg folyamatokat indítani
+PARALLEL_MIN_COMPARISONS = 20000
+TASK_COMPARISONS = 50000
+
+# A keresés háttérszálból indul egy többszálú (mentés, takarítás) folyamatban:
+# fork-kal a gyerek a fork pillanatában fogott zárakon holtpontra juthat
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# Részpontszámok súlyai
+WEIGHTS = {
+    'name': 0.5,
+    'birth': 0.25,
+    'death': 0.1,
+    'place': 0.1,
+    'parents': 0.15,
+}
+
+# Magyar (és régies/németes) írásmódok egységesítése, a sorrend számít
+_PHONETIC_RULES = [
+    ('ch', 'c'), ('cz', 'c'), ('cs', 'c'), ('tz', 'c'), ('ts', 'c'),
+    ('sz', 's'), ('zs', 'z'), ('gy', 'd'), ('dj', 'd'), ('ly', 'j'), ('ny', 'n'), ('ty', 't'),
+    ('th', 't'), ('ph', 'f'), ('ck', 'k'), ('w', 'v'), ('x', 'ks'), ('q', 'k'), ('y', 'i'),
+]
+_VOWELS = set('aeiou')
+_NON_LETTER_RE = re.compile(r'[^a-z]')
+
+
+def phonetic_code(name, length=6):
+    """
+    Egyszerűsített fonetikus kód: ékezet nélkül, a magyar kettős betűk
+    egységesítve, az első betű után csak a mássalhangzók, ismétlés nélkül.
+    Kovács / Kováts / Kovach -> 'kvc', Szabó / Szabo -> 'sb'.
+    """
+    value = _NON_LETTER_RE.sub('', normalize(name or ''))
+    if not value:
+        return ''
+    for source, target in _PHONETIC_RULES:
+        value = value.replace(source, target)
+
+    code = [value[0]]
+    for ch in value[1:]:
+        if ch in _VOWELS or ch == code[-1]:
+            continue
+        code.append(ch)
+    return ''.join(code)[:length]
+
+
+def _trigrams(value):
+    padded = f'  {value} '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def trigram_similarity(a, b):
+    """Jaccard hasonlóság két trigram halmazon"""
+    if not a or not b:
+        return 0.0
+    common = len(a & b)
+    return common / (len(a) + len(b) - common)
+
+
+# ==================== PONTOZÁS (a munkafolyamatokban fut) ====================
+
+# Rekord mezők (tuple, hogy olcsó legyen a folyamatok közti átadás)
+_ID, _GENDER, _NAME, _BIRTH, _DEATH, _PLACE, _PARENTS = range(7)
+
+
+def _date_score(a, b):
+    """Dátum egyezés: (év, ordinális nap) párokon; None ha valamelyik hiányzik"""
+    if a is None or b is None:
+        return None
+    (year_a, day_a), (year_b, day_b) = a, b
+    if day_a is not None and day_a == day_b:
+        return 1.0
+    diff = abs(year_a - year_b)
+    if diff == 0:
+        return 0.8
+    if diff <= 1:
+        return 0.6
+    if diff <= 3:
+        return 0.3
+    return 0.0
+
+
+def score_pair(a, b, trigrams):
+    """
+    Egy személypár pontszáma.
+
+    Returns:
+        tuple | None: (pontszám, részpontszámok), vagy None ha biztosan nem azonos
+    """
+    if a[_GENDER] and b[_GENDER] and a[_GENDER] != b[_GENDER]:
+        return None
+    if a[_BIRTH] and b[_BIRTH] and abs(a[_BIRTH][0] - b[_BIRTH][0]) > MAX_BIRTH_YEAR_DIFF:
+        return None
+
+    # Névváltozatok (házassági és leánykori vezetéknévvel) közül a legjobb egyezés
+    name = max(
+        trigram_similarity(grams_a, grams_b)
+        for grams_a in trigrams(a) for grams_b in trigrams(b)
+    )
+    if name < NAME_MIN_SIMILARITY:
+        return None
+
+    parts = {'name': name}
+    birth = _date_score(a[_BIRTH], b[_BIRTH])
+    if birth is not None:
+        parts['birth'] = birth
+    death = _date_score(a[_DEATH], b[_DEATH])
+    if death is not None:
+        parts['death'] = death
+    if a[_PLACE] and b[_PLACE]:
+        parts['place'] = trigram_similarity(_trigrams(a[_PLACE]), _trigrams(b[_PLACE]))
+    if a[_PARENTS] and b[_PARENTS]:
+        parts['parents'] = 1.0 if set(a[_PARENTS]) & set(b[_PARENTS]) else 0.0
+
+    total_weight = sum(WEIGHTS[key] for key in parts)
+    score = sum(WEIGHTS[key] * value for key, value in parts.items()) / total_weight
+    if len(parts) == 1:
+        score *= 0.7  # Csak névegyezés nem elég bizonyíték
+
+    return score, {key: round(value, 2) for key, value in parts.items()}
+
+
+def score_blocks(tasks, threshold):
+    """
+    Blokk-feladatok pontozása. Egy feladat (bal, jobb) rekordlista pár;
+    jobb=None esetén a blokkon belüli párok.
+
+    Returns:
+        list: [(kisebb_id, nagyobb_id, pontszám, részpontszámok), ...]
+    """
+    cache = {}
+
+    def trigrams(record):
+        grams = cache.get(record[_ID])
+        if grams is None:
+            grams = cache[record[_ID]] = [_trigrams(name) for name in record[_NAME]]
+        return grams
+
+    results = []
+    for left, right in tasks:
+        if right is None:
+            pairs = ((left[i], left[j]) for i in range(len(left)) for j in range(i + 1, len(left)))
+        else:
+            pairs = ((a, b) for a in left for b in right)
+        for a, b in pairs:
+            if a[_ID] == b[_ID]:
+                continue
+            scored = score_pair(a, b, trigrams)
+            if scored and scored[0] >= threshold:
+                low, high = sorted((a[_ID], b[_ID]))
+                results.append((low, high, round(scored[0], 4), scored[1]))
+    return results
+
+
+# ==================== BLOKKOLÁS ====================
+
+def _load_records():
+    """Nem törölt személyek rekordjai és blokk kulcsai egy lekérdezéssel"""
+    from app.models import Person, Marriage
+
+    rows = db.session.execute(
+        select(
+            Person.id, Person.gender, Person.first_name, Person.middle_name, Person.last_name,
+            Person.maiden_name, Person.birth_date, Person.death_date, Person.birth_place,
+            Marriage.person1_id, Marriage.person2_id,
+        )
+        .outerjoin(Marriage, Marriage.id == Person.parent_family_id)
+        .where(Person.deleted_at.is_(None))
+    ).all()
+
+    records = []
+    for (pid, gender, first, middle, last, maiden, birth, death, place, parent1, parent2) in rows:
+        names = tuple(
+            normalize(' '.join(part for part in (surname, first, middle) if part))
+            for surname in ((last, maiden) if maiden else (last,))
+        )
+        record = (
+            pid,
+            gender if gender in ('male', 'female') else None,
+            names,
+            (birth.year, birth.toordinal()) if birth else None,
+            (death.year, death.toordinal()) if death else None,
+            normalize(place) if place else None,
+            tuple(p for p in (parent1, parent2) if p is not None),
+        )
+        first_code = phonetic_code(first)[:1]
+        surnames = {phonetic_code(last)}
+        if maiden:
+            surnames.add(phonetic_code(maiden))
+        keys = [(code, first_code) for code in surnames if code]
+        records.append((record, keys))
+    return records
+
+
+def build_tasks(records):
+    """
+    Blokkok és összehasonlítási feladatok.
+
+    Returns:
+        tuple: (feladatok listája, blokkok száma, összehasonlítások száma)
+    """
+    blocks = defaultdict(lambda: defaultdict(list))  # név kulcs -> évtized -> rekordok
+    for record, keys in records:
+        decade = record[_BIRTH][0] // 10 if record[_BIRTH] else None
+        for key in keys:
+            blocks[key][decade].append(record)
+
+    tasks = []
+    comparisons = 0
+    block_count = 0
+    for by_decade in blocks.values():
+        undated = by_decade.get(None, [])
+        for decade, members in by_decade.items():
+            block_count += 1
+            if len(members) > 1:
+                tasks.append((members, None))
+                comparisons += len(members) * (len(members) - 1) // 2
+            if decade is None:
+                continue
+            neighbour = by_decade.get(decade + 1)
+            if neighbour:
+                tasks.append((members, neighbour))
+                comparisons += len(members) * len(neighbour)
+            if undated:
+                tasks.append((members, undated))
+                comparisons += len(members) * len(undated)
+    return tasks, block_count, comparisons
+
+
+def _chunk_tasks(tasks):
+    """Feladatok csoportosítása ~TASK_COMPARISONS méretű egységekbe"""
+    chunk, size = [], 0
+    for left, right in tasks:
+        chunk.append((left, right))
+        size += len(left) * (len(right) if right is not None else len(left) // 2)
+        if size >= TASK_COMPARISONS:
+            yield chunk
+            chunk, size = [], 0
+    if chunk:
+        yield chunk
+
+
+# ==================== FUTTATÁS ====================
+
+def find_duplicates(threshold=DEFAULT_THRESHOLD, max_workers=None):
+    """
+    A teljes keresés lefuttatása és az eredmény mentése.
+
+    Returns:
+        dict: statisztika (személyek, blokkok, összehasonlítások, párok, idő)
+    """
+    from app.models import DuplicateCandidate
+
+    started = time.perf_counter()
+    records = _load_records()
+    tasks, block_count, comparisons = build_tasks(records)
+
+    if comparisons < PARALLEL_MIN_COMPARISONS:
+        scored = score_blocks(tasks, threshold)
+    else:
+        scored = []
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 mp_context=multiprocessing.get_context(POOL_START_METHOD)) as pool:
+            futures = [pool.submit(score_blocks, chunk, threshold) for chunk in _chunk_tasks(tasks)]
+            for future in futures:
+                scored.extend(future.result())
+
+    # Ugyanaz a pár több blokkból is jöhet (leánykori név, szomszédos évtized)
+    best = {}
+    for low, high, score, parts in scored:
+        if (low, high) not in best or best[(low, high)][0] < score:
+            best[(low, high)] = (score, parts)
+
+    dismissed = set(db.session.execute(
+        select(DuplicateCandidate.person1_id, DuplicateCandidate.person2_id)
+        .where(DuplicateCandidate.status == 'dismissed')
+    ).tuples().all())
+
+    now = datetime.utcnow()
+    rows = [
+        {'person1_id': low, 'person2_id': high, 'score': score,
+         'reasons': json.dumps(parts), 'status': 'open', 'created_at': now}
+        for (low, high), (score, parts) in best.items()
+        if (low, high) not in dismissed
+    ]
+
+    db.session.execute(delete(DuplicateCandidate).where(DuplicateCandidate.status == 'open'))
+    if rows:
+        db.session.execute(insert(DuplicateCandidate), rows)
+    db.session.commit()
+
+    return {
+        'persons': len(records),
+        'blocks': block_count,
+        'comparisons': comparisons,
+        'pairs': len(rows),
+        'duration_ms': round((time.perf_counter() - started) * 1000),
+    }
+
+
+def get_job_status():
+    from app.models import AppSettings
+
+    raw = AppSettings.get(JOB_SETTING_KEY)
+    try:
+        return json.loads(raw) if raw else {'status': 'idle'}
+    except ValueError:
+        return {'status': 'idle'}
+
+
+def _set_job_status(status):
+    from app.models import AppSettings
+
+    AppSettings.set(JOB_SETTING_KEY, json.dumps(status))
+
+
+def _is_running(status):
+    if status.get('status') != 'running':
+        return False
+    try:
+        started = datetime.fromisoformat(status['started_at'])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return datetime.utcnow() - started < STALE_JOB_AFTER
+
+
+def start_scan(app, threshold=DEFAULT_THRESHOLD):
+    """
+    A keresés indítása háttérszálon.
+
+    Returns:
+        tuple: (elindult-e, aktuális állapot)
+    """
+    # Az ellenőrzés és a 'running' beírása egy fájlzár alatt: két worker (vagy
+    # dupla kattintás) közül csak az egyik indíthat keresést
+    lock_file = None
+    if fcntl:
+        lock_file = open(os.path.join(app.config['DATA_DIR'], LOCK_FILENAME), 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    try:
+        status = get_job_status()
+        if _is_running(status):
+            return False, status
+
+        status = {'status': 'running', 'started_at': datetime.utcnow().isoformat(), 'threshold': threshold}
+        _set_job_status(status)
+    finally:
+        if lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def run():
+        with app.app_context():
+            try:
+                result = find_duplicates(threshold)
+                _set_job_status(dict(status, status='done',
+                                     finished_at=datetime.utcnow().isoformat(), **result))
+            except Exception as e:
+                db.session.rollback()
+                app.logger.exception('Duplikátum keresés hiba')
+                _set_job_status(dict(status, status='error',
+                                     finished_at=datetime.utcnow().isoformat(), error=str(e)))
+
+    threading.Thread(target=run, name='duplicate-scan', daemon=True).start()
+    return True, status
+
+
+def person_summary(person):
+    """Rövid személy adat a duplikátum listához"""
+    return {
+        'id': person.id,
+        'display_name': person.display_name,
+        'gender': person.gender,
+        'birth_date': person.birth_date.isoformat() if person.birth_date else None,
+        'death_date': person.death_date.isoformat() if person.death_date else None,
+        'birth_place': person.birth_place,
+        'photo_path': person.photo_path,
+    }
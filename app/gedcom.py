@@ -0,0 +1,245 @@
+"""
+GEDCOM 5.5.1 export folyamként (streaming).
+
+A fájl rekordonként generálódik, így a memóriahasználat a fa méretétől
+független. A személyek, események és családok lekérdezései yield_per-rel
+kötegekben olvasnak (app/streaming.py); a személyhez tartozó események és családok, illetve a
+családhoz tartozó gyerekek azonos kulcs szerint rendezett folyamokból,
+összefésüléssel (merge join) jönnek - családonkénti/személyenkénti
+lekérdezés nélkül.
+
+A rekord azonosítók a valódi adatbázis ID-k: @I<person.id>@, @F<marriage.id>@.
+"""
+
+from sqlalchemy import select, union_all
+
+from app import db
+from app.streaming import SortedGroups, chunked, stream_rows
+
+
+# A személy rekordhoz olvasott oszlopok (ORM objektumok helyett: sokkal olcsóbb)
+PERSON_FIELDS = (
+    'id', 'first_name', 'middle_name', 'last_name', 'maiden_name', 'nickname', 'gender',
+    'birth_date', 'birth_date_approximate', 'birth_place',
+    'death_date', 'death_date_approximate', 'death_date_unknown', 'death_place', 'death_cause',
+    'burial_place', 'occupation', 'education', 'religion', 'nationality', 'biography', 'notes',
+)
+
+# GEDCOM sorhossz: a hosszabb szöveget CONC sorokra bontjuk
+MAX_LINE_VALUE = 200
+
+MONTHS = ('JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC')
+
+# Esemény típus -> GEDCOM tag (a többi EVEN + TYPE)
+EVENT_TAGS = {
+    'baptism': 'BAPM',
+    'confirmation': 'CONF',
+    'graduation': 'GRAD',
+    'immigration': 'IMMI',
+    'emigration': 'EMIG',
+    'retirement': 'RETI',
+}
+
+
+# ==================== FORMÁZÁS ====================
+
+def format_date(value, approximate=False):
+    """GEDCOM dátum (locale-független hónapnevekkel): 5 MAR 1901, ABT 1901"""
+    text = f'{value.day} {MONTHS[value.month - 1]} {value.year}'
+    return f'ABT {text}' if approximate else text
+
+
+def _clean(value):
+    return ' '.join(str(value).split())
+
+
+def _text(level, tag, value):
+    """Többsoros / hosszú szöveg CONT és CONC folytatósorokkal"""
+    lines = []
+    for i, line in enumerate(str(value).replace('\r\n', '\n').split('\n')):
+        prefix = f'{level} {tag}' if i == 0 else f'{level + 1} CONT'
+        chunks = [line[j:j + MAX_LINE_VALUE] for j in range(0, len(line), MAX_LINE_VALUE)] or ['']
+        lines.append(f'{prefix} {chunks[0]}'.rstrip())
+        lines.extend(f'{level + 1} CONC {chunk}' for chunk in chunks[1:])
+    return lines
+
+
+def _event(tag, date=None, approximate=False, place=None, extra=()):
+    lines = [f'1 {tag}']
+    if date:
+        lines.append(f'2 DATE {format_date(date, approximate)}')
+    if place:
+        lines.append(f'2 PLAC {_clean(place)}')
+    lines.extend(extra)
+    return lines
+
+
+# ==================== REKORDOK ====================
+
+def _person_record(person, parent_family_id, events, spouse_of):
+    lines = [f'0 @I{person.id}@ INDI']
+
+    given = ' '.join(_clean(part) for part in (person.first_name, person.middle_name) if part)
+    surname = _clean(person.last_name or '')
+    lines.append(f'1 NAME {given} /{surname}/')
+    if given:
+        lines.append(f'2 GIVN {given}')
+    if surname:
+        lines.append(f'2 SURN {surname}')
+    if person.nickname:
+        lines.append(f'2 NICK {_clean(person.nickname)}')
+    if person.maiden_name:
+        lines.append(f'1 NAME {given} /{_clean(person.maiden_name)}/')
+        lines.append('2 TYPE maiden')
+
+    if person.gender == 'male':
+        lines.append('1 SEX M')
+    elif person.gender == 'female':
+        lines.append('1 SEX F')
+
+    if person.birth_date or person.birth_place:
+        lines.extend(_event('BIRT', person.birth_date, person.birth_date_approximate, person.birth_place))
+    if person.death_date or person.death_place or person.death_cause:
+        extra = [f'2 CAUS {_clean(person.death_cause)}'] if person.death_cause else []
+        lines.extend(_event('DEAT', person.death_date, person.death_date_approximate, person.death_place, extra))
+    elif person.death_date_unknown:
+        lines.append('1 DEAT Y')  # Elhunyt, ismeretlen dátummal
+    if person.burial_place:
+        lines.extend(_event('BURI', place=person.burial_place))
+
+    for tag, value in (('OCCU', person.occupation), ('EDUC', person.education),
+                       ('RELI', person.religion), ('NATI', person.nationality)):
+        if value:
+            lines.append(f'1 {tag} {_clean(value)}')
+
+    for event in events:
+        tag = EVENT_TAGS.get(event.event_type)
+        extra = [] if tag else [f'2 TYPE {_clean(event.event_type)}']
+        if event.description:
+            extra.extend(_text(2, 'NOTE', event.description))
+        lines.extend(_event(tag or 'EVEN', event.event_date, place=event.event_place, extra=extra))
+
+    if parent_family_id is not None:
+        lines.append(f'1 FAMC @F{parent_family_id}@')
+    for family_id in spouse_of:
+        lines.append(f'1 FAMS @F{family_id}@')
+
+    if person.biography:
+        lines.extend(_text(1, 'NOTE', person.biography))
+    if person.notes:
+        lines.extend(_text(1, 'NOTE', person.notes))
+    return lines
+
+
+def _family_record(family, children):
+    lines = [f'0 @F{family.id}@ FAM']
+
+    # HUSB/WIFE nem szerint, ha ismert; egyébként a tárolt sorrendben
+    partners = [(family.person1_id, family.gender1), (family.person2_id, family.gender2)]
+    if partners[0][1] == 'female' or partners[1][1] == 'male':
+        partners.reverse()
+    for tag, (person_id, _) in zip(('HUSB', 'WIFE'), partners):
+        if person_id is not None:
+            lines.append(f'1 {tag} @I{person_id}@')
+
+    if family.relationship_type in (None, 'marriage', 'civil_partnership'):
+        if family.start_date or family.marriage_place:
+            lines.extend(_event('MARR', family.start_date, place=family.marriage_place))
+    elif family.relationship_type == 'engagement':
+        lines.extend(_event('ENGA', family.start_date, place=family.marriage_place))
+    if family.end_reason == 'divorce' or family.status == 'divorced':
+        lines.extend(_event('DIV', family.end_date))
+
+    for child_id in children:
+        lines.append(f'1 CHIL @I{child_id}@')
+
+    if family.notes:
+        lines.extend(_text(1, 'NOTE', family.notes))
+    return lines
+
+
+# ==================== EXPORT ====================
+
+def _records(source):
+    """A GEDCOM fájl rekordjai (rekordonként egy string)"""
+    from app.models import Person, Marriage, Event
+
+    yield '\n'.join([
+        '0 HEAD',
+        f'1 SOUR {source}',
+        '1 GEDC',
+        '2 VERS 5.5.1',
+        '2 FORM LINEAGE-LINKED',
+        '1 CHAR UTF-8',
+    ]) + '\n'
+
+    # ---------- Személyek (+ események, családi kapcsolatok) ----------
+    events = SortedGroups(stream_rows(
+        select(Event.person_id, Event.event_type, Event.event_date, Event.event_place, Event.description)
+        .where(Event.deleted_at.is_(None))
+        .order_by(Event.person_id, Event.event_date, Event.id)
+    ))
+    active_families = select(Marriage.id, Marriage.person1_id, Marriage.person2_id).where(
+        Marriage.deleted_at.is_(None)
+    ).subquery()
+    spouse_links = union_all(
+        select(active_families.c.person1_id.label('person_id'), active_families.c.id.label('family_id'))
+        .where(active_families.c.person1_id.isnot(None)),
+        select(active_families.c.person2_id, active_families.c.id)
+        .where(active_families.c.person2_id.isnot(None)),
+    ).subquery()
+    spouse_of = SortedGroups(stream_rows(
+        select(spouse_links.c.person_id, spouse_links.c.family_id)
+        .order_by(spouse_links.c.person_id, spouse_links.c.family_id)
+    ))
+
+    ParentFamily = db.aliased(Marriage)
+    persons = stream_rows(
+        select(*(getattr(Person, name) for name in PERSON_FIELDS), ParentFamily.id.label('parent_family_id'))
+        .outerjoin(ParentFamily, (ParentFamily.id == Person.parent_family_id) & ParentFamily.deleted_at.is_(None))
+        .where(Person.deleted_at.is_(None))
+        .order_by(Person.id)
+    )
+    for person in persons:
+        record = _person_record(
+            person,
+            person.parent_family_id,
+            events.take(person.id),
+            [row.family_id for row in spouse_of.take(person.id)],
+        )
+        yield '\n'.join(record) + '\n'
+
+    # ---------- Családok (+ gyerekek) ----------
+    # A törölt partnerek/gyerekek kimaradnak, hogy ne legyen lógó hivatkozás
+    children = SortedGroups(stream_rows(
+        select(Person.parent_family_id, Person.id)
+        .where(Person.deleted_at.is_(None), Person.parent_family_id.isnot(None))
+        .order_by(Person.parent_family_id, Person.birth_date, Person.id)
+    ))
+    Partner1 = db.aliased(Person)
+    Partner2 = db.aliased(Person)
+    families = stream_rows(
+        select(
+            Marriage.id, Partner1.id.label('person1_id'), Partner2.id.label('person2_id'),
+            Partner1.gender.label('gender1'), Partner2.gender.label('gender2'),
+            Marriage.relationship_type, Marriage.status, Marriage.start_date, Marriage.end_date,
+            Marriage.end_reason, Marriage.marriage_place, Marriage.notes,
+        )
+        .outerjoin(Partner1, (Partner1.id == Marriage.person1_id) & Partner1.deleted_at.is_(None))
+        .outerjoin(Partner2, (Partner2.id == Marriage.person2_id) & Partner2.deleted_at.is_(None))
+        .where(Marriage.deleted_at.is_(None))
+        .order_by(Marriage.id)
+    )
+    for family in families:
+        record = _family_record(family, [row.id for row in children.take(family.id)])
+        yield '\n'.join(record) + '\n'
+
+    yield '0 TRLR\n'
+
+
+def generate_gedcom(source='FamilySearch'):
+    """
+    A GEDCOM fájl ~CHUNK_SIZE méretű darabokban.
+    Alkalmazás kontextusban kell iterálni (stream_with_context).
+    """
+    return chunked(_records(source))
@@ -0,0 +1,614 @@
+"""
+GEDCOM 5.5.1 import folyamként (streaming), tömeges beszúrással.
+
+A fájlt soronként olvassuk, és egyszerre csak egy 0. szintű rekord
+(INDI, FAM, ...) van a memóriában. A rekordok a meglévő fához adódnak
+hozzá (nem cserélik le).
+
+Az új ID-k előre kiosztottak (a táblák legnagyobb ID-ja felett), így az
+előre hivatkozások (FAM -> még be nem olvasott INDI) egy menetben
+feloldhatók. A sorok IMPORT_BATCH_SIZE méretű executemany kötegekben
+kerülnek be, egyetlen tranzakcióban: hiba esetén semmi nem marad az
+adatbázisban.
+
+Megfeleltetés:
+    INDI            -> Person (NAME/GIVN/SURN/NICK, SEX, BIRT, DEAT, BURI,
+                       OCCU, EDUC, RELI, NATI, NOTE; TYPE maiden/birth NAME
+                       -> maiden_name)
+    FAM             -> Marriage (HUSB/WIFE, MARR, ENGA, DIV, NOTE)
+    CHIL / FAMC     -> Person.parent_family_id (PEDI adopted -> adoptive_family_id)
+    BAPM, CHR, CONF, GRAD, IMMI, EMIG, RETI, EVEN, ... -> Event
+"""
+
+import io
+import json
+import os
+import re
+import threading
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from app import db
+from app import search as search_index
+from app.gedcom import EVENT_TAGS, MONTHS
+from app.sqlite_tuning import begin_immediate
+
+try:
+    import fcntl
+except ImportError:  # Windows fejlesztői környezet: egy folyamat, a szál elég
+    fcntl = None
+
+
+IMPORT_BATCH_SIZE = 2000
+STATUS_FILENAME = '.gedcom_import.json'
+LOCK_FILENAME = '.gedcom_import.lock'
+STALE_JOB_AFTER = timedelta(hours=2)
+
+# A HEAD / CHAR értéke -> Python kódolás (ANSEL-hez nincs codec: latin-1 közelítés)
+CHARSETS = {
+    'UTF-8': 'utf-8-sig',
+    'UTF8': 'utf-8-sig',
+    'UNICODE': 'utf-16',
+    'ANSI': 'cp1252',
+    'IBMPC': 'cp437',
+    'ASCII': 'utf-8',
+    'ANSEL': 'latin-1',
+}
+
+# GEDCOM tag -> Event.event_type (a BIRT/DEAT/BURI a Person mezőibe kerül)
+EVENT_TYPES = {tag: event_type for event_type, tag in EVENT_TAGS.items()}
+EVENT_TYPES.update({
+    'CHR': 'baptism',
+    'CONL': 'confirmation',
+    'NATU': 'immigration',
+    '_MILT': 'military',
+    '_MILI': 'military',
+    'EVEN': 'other',
+})
+# Egyéb személyes események: 'other' típus, a tag neve a leírásban
+OTHER_EVENT_TAGS = {
+    'ADOP', 'BARM', 'BASM', 'BLES', 'CENS', 'CHRA', 'CREM', 'FCOM', 'ORDN',
+    'PROB', 'RESI', 'WILL', 'TITL', 'PROP', 'DSCR', 'SSN', 'IDNO', 'CAST', 'NCHI', 'NMR',
+}
+
+_MONTH_NUMBERS = {name: i for i, name in enumerate(MONTHS, 1)}
+_APPROXIMATE_PREFIXES = {'ABT', 'EST', 'CAL', 'BEF', 'AFT', 'INT', 'FROM', 'BET', 'TO'}
+_LINE_RE = re.compile(r'^\s*(\d+)\s+(?:(@[^@]+@)\s+)?(\S+)(?: (.*))?$')
+_ESCAPE_RE = re.compile(r'@#D[^@]*@|\([^)]*\)')
+_YEAR_RE = re.compile(r'^(\d{1,4})')
+_CHAR_RE = re.compile(rb'^\s*1\s+CHAR\s+(\S+)', re.MULTILINE)
+
+
+class GedcomImportError(Exception):
+    """Nem feldolgozható GEDCOM fájl"""
+
+
+# ==================== PARSZOLÁS ====================
+
+def parse_date(value):
+    """
+    GEDCOM dátum -> (date, becsült-e).
+    A részleges (csak év, hónap+év) és minősített (ABT, BEF, BET ... AND)
+    dátumok a legkorábbi lehetséges napra esnek, becsültként.
+    """
+    if not value:
+        return None, False
+    tokens = _ESCAPE_RE.sub(' ', value).upper().split()
+    approximate = False
+    while tokens and tokens[0] in _APPROXIMATE_PREFIXES:
+        approximate = True
+        tokens.pop(0)
+    for separator in ('AND', 'TO'):
+        if separator in tokens:
+            tokens = tokens[:tokens.index(separator)]
+            approximate = True
+    if not tokens:
+        return None, False
+
+    year_match = _YEAR_RE.match(tokens[-1])  # 1750/51 -> 1750
+    if not year_match:
+        return None, False
+    year = int(year_match.group(1))
+    month = _MONTH_NUMBERS.get(tokens[-2]) if len(tokens) >= 2 else None
+    day = int(tokens[-3]) if len(tokens) >= 3 and month and tokens[-3].isdigit() else None
+    try:
+        return date(year, month or 1, day or 1), approximate or not (month and day)
+    except ValueError:
+        return None, False
+
+
+def _detect_encoding(stream):
+    """A HEAD / CHAR sorból (az elején BOM is lehet)"""
+    head = stream.read(8192)
+    stream.seek(0)
+    if head.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return 'utf-16'
+    match = _CHAR_RE.search(head)
+    if match:
+        return CHARSETS.get(match.group(1).decode('ascii', 'replace').upper(), 'utf-8-sig')
+    return 'utf-8-sig'
+
+
+class _Node:
+    __slots__ = ('tag', 'value', 'xref', 'children')
+
+    def __init__(self, tag, value, xref=None):
+        self.tag = tag
+        self.value = value
+        self.xref = xref
+        self.children = []
+
+    def first(self, tag):
+        for child in self.children:
+            if child.tag == tag:
+                return child
+        return None
+
+    def value_of(self, tag):
+        child = self.first(tag)
+        return child.value.strip() if child is not None and child.value else None
+
+
+def iter_records(lines):
+    """0. szintű rekordok (_Node fák) soronként olvasott GEDCOM-ból; CONT/CONC összefűzve"""
+    record = None
+    stack = []
+    for line in lines:
+        match = _LINE_RE.match(line.rstrip('\r\n'))
+        if not match:
+            continue
+        level, xref, tag, value = int(match.group(1)), match.group(2), match.group(3).upper(), match.group(4) or ''
+
+        if level == 0:
+            if record is not None:
+                yield record
+            record = _Node(tag, value, xref)
+            stack = [record]
+            continue
+        if record is None:
+            continue
+
+        del stack[level:]
+        parent = stack[-1]
+        if tag == 'CONT':
+            parent.value = f'{parent.value}\n{value}'
+        elif tag == 'CONC':
+            parent.value = f'{parent.value}{value}'
+        else:
+            node = _Node(tag, value)
+            parent.children.append(node)
+            stack.append(node)
+    if record is not None:
+        yield record
+
+
+# ==================== IMPORTÁLÓ ====================
+
+def _empty_person():
+    return {
+        'id': None, 'first_name': '', 'middle_name': None, 'last_name': '', 'maiden_name': None,
+        'nickname': None, 'gender': 'unknown',
+        'birth_date': None, 'birth_date_approximate': False, 'birth_place': None,
+        'death_date': None, 'death_date_approximate': False, 'death_date_unknown': False,
+        'death_place': None, 'death_cause': None, 'burial_place': None,
+        'occupation': None, 'education': None, 'religion': None, 'nationality': None,
+        'notes': None, 'parent_family_id': None, 'adoptive_family_id': None,
+        'created_at': None, 'updated_at': None,
+    }
+
+
+def _split_name(value):
+    """'János Péter /Nagy/ Jr.' -> ('János Péter', 'Nagy')"""
+    if '/' in value:
+        given, _, rest = value.partition('/')
+        surname, _, suffix = rest.partition('/')
+        given = ' '.join(f'{given} {suffix}'.split())
+        return given, ' '.join(surname.split())
+    return ' '.join(value.split()), ''
+
+
+def _notes(node):
+    """Beágyazott NOTE szövegek (a @N1@ típusú hivatkozott jegyzeteket kihagyjuk)"""
+    texts = [child.value for child in node.children
+             if child.tag == 'NOTE' and child.value and not child.value.startswith('@')]
+    return '\n\n'.join(texts) or None
+
+
+def _clip(value, length):
+    return value[:length] if value else value
+
+
+class GedcomImporter:
+    """
+    Egy GEDCOM fájl beolvasása a meglévő fába.
+
+    progress: opcionális callback(stats dict), kötegenként hívva.
+    """
+
+    def __init__(self, progress=None):
+        self.progress = progress
+        self.stats = {'persons': 0, 'families': 0, 'events': 0, 'skipped_records': 0,
+                      'bytes_read': 0, 'total_bytes': None}
+        self._person_ids = {}   # GEDCOM xref -> új person id
+        self._family_ids = {}   # GEDCOM xref -> új marriage id
+        self._defined_persons = set()
+        self._defined_families = set()
+        self._child_family = {}  # person id -> family id (FAMC-ből vagy CHIL-ből)
+        self._late_children = []  # (family_id, person_id): a CHIL a gyerek INDI-ja UTÁN jött
+        self._persons, self._families, self._events = [], [], []
+        self._stream = None
+        self._now = None
+        self._next_person_id = self._next_family_id = None
+        self._first_person_id = self._first_family_id = None
+
+    # ---------- ID kiosztás ----------
+
+    def _person_id(self, xref):
+        if not xref:
+            return None
+        if xref not in self._person_ids:
+            self._person_ids[xref] = self._next_person_id
+            self._next_person_id += 1
+        return self._person_ids[xref]
+
+    def _family_id(self, xref):
+        if not xref:
+            return None
+        if xref not in self._family_ids:
+            self._family_ids[xref] = self._next_family_id
+            self._next_family_id += 1
+        return self._family_ids[xref]
+
+    # ---------- Rekordok ----------
+
+    def _add_individual(self, record):
+        person_id = self._person_id(record.xref)
+        if person_id is None or person_id in self._defined_persons:
+            self.stats['skipped_records'] += 1
+            return
+        self._defined_persons.add(person_id)
+
+        row = _empty_person()
+        row['id'] = row_id = person_id
+        row['created_at'] = row['updated_at'] = self._now
+
+        primary_name = True
+        for node in record.children:
+            tag = node.tag
+            if tag == 'NAME':
+                given, surname = _split_name(node.value or '')
+                given = node.value_of('GIVN') or given
+                surname = node.value_of('SURN') or surname
+                name_type = (node.value_of('TYPE') or '').lower()
+                if name_type in ('maiden', 'birth') and not primary_name:
+                    row['maiden_name'] = _clip(surname, 100) or row['maiden_name']
+                elif primary_name:
+                    first, _, middle = given.partition(' ')
+                    row['first_name'] = _clip(first, 100)
+                    row['middle_name'] = _clip(middle, 100) or None
+                    row['last_name'] = _clip(surname, 100)
+                    row['nickname'] = _clip(node.value_of('NICK'), 100)
+                    primary_name = False
+                if node.value_of('_MARNM') and row['last_name']:
+                    row['maiden_name'] = row['maiden_name'] or row['last_name']
+                    row['last_name'] = _clip(node.value_of('_MARNM'), 100)
+            elif tag == 'SEX':
+                row['gender'] = {'M': 'male', 'F': 'female'}.get((node.value or '').strip().upper()[:1], 'unknown')
+            elif tag == 'BIRT':
+                row['birth_date'], row['birth_date_approximate'] = parse_date(node.value_of('DATE'))
+                row['birth_place'] = _clip(node.value_of('PLAC'), 200)
+            elif tag == 'DEAT':
+                row['death_date'], row['death_date_approximate'] = parse_date(node.value_of('DATE'))
+                row['death_place'] = _clip(node.value_of('PLAC'), 200)
+                row['death_cause'] = _clip(node.value_of('CAUS'), 500)
+                row['death_date_unknown'] = row['death_date'] is None
+            elif tag == 'BURI':
+                row['burial_place'] = _clip(node.value_of('PLAC'), 200)
+            elif tag in ('OCCU', 'EDUC', 'RELI', 'NATI'):
+                field, length = {'OCCU': ('occupation', 200), 'EDUC': ('education', 300),
+                                 'RELI': ('religion', 100), 'NATI': ('nationality', 100)}[tag]
+                if node.value and not row[field]:
+                    row[field] = _clip(' '.join(node.value.split()), length)
+            elif tag == 'FAMC':
+                family_id = self._family_id(node.value.strip())
+                if (node.value_of('PEDI') or '').lower() in ('adopted', 'foster'):
+                    row['adoptive_family_id'] = row['adoptive_family_id'] or family_id
+                elif row['parent_family_id'] is None:
+                    row['parent_family_id'] = family_id
+            elif tag in EVENT_TYPES or tag in OTHER_EVENT_TAGS:
+                self._add_event(row_id, node)
+
+        # A CHIL előbb jött, mint a gyerek INDI rekordja
+        if row['parent_family_id'] is None:
+            row['parent_family_id'] = self._child_family.get(row_id)
+        elif row_id not in self._child_family:
+            self._child_family[row_id] = row['parent_family_id']
+        row['notes'] = _notes(record)
+
+        self._persons.append(row)
+        self.stats['persons'] += 1
+        if len(self._persons) >= IMPORT_BATCH_SIZE:
+            self._flush()
+
+    def _add_event(self, person_id, node):
+        event_type = EVENT_TYPES.get(node.tag, 'other')
+        event_date, approximate = parse_date(node.value_of('DATE'))
+        description = []
+        kind = node.value_of('TYPE')
+        if node.tag == 'EVEN' and kind:
+            event_type = kind.lower() if kind.lower() in EVENT_TAGS or kind.lower() == 'military' else 'other'
+            if event_type == 'other':
+                description.append(kind)
+        elif event_type == 'other':
+            description.append(node.tag if not node.value else f'{node.tag}: {node.value.strip()}')
+        if approximate and node.value_of('DATE'):
+            description.append(f"Dátum: {node.value_of('DATE')}")
+        note = _notes(node)
+        if note:
+            description.append(note)
+
+        self._events.append({
+            'person_id': person_id,
+            'event_type': event_type,
+            'event_date': event_date,
+            'event_place': _clip(node.value_of('PLAC'), 200),
+            'description': '\n'.join(description) or None,
+        })
+        self.stats['events'] += 1
+
+    def _add_family(self, record):
+        family_id = self._family_id(record.xref)
+        if family_id is None or family_id in self._defined_families:
+            self.stats['skipped_records'] += 1
+            return
+        self._defined_families.add(family_id)
+
+        row = {
+            'id': family_id, 'person1_id': None, 'person2_id': None,
+            'relationship_type': 'unknown', 'status': 'active',
+            'start_date': None, 'end_date': None, 'end_reason': None,
+            'marriage_place': None, 'notes': _notes(record),
+        }
+        for node in record.children:
+            tag = node.tag
+            if tag == 'HUSB':
+                row['person1_id'] = self._person_id(node.value.strip())
+            elif tag == 'WIFE':
+                row['person2_id'] = self._person_id(node.value.strip())
+            elif tag == 'MARR':
+                row['relationship_type'] = 'marriage'
+                row['start_date'] = parse_date(node.value_of('DATE'))[0]
+                row['marriage_place'] = _clip(node.value_of('PLAC'), 200)
+            elif tag == 'ENGA' and row['relationship_type'] == 'unknown':
+                row['relationship_type'] = 'engagement'
+                row['start_date'] = parse_date(node.value_of('DATE'))[0]
+            elif tag == 'DIV':
+                row['status'] = 'divorced'
+                row['end_reason'] = 'divorce'
+                row['end_date'] = parse_date(node.value_of('DATE'))[0]
+            elif tag == 'CHIL':
+                child_id = self._person_id(node.value.strip())
+                if child_id is None or child_id in self._child_family:
+                    continue
+                self._child_family[child_id] = family_id
+                if child_id in self._defined_persons:
+                    self._late_children.append((family_id, child_id))
+
+        self._families.append(row)
+        self.stats['families'] += 1
+        if len(self._families) >= IMPORT_BATCH_SIZE:
+            self._flush()
+
+    # ---------- Írás ----------
+
+    def _flush(self):
+        from app.models import Person, Marriage, Event
+
+        for model, rows in ((Person, self._persons), (Marriage, self._families), (Event, self._events)):
+            if rows:
+                db.session.execute(insert(model.__table__), rows)
+                rows.clear()
+        self._report()
+
+    def _report(self):
+        if self._stream is not None:
+            try:
+                self.stats['bytes_read'] = self._stream.tell()
+            except (OSError, ValueError):
+                pass
+        if self.progress:
+            self.progress(dict(self.stats))
+
+    def _finish(self):
+        """Késői gyerek kapcsolatok és a nem definiált rekordokra mutató hivatkozások"""
+        from app.models import Person, Marriage
+
+        persons = Person.__table__
+        families = Marriage.__table__
+        if self._late_children:
+            db.session.execute(
+                persons.update()
+                .where(persons.c.id == db.bindparam('child_id'), persons.c.parent_family_id.is_(None))
+                .values(parent_family_id=db.bindparam('family_id')),
+                [{'child_id': child, 'family_id': family} for family, child in self._late_children]
+            )
+
+        # Nem definiált (csak hivatkozott) rekordok: halmaz-alapon, csak az importált sorokon
+        existing_persons = select(persons.c.id)
+        existing_families = select(families.c.id)
+        for column in ('person1_id', 'person2_id'):
+            db.session.execute(
+                families.update()
+                .where(families.c.id >= self._first_family_id, families.c[column].isnot(None),
+                       families.c[column].not_in(existing_persons))
+                .values({column: None})
+            )
+        for column in ('parent_family_id', 'adoptive_family_id'):
+            db.session.execute(
+                persons.update()
+                .where(persons.c.id >= self._first_person_id, persons.c[column].isnot(None),
+                       persons.c[column].not_in(existing_families))
+                .values({column: None})
+            )
+
+    def _lock_and_reserve_ids(self):
+        """
+        Írási zár azonnal (hogy más worker ne szúrjon be közben), majd az
+        ID tartományok kezdete a jelenlegi legnagyobb ID felett.
+        """
+        from app.models import Person, Marriage
+
+        begin_immediate(db.session)
+        self._first_person_id = self._next_person_id = (
+            db.session.execute(select(func.max(Person.id))).scalar() or 0) + 1
+        self._first_family_id = self._next_family_id = (
+            db.session.execute(select(func.max(Marriage.id))).scalar() or 0) + 1
+
+    def run(self, stream, total_bytes=None):
+        """
+        Import egy bináris (seekable) folyamból, egyetlen tranzakcióban.
+
+        Returns:
+            dict: statisztika (személyek, családok, események, kihagyott rekordok, idő)
+        """
+        started = datetime.utcnow()
+        self._now = started
+        self._stream = stream
+        self.stats['total_bytes'] = total_bytes
+        encoding = _detect_encoding(stream)
+        lines = io.TextIOWrapper(stream, encoding=encoding, errors='replace', newline=None)
+
+        try:
+            self._lock_and_reserve_ids()
+            # Az FTS index a végén egyben épül újra (soronkénti trigger helyett)
+            with search_index.bulk_write(db.session.connection()):
+                seen_header = False
+                for record in iter_records(lines):
+                    if record.tag == 'HEAD':
+                        seen_header = True
+                    elif not seen_header:
+                        raise GedcomImportError('Nem GEDCOM fájl (hiányzó HEAD rekord)')
+                    elif record.tag == 'INDI':
+                        self._add_individual(record)
+                    elif record.tag == 'FAM':
+                        self._add_family(record)
+                    elif record.tag != 'TRLR':
+                        self.stats['skipped_records'] += 1
+                    if len(self._events) >= IMPORT_BATCH_SIZE:
+                        self._flush()
+                if not seen_header:
+                    raise GedcomImportError('Üres vagy nem GEDCOM fájl')
+
+                self._flush()
+                self._finish()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            lines.detach()
+
+        self.stats['duration_ms'] = round((datetime.utcnow() - started).total_seconds() * 1000)
+        self._report()
+        return dict(self.stats)
+
+
+def import_gedcom(path, progress=None):
+    """GEDCOM fájl importálása elérési út alapján"""
+    with open(path, 'rb') as f:
+        return GedcomImporter(progress).run(f, os.path.getsize(path))
+
+
+# ==================== HÁTTÉR FELADAT ====================
+
+def _status_path(app):
+    return os.path.join(app.config['DATA_DIR'], STATUS_FILENAME)
+
+
+def get_job_status(app):
+    """Az utolsó import állapota (fájlban, hogy minden worker lássa, és ne kelljen a DB zár)"""
+    try:
+        with open(_status_path(app), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'status': 'idle'}
+
+
+def _set_job_status(app, status):
+    path = _status_path(app)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(status, f)
+    os.replace(tmp_path, path)
+
+
+def _is_running(status):
+    if status.get('status') != 'running':
+        return False
+    try:
+        started = datetime.fromisoformat(status['started_at'])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return datetime.utcnow() - started < STALE_JOB_AFTER
+
+
+def is_running(app):
+    """Fut-e most (bármelyik workerben) GEDCOM import"""
+    return _is_running(get_job_status(app))
+
+
+def start_import(app, path, filename=None):
+    """
+    Import indítása háttérszálon a már lemezre mentett fájlból.
+    A fájlt a végén törli.
+
+    Returns:
+        tuple: (elindult-e, aktuális állapot)
+    """
+    # Az ellenőrzés és a 'running' beírása egy fájlzár alatt: két worker
+    # egyszerre érkező feltöltése közül csak az egyik indulhat el
+    lock_file = None
+    if fcntl:
+        lock_file = open(os.path.join(app.config['DATA_DIR'], LOCK_FILENAME), 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    try:
+        status = get_job_status(app)
+        if _is_running(status):
+            return False, status
+
+        status = {'status': 'running', 'started_at': datetime.utcnow().isoformat(), 'filename': filename}
+        _set_job_status(app, status)
+    finally:
+        if lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def progress(stats):
+        _set_job_status(app, dict(status, **stats))
+
+    def run():
+        from app.backup import backup_manager
+
+        with app.app_context():
+            try:
+                backup_manager.create_backup(trigger='auto', description=f'GEDCOM import előtt: {filename}')
+                result = import_gedcom(path, progress)
+                _set_job_status(app, dict(status, status='done',
+                                          finished_at=datetime.utcnow().isoformat(), **result))
+            except Exception as e:
+                if isinstance(e, GedcomImportError):
+                    app.logger.warning(f'GEDCOM import elutasítva: {e}')
+                else:
+                    app.logger.exception('GEDCOM import hiba')
+                _set_job_status(app, dict(get_job_status(app), status='error',
+                                          finished_at=datetime.utcnow().isoformat(), error=str(e)))
+            finally:
+                db.session.remove()
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    threading.Thread(target=run, name='gedcom-import', daemon=True).start()
+    return True, status
@@ -0,0 +1,498 @@
+"""
+Append-only változásnapló (change journal) a családfa adataihoz.
+
+Minden ORM-en keresztüli módosítás (személy, család, gyerek-kapcsolat,
+esemény, dokumentum, csomópont pozíció, lomtár, fa beállítások) a
+change_journal táblába kerül, ugyanabban a tranzakcióban, mint maga a
+módosítás: beszúrásnál a teljes sor, törlésnél a teljes előtte kép,
+módosításnál csak a változott oszlopok előtte/utána értékei.
+
+- Inkrementális mentés: ship() a legutóbbi szegmens óta keletkezett
+  bejegyzéseket egy tömörített NDJSON szegmensbe írja
+  (backups/journal/journal_<első>_<utolsó>.ndjson.gz) - teljes
+  adatbázis másolat helyett csak a változások.
+- Pont-időpontra visszaállítás: replay() egy teljes mentést (amelynek
+  manifestje tartalmazza a mentéskori napló sorszámot) a szegmensekből és
+  az élő napló még nem szállított részéből görget előre a kért időpontig.
+
+A tömeges műveletek (import) soronként nem követhetők: ezekről egy 'bulk'
+bejegyzés készül, amelyen a visszajátszás nem tud átlépni - utánuk a
+következő automatikus mentés teljes mentés lesz.
+"""
+
+import gzip
+import json
+import os
+import re
+import sqlite3
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event, func, insert, select, delete, inspect as sa_inspect
+
+from app import db
+from app.backup import backup_manager
+from app.backup_store import ChunkStoreError
+
+
+# Ezeknek a tábláknak a módosításai kerülnek a naplóba
+JOURNALED_TABLES = {
+    'persons', 'marriages', 'events', 'documents', 'node_positions', 'deleted_records', 'tree_settings',
+    'upload_refs',
+}
+
+SEGMENT_PATTERN = re.compile(r'^journal_(\d{12})_(\d{12})\.ndjson\.gz$')
+
+DB_RETENTION = timedelta(days=1)  # A már szállított bejegyzések ennyi ideig maradnak az adatbázisban
+FULL_BACKUP_INTERVAL = timedelta(days=1)  # Legalább ilyen gyakran készül teljes mentés
+ABANDONED_RETENTION = timedelta(days=30)  # Visszaállítás után félretett szegmensek megőrzése
+
+# Az SQLAlchemy SQLite DATETIME tárolási formátuma (a visszajátszás nyers SQL-lel ír)
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+ENTRY_FIELDS = ('seq', 'created_at', 'table_name', 'row_id', 'operation', 'before', 'after')
+
+
+class JournalError(Exception):
+    """A kért állapot nem állítható elő a naplóból"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.strftime(DATETIME_FORMAT)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'Nem szerializálható: {type(value).__name__}')
+
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_encode_value)
+
+
+def _dumps(values):
+    return None if values is None else _encoder.encode(values)
+
+
+def _entry(now, table_name, row_id, operation, before=None, after=None):
+    return {
+        'created_at': now,
+        'table_name': table_name,
+        'row_id': row_id,
+        'operation': operation,
+        'before': _dumps(before),
+        'after': _dumps(after),
+    }
+
+
+def _apply(conn, entry):
+    """Egy bejegyzés alkalmazása nyers SQLite kapcsolaton"""
+    table = entry['table_name']
+    if table not in JOURNALED_TABLES:
+        raise JournalError(f'Ismeretlen tábla a naplóban: {table}')
+
+    operation, row_id = entry['operation'], entry['row_id']
+    columns = list(entry['after'] or ())
+    quoted = [f'"{column}"' for column in columns]
+    if operation == 'insert':
+        conn.execute(
+            f'INSERT OR REPLACE INTO "{table}" ({", ".join(quoted)}) VALUES ({", ".join("?" * len(columns))})',
+            [entry['after'][c] for c in columns]
+        )
+    elif operation == 'update':
+        conn.execute(
+            f'UPDATE "{table}" SET {", ".join(f"{q} = ?" for q in quoted)} WHERE id = ?',
+            [entry['after'][c] for c in columns] + [row_id]
+        )
+    elif operation == 'delete':
+        conn.execute(f'DELETE FROM "{table}" WHERE id = ?', (row_id,))
+    else:
+        raise JournalError(f'Ismeretlen napló művelet: {operation}')
+
+
+class Journal:
+    """A változásnapló írása (session események), szállítása és visszajátszása"""
+
+    def __init__(self):
+        self._registered = False
+
+    def init_app(self, app, session):
+        if self._registered:
+            return
+        self._registered = True
+        event.listen(session, 'after_flush', self._after_flush)
+        event.listen(session, 'do_orm_execute', self._do_orm_execute)
+
+    @property
+    def segments_dir(self):
+        path = os.path.join(backup_manager.backup_dir, 'journal')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    # ---------- Írás (session események) ----------
+
+    def _after_flush(self, session, flush_context):
+        # Az attribútumok története (előtte értékek) itt még a flush előtti állapot
+        now = datetime.utcnow()
+        entries = []
+        for obj in session.new:
+            self._record(entries, obj, 'insert', now)
+        for obj in session.dirty:
+            if session.is_modified(obj, include_collections=False):
+                self._record(entries, obj, 'update', now)
+        for obj in session.deleted:
+            self._record(entries, obj, 'delete', now)
+
+        if entries:
+            from app.models import ChangeJournal
+            session.connection().execute(insert(ChangeJournal.__table__), entries)
+
+    def _record(self, entries, obj, operation, now):
+        state = sa_inspect(obj)
+        table = state.mapper.local_table
+        if table.name not in JOURNALED_TABLES:
+            return
+
+        columns = [(attr.key, attr.columns[0].name) for attr in state.mapper.column_attrs]
+        before = after = None
+        if operation == 'insert':
+            after = {name: state.dict.get(key) for key, name in columns}
+        elif operation == 'delete':
+            before = {name: state.dict[key] for key, name in columns if key in state.dict}
+        else:
+            before, after = {}, {}
+            for key, name in columns:
+                history = state.attrs[key].history
+                if not history.has_changes():
+                    continue
+                after[name] = history.added[0] if history.added else None
+                if history.deleted:
+                    before[name] = history.deleted[0]
+            if not after:
+                return
+            # A Python oldali onupdate értékek (updated_at) nem kerülnek a
+            # történetbe: a flush a kiszámolt értéket közvetlenül az objektumba írja
+            for key, name in columns:
+                if name not in after and state.mapper.columns[key].onupdate is not None and key in state.dict:
+                    after[name] = state.dict[key]
+
+        row_id = state.identity[0] if state.identity else (after or {}).get('id')
+        entries.append(_entry(now, table.name, row_id, operation, before, after))
+
+    def _do_orm_execute(self, orm_execute_state):
+        if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        statement = orm_execute_state.statement
+        table = getattr(statement, 'table', None)
+        if getattr(table, 'name', None) not in JOURNALED_TABLES:
+            return
+
+        from app.models import ChangeJournal
+
+        connection = orm_execute_state.session.connection()
+        now = datetime.utcnow()
+        if orm_execute_state.is_delete and statement.whereclause is not None:
+            # Szűrt törlés (pl. egy root összes pozíciója): a törlendő sorok előtte képe
+            rows = connection.execute(select(table).where(statement.whereclause)).mappings()
+            entries = [_entry(now, table.name, row['id'], 'delete', before=dict(row)) for row in rows]
+        else:
+            # Tömeges beszúrás / módosítás (import): a visszajátszás itt megáll
+            entries = [_entry(now, table.name, None, 'bulk')]
+
+        if entries:
+            connection.execute(insert(ChangeJournal.__table__), entries)
+
+    # ---------- Sorszámok ----------
+
+    @staticmethod
+    def snapshot_seq(path):
+        """
+        Egy adatbázis fájl (mentés) utolsó napló sorszáma.
+        None, ha a fájlban nincs napló tábla (a napló előtti mentés).
+        """
+        conn = sqlite3.connect(path)
+        try:
+            if conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'change_journal'"
+            ).fetchone() is None:
+                return None
+            # AUTOINCREMENT: a sqlite_sequence a ritkítás után is a legutolsó kiosztott sorszám
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_journal'").fetchone()
+            return row[0] if row else 0
+        finally:
+            conn.close()
+
+    def _segments(self):
+        """A szegmensek (első, utolsó sorszám, útvonal) listája sorszám szerint"""
+        segments = []
+        for name in os.listdir(self.segments_dir):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                segments.append((int(match.group(1)), int(match.group(2)), os.path.join(self.segments_dir, name)))
+        return sorted(segments)
+
+    def shipped_seq(self):
+        """Az utolsó szegmensbe írt sorszám"""
+        segments = self._segments()
+        return segments[-1][1] if segments else 0
+
+    def _manifest_seq(self, filename):
+        """A mentés napló sorszáma; None, ha nincs, vagy a mentés egy elhagyott idővonalon van"""
+        try:
+            metadata = backup_manager.store.load_manifest(filename).get('metadata', {})
+        except ChunkStoreError:
+            return None  # Régi, teljes fájlos mentés: nincs hozzá napló sorszám
+        if metadata.get('abandoned_timeline'):
+            return None
+        return metadata.get('journal_seq')
+
+    def snapshots(self, newest_first=True):
+        """A napló sorszámmal rendelkező teljes mentések: (BackupLog, journal_seq)"""
+        from app.models import BackupLog
+
+        order = BackupLog.created_at.desc() if newest_first else BackupLog.created_at.asc()
+        for log in BackupLog.query.order_by(order):
+            seq = self._manifest_seq(log.filename)
+            if seq is not None:
+                yield log, seq
+
+    # ---------- Inkrementális mentés ----------
+
+    def needs_full_backup(self):
+        """Kell-e teljes mentés (nincs friss, vagy tömeges művelet volt azóta)"""
+        from app.models import ChangeJournal
+
+        snapshot = next(self.snapshots(), None)
+        if snapshot is None:
+            return True
+        log, seq = snapshot
+        if log.created_at is None or datetime.utcnow() - log.created_at >= FULL_BACKUP_INTERVAL:
+            return True
+        return db.session.execute(
+            select(ChangeJournal.seq).where(ChangeJournal.seq > seq, ChangeJournal.operation == 'bulk').limit(1)
+        ).first() is not None
+
+    def _live_entries(self, after_seq):
+        """Az élő adatbázis napló bejegyzései after_seq után, szegmens formátumban"""
+        from app.models import ChangeJournal
+
+        columns = [getattr(ChangeJournal, field) for field in ENTRY_FIELDS]
+        rows = db.session.execute(
+            select(*columns).where(ChangeJournal.seq > after_seq).order_by(ChangeJournal.seq)
+            .execution_options(yield_per=1000)
+        )
+        for row in rows:
+            entry = dict(zip(ENTRY_FIELDS, row))
+            entry['created_at'] = entry['created_at'].strftime(DATETIME_FORMAT)
+            entry['before'] = json.loads(entry['before']) if entry['before'] else None
+            entry['after'] = json.loads(entry['after']) if entry['after'] else None
+            yield entry
+
+    def ship(self):
+        """
+        Inkrementális mentés: az utolsó szegmens óta keletkezett bejegyzések
+        egy új szegmensbe.
+
+        Returns:
+            dict: a szegmens adatai, vagy None, ha nem volt új bejegyzés
+        """
+        shipped = self.shipped_seq()
+        tmp_path = os.path.join(self.segments_dir, f'.segment.{os.getpid()}.tmp')
+        first = last = None
+        count = 0
+        try:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                for entry in self._live_entries(shipped):
+                    if first is None:
+                        first = entry['seq']
+                    last = entry['seq']
+                    count += 1
+                    f.write(_encoder.encode(entry) + '\n')
+            if not count:
+                return None
+            name = f'journal_{first:012d}_{last:012d}.ndjson.gz'
+            path = os.path.join(self.segments_dir, name)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self._prune_database(last)
+        self._prune_segments()
+        return {
+            'success': True,
+            'segment': name,
+            'entries': count,
+            'first_seq': first,
+            'last_seq': last,
+            'size': os.path.getsize(path),
+        }
+
+    def _prune_database(self, shipped_seq):
+        """A már szegmensbe írt, DB_RETENTION-nél régebbi bejegyzések törlése az adatbázisból"""
+        from app.models import ChangeJournal
+
+        db.session.execute(delete(ChangeJournal).where(
+            ChangeJournal.seq <= shipped_seq,
+            ChangeJournal.created_at < datetime.utcnow() - DB_RETENTION
+        ))
+        db.session.commit()
+
+    def _prune_segments(self):
+        """A legrégebbi teljes mentésnél régebbi (már nem kellő) és a régi félretett szegmensek törlése"""
+        oldest = next(self.snapshots(newest_first=False), None)
+        if oldest is not None:
+            for first, last, path in self._segments():
+                if last <= oldest[1]:
+                    os.remove(path)
+
+        limit = (datetime.now() - ABANDONED_RETENTION).timestamp()
+        for name in os.listdir(self.segments_dir):
+            path = os.path.join(self.segments_dir, name)
+            if '.abandoned-' in name and os.path.getmtime(path) < limit:
+                os.remove(path)
+
+    # ---------- Visszajátszás ----------
+
+    def _entries_after(self, seq):
+        """A seq utáni bejegyzések sorrendben: a szegmensekből, majd az élő adatbázisból"""
+        last = seq
+        for first, last_seq, path in self._segments():
+            if last_seq <= last:
+                continue
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry['seq'] > last:
+                        last = entry['seq']
+                        yield entry
+        yield from self._live_entries(last)
+
+    def referenced_values(self, columns):
+        """
+        A napló (szegmensek és élő rész) előtte/utána képeiben előforduló
+        értékek - pl. a pont-időpontra visszaállítható állapotok fájl útvonalai.
+
+        Args:
+            columns: tábla név -> oszlop név (pl. {'persons': 'photo_path'})
+
+        Returns:
+            set: a nem üres értékek
+        """
+        values = set()
+        for entry in self._entries_after(0):
+            column = columns.get(entry['table_name'])
+            if column is None:
+                continue
+            for image in (entry['before'], entry['after']):
+                if image and image.get(column):
+                    values.add(image[column])
+        return values
+
+    def replay(self, path, until=None):
+        """
+        Egy visszaépített teljes mentés (path) előregörgetése a naplóból.
+
+        Args:
+            path: az adatbázis fájl (nem az élő adatbázis!)
+            until: UTC időpont (datetime); None esetén a legutolsó bejegyzésig
+
+        Returns:
+            dict: from_seq, to_seq, applied
+
+        Raises:
+            JournalError: napló nélküli mentés, hiányzó bejegyzések vagy tömeges művelet
+        """
+        start = self.snapshot_seq(path)
+        if start is None:
+            raise JournalError('A mentés a változásnapló bevezetése előtt készült, időpontra nem görgethető')
+        limit = until.strftime(DATETIME_FORMAT) if until else None
+
+        conn = sqlite3.connect(path, isolation_level=None)
+        seq = start
+        try:
+            conn.execute('BEGIN')
+            for entry in self._entries_after(start):
+                if limit and entry['created_at'] > limit:
+                    break
+                if entry['seq'] != seq + 1:
+                    raise JournalError(f'Hiányzó napló bejegyzések: {seq + 1}-{entry["seq"] - 1}')
+                if entry['operation'] == 'bulk':
+                    raise JournalError(
+                        f'{entry["created_at"][:19]} UTC-kor tömeges művelet (pl. import) történt, '
+                        'ezen a napló nem tud átgörgetni - egy későbbi mentésből állíts vissza'
+                    )
+                _apply(conn, entry)
+                conn.execute(
+                    f'INSERT INTO change_journal ({", ".join(ENTRY_FIELDS)}) '
+                    f'VALUES ({", ".join("?" for _ in ENTRY_FIELDS)})',
+                    [entry['seq'], entry['created_at'], entry['table_name'], entry['row_id'],
+                     entry['operation'], _dumps(entry['before']), _dumps(entry['after'])]
+                )
+                seq = entry['seq']
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+        return {'from_seq': start, 'to_seq': seq, 'applied': seq - start}
+
+    def branch(self, seq, restored_filename):
+        """
+        Visszaállítás után új idővonal indul a seq sorszámtól: a visszaállított
+        adatbázis új bejegyzései ugyanezeket a sorszámokat kapják, ezért
+
+        - a seq utáni (elhagyott) bejegyzéseket tartalmazó szegmensek félre
+          kerülnek (.abandoned-<időpont>); a seq-ig tartó rész megmarad,
+        - a seq-nél későbbi sorszámú mentések (pl. a visszaállítás előtti
+          mentés) teljes mentésként visszaállíthatók maradnak, de időpontra
+          görgetés alapjául már nem szolgálnak.
+        """
+        for filename in backup_manager.store.list_backups():
+            if filename == restored_filename:
+                continue
+            try:
+                metadata = backup_manager.store.load_manifest(filename).get('metadata', {})
+            except ChunkStoreError:
+                continue
+            journal_seq = metadata.get('journal_seq')
+            if journal_seq is not None and journal_seq > seq and not metadata.get('abandoned_timeline'):
+                backup_manager.store.update_metadata(filename, abandoned_timeline=True)
+        if backup_manager.store.has_backup(restored_filename):
+            # A visszaállított mentés az új idővonal kiindulópontja
+            backup_manager.store.update_metadata(restored_filename, abandoned_timeline=False)
+
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        for first, last, path in self._segments():
+            if last <= seq:
+                continue
+            if first <= seq:
+                kept_path = os.path.join(self.segments_dir, f'journal_{first:012d}_{seq:012d}.ndjson.gz')
+                with gzip.open(path, 'rt', encoding='utf-8') as source, \
+                        gzip.open(kept_path + '.tmp', 'wt', encoding='utf-8') as target:
+                    for line in source:
+                        if json.loads(line)['seq'] <= seq:
+                            target.write(line)
+                os.replace(kept_path + '.tmp', kept_path)
+            os.replace(path, f'{path}.abandoned-{stamp}')
+
+    # ---------- Állapot ----------
+
+    def get_status(self):
+        from app.models import ChangeJournal
+
+        segments = self._segments()
+        oldest = next(self.snapshots(newest_first=False), None)
+        last_seq = db.session.execute(select(func.max(ChangeJournal.seq))).scalar()
+        return {
+            'last_seq': last_seq or 0,
+            'shipped_seq': segments[-1][1] if segments else 0,
+            'db_entries': db.session.execute(select(func.count(ChangeJournal.seq))).scalar(),
+            'segments': len(segments),
+            'segments_size_mb': round(sum(os.path.getsize(path) for _, _, path in segments) / (1024 * 1024), 2),
+            'earliest_restore_point': oldest[0].created_at.isoformat() if oldest and oldest[0].created_at else None,
+        }
+
+
+# Singleton instance
+journal = Journal()
@@ -0,0 +1,90 @@
+"""
+Teljes adat export NDJSON formátumban, folyamként.
+
+Soronként egy JSON objektum, a 'type' mező adja a rekord fajtáját:
+
+    {"type": "header", "format": "familysearch-ndjson", "version": 1, ...}
+    {"type": "person", "id": 1, "first_name": ...}
+    {"type": "marriage", ...}
+    {"type": "event", ...}
+    {"type": "document", ...}
+    {"type": "node_position", ...}
+    {"type": "tree_settings", ...}
+
+A rekordok a tábla oszlopai (a to_dict() számított mezői és soronkénti
+lekérdezései nélkül), yield_per kötegekben olvasva, így a memóriahasználat
+a fa méretétől független. A törölt (lomtárban lévő) rekordok kimaradnak,
+mint a JSON exportban. A fájl visszatölthető a JSON importtal
+(/api/import/json, Content-Type: application/x-ndjson).
+"""
+
+import json
+from datetime import date, datetime
+
+from sqlalchemy import select
+
+from app.streaming import chunked, stream_rows
+
+
+FORMAT_NAME = 'familysearch-ndjson'
+FORMAT_VERSION = 1
+
+# Exportból kimaradó oszlopok
+EXCLUDED_COLUMNS = {'deleted_at'}
+
+
+def _default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'Nem szerializálható: {type(value).__name__}')
+
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_default)
+
+
+def _record_sources():
+    """(rekord típus, model, sorrend) - a személyek elöl, mert a többi rájuk hivatkozik"""
+    from app.models import Person, Marriage, Event, Document, NodePosition, TreeSettings
+
+    return (
+        ('person', Person, Person.id),
+        ('marriage', Marriage, Marriage.id),
+        ('event', Event, Event.id),
+        ('document', Document, Document.id),
+        ('node_position', NodePosition, NodePosition.id),
+        ('tree_settings', TreeSettings, TreeSettings.id),
+    )
+
+
+def _lines():
+    yield _encoder.encode({
+        'type': 'header',
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'export_date': datetime.utcnow().isoformat(),
+    }) + '\n'
+
+    for record_type, model, order in _record_sources():
+        table = model.__table__
+        columns = [column for column in table.columns if column.name not in EXCLUDED_COLUMNS]
+        statement = select(*columns).order_by(order)
+        if 'deleted_at' in table.columns:
+            statement = statement.where(table.c.deleted_at.is_(None))
+
+        names = ['type'] + [column.name for column in columns]
+        for row in stream_rows(statement):
+            record = dict(zip(names, (record_type, *row)))
+            if record_type == 'person' and record.get('custom_fields'):
+                try:
+                    record['custom_fields'] = json.loads(record['custom_fields'])
+                except ValueError:
+                    pass
+            yield _encoder.encode(record) + '\n'
+
+
+def generate_ndjson():
+    """
+    Az NDJSON fájl ~CHUNK_SIZE méretű darabokban (app.streaming).
+    Alkalmazás kontextusban kell iterálni (stream_with_context).
+    """
+    return chunked(_lines())
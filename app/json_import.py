@@ -0,0 +1,458 @@
+"""
+JSON import (teljes adatbázis csere) folyamként, tömeges beszúrással.
+
+A kérés törzsét darabonként olvassuk: a felső szintű objektum tömbjei
+('persons', 'marriages', 'events', 'documents', ...) elemenként
+dekódolódnak, így a teljes fájl sosem kerül a memóriába, és a feltöltés a
+MAX_CONTENT_LENGTH-nál nagyobb is lehet. Az NDJSON export (soronként egy
+'type' mezős rekord, lásd json_export) ugyanígy visszatölthető.
+
+Kulcssorrend: a többi szakasz a személyekre hivatkozik, ezért a 'persons'
+tömbnek kell elöl állnia (a JSON és NDJSON export így írja). Ha egy fájlban
+mégis később jön, az előtte lévő rekordok egy ideiglenes fájlba kerülnek, és
+a személyek után onnan töltődnek be - a memóriahasználat így is állandó.
+
+A régi adatok törlése és az új sorok beszúrása egyetlen tranzakció:
+hiba esetén a régi fa változatlan marad. Az új ID-k előre kiosztottak,
+a sorok IMPORT_BATCH_SIZE méretű executemany kötegekben kerülnek be.
+A legacy father_id/mother_id párok családja memóriabeli szótárból jön
+(szülőpáronkénti lekérdezés nélkül).
+"""
+
+import io
+import json
+import re
+import tempfile
+from datetime import date, datetime
+
+from sqlalchemy import Boolean, Date, DateTime, delete, func, insert, select
+
+from app import db
+from app import search as search_index
+from app.sqlite_tuning import begin_immediate
+
+
+IMPORT_BATCH_SIZE = 2000
+READ_SIZE = 64 * 1024
+
+# Az export által generált (számított) mezők és a külön kezelt kapcsolatok
+SKIPPED_FIELDS = {
+    'id', 'full_name', 'display_name', 'age', 'is_alive', 'created_at', 'updated_at',
+    'spouse_family_ids', 'parents', 'person1_name', 'person2_name', 'children_ids', 'children',
+    'father_id', 'mother_id', 'parent_family_id', 'adoptive_family_id',
+    'person_id', 'person1_id', 'person2_id', 'root_person_id', 'default_root_person_id',
+}
+
+NDJSON_MIMETYPES = {'application/x-ndjson', 'application/ndjson', 'application/jsonl'}
+
+# NDJSON rekord típus -> szakasz
+RECORD_TYPES = {
+    'person': 'persons',
+    'marriage': 'marriages',
+    'event': 'events',
+    'document': 'documents',
+    'node_position': 'node_positions',
+    'tree_settings': 'tree_settings',
+}
+
+_WHITESPACE_RE = re.compile(r'\s*')
+
+
+class JsonImportError(Exception):
+    """Nem feldolgozható JSON import"""
+
+
+# ==================== FOLYAM OLVASÓ ====================
+
+class JsonStreamReader:
+    """
+    Minimális, darabonként olvasó JSON bejáró egy szöveges folyamon.
+    Az egyes értékeket a json modul dekódolja (raw_decode); ez az osztály
+    csak az objektum kulcsain és a tömbök elemein lépked végig.
+    """
+
+    def __init__(self, stream, read_size=READ_SIZE):
+        self._stream = stream
+        self._read_size = read_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, size=None):
+        chunk = self._stream.read(size or self._read_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """A következő nem-whitespace karakter (üres string a folyam végén)"""
+        while True:
+            self._pos = _WHITESPACE_RE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise JsonImportError(f'Hibás JSON: {" vagy ".join(chars)} helyett {char or "fájlvége"}')
+        self._pos += 1
+        return char
+
+    def value(self):
+        """A következő teljes JSON érték"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as e:
+                # Csonka érték a puffer végén: több adat kell (a nagy értékekhez
+                # duplázódó olvasással, hogy ne legyen négyzetes)
+                if self._eof or not self._fill(max(self._read_size, len(self._buffer))):
+                    raise JsonImportError(f'Hibás JSON: {e.msg}') from None
+                continue
+            # Szám a puffer végén folytatódhat a következő darabban
+            if end == len(self._buffer) and not self._eof and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def members(self):
+        """Objektum kulcsai; a hívónak minden kulcs után el kell olvasnia az értéket"""
+        self._expect('{')
+        if self.peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise JsonImportError('Hibás JSON: az objektum kulcsa nem szöveg')
+            self._expect(':')
+            yield key
+            if self._expect(',}') == '}':
+                return
+
+    def items(self):
+        """Tömb elemei egyenként"""
+        self._expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self._expect(',]') == ']':
+                return
+
+
+def iter_ndjson(lines):
+    """(szakasz, rekord) párok NDJSON sorokból; a fejléc és az ismeretlen típusok kimaradnak"""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise JsonImportError(f'Hibás NDJSON a(z) {number}. sorban: {e}') from None
+        section = RECORD_TYPES.get(record.get('type')) if isinstance(record, dict) else None
+        if section is not None:
+            yield section, record
+
+
+def iter_json(reader):
+    """(szakasz, rekord) párok egy export JSON objektum tömbjeiből"""
+    for key in reader.members():
+        if key not in JsonImporter.SECTIONS or reader.peek() != '[':
+            reader.value()  # export_date és egyéb ismeretlen mezők
+            continue
+        for item in reader.items():
+            yield key, item
+    if reader.peek():
+        raise JsonImportError('Hibás JSON: adat a gyökér objektum után')
+
+
+# ==================== SOROK ====================
+
+def _parse_date(value, kind):
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed.date() if kind is date else parsed
+
+
+class _RowBuilder:
+    """Export dict -> beszúrható sor egy táblához (minden sorban ugyanazok a kulcsok)"""
+
+    def __init__(self, table, now):
+        self.defaults = {}
+        self.converters = {}
+        for column in table.columns:
+            default = column.default
+            if default is None:
+                value = None
+            elif default.is_scalar:
+                value = default.arg
+            else:
+                value = now  # A modellekben csak datetime.utcnow a hívható alapérték
+            self.defaults[column.name] = value
+            if isinstance(column.type, DateTime):
+                self.converters[column.name] = lambda v: _parse_date(v, datetime)
+            elif isinstance(column.type, Date):
+                self.converters[column.name] = lambda v: _parse_date(v, date)
+            elif isinstance(column.type, Boolean):
+                self.converters[column.name] = lambda v: None if v is None else bool(v)
+        self.fields = [name for name in self.defaults if name not in SKIPPED_FIELDS]
+
+    def build(self, data):
+        row = dict(self.defaults)
+        for name in self.fields:
+            if name in data:
+                value = data[name]
+                converter = self.converters.get(name)
+                row[name] = converter(value) if converter else value
+        return row
+
+
+class JsonImporter:
+    """
+    Egy exportált JSON fájl beolvasása az összes meglévő adat helyére.
+
+    Returns (run): dict statisztika
+    """
+
+    SECTIONS = ('persons', 'marriages', 'events', 'documents', 'node_positions', 'tree_settings')
+
+    def __init__(self):
+        self.stats = {'persons': 0, 'marriages': 0, 'events': 0, 'documents': 0,
+                      'node_positions': 0, 'tree_settings': 0, 'created_families': 0, 'skipped': 0}
+        self._person_ids = {}     # régi person ID -> új
+        self._family_ids = {}     # régi marriage ID -> új
+        self._couples = {}        # frozenset(új partner ID-k) -> új marriage ID
+        self._parent_links = []   # (új person ID, régi parent_family_id, régi adoptive_family_id, régi apa, régi anya)
+        self._deferred = None     # a személyek előtt érkezett rekordok (ideiglenes NDJSON fájl)
+        self._rows = {section: [] for section in self.SECTIONS}
+        self._tables = {}
+        self._builders = {}
+        self._persons_done = False
+        self._next_person_id = self._next_family_id = None
+
+    # ---------- Szakaszok ----------
+
+    def _add_person(self, data):
+        person_id = self._next_person_id
+        self._next_person_id += 1
+        if data.get('id') is not None:
+            self._person_ids[data['id']] = person_id
+
+        row = self._builders['persons'].build(data)
+        row['id'] = person_id
+        row['first_name'] = row['first_name'] or ''
+        row['last_name'] = row['last_name'] or ''
+        if isinstance(row['custom_fields'], (dict, list)):
+            row['custom_fields'] = json.dumps(row['custom_fields'])
+
+        links = (data.get('parent_family_id'), data.get('adoptive_family_id'),
+                 data.get('father_id'), data.get('mother_id'))
+        if any(link is not None for link in links):
+            self._parent_links.append((person_id, *links))
+        self._append('persons', row)
+
+    def _add_marriage(self, data):
+        # A nem importált (pl. törölt) partner helye üres marad, a gyerekek miatt
+        new_partners = [self._person_ids.get(data.get(key)) for key in ('person1_id', 'person2_id')]
+        if new_partners == [None, None]:
+            self.stats['skipped'] += 1
+            return
+
+        family_id = self._next_family_id
+        self._next_family_id += 1
+        if data.get('id') is not None:
+            self._family_ids[data['id']] = family_id
+        if None not in new_partners:
+            self._couples.setdefault(frozenset(new_partners), family_id)
+
+        row = self._builders['marriages'].build(data)
+        row.update(id=family_id, person1_id=new_partners[0], person2_id=new_partners[1])
+        self._append('marriages', row)
+
+    def _add_person_record(self, section, data, required):
+        """Esemény / dokumentum: a személy ID átírásával"""
+        old_person_id = data.get('person_id')
+        person_id = self._person_ids.get(old_person_id)
+        if person_id is None and (required or old_person_id is not None) or not data.get(required):
+            self.stats['skipped'] += 1
+            return
+        row = self._builders[section].build(data)
+        row['person_id'] = person_id
+        self._append(section, row)
+
+    def _add_node_position(self, data):
+        person_id = self._person_ids.get(data.get('person_id'))
+        root_person_id = self._person_ids.get(data.get('root_person_id'))
+        if person_id is None or root_person_id is None or data.get('x') is None or data.get('y') is None:
+            self.stats['skipped'] += 1
+            return
+        row = self._builders['node_positions'].build(data)
+        row.update(person_id=person_id, root_person_id=root_person_id)
+        self._append('node_positions', row)
+
+    def _add_tree_settings(self, data):
+        """A fában lévő beállítások a fájlbeliekre cserélődnek (csak ha a fájlban vannak)"""
+        if not self.stats['tree_settings']:
+            db.session.execute(delete(self._tables['tree_settings']))
+        row = self._builders['tree_settings'].build(data)
+        row['default_root_person_id'] = self._person_ids.get(data.get('default_root_person_id'))
+        self._append('tree_settings', row)
+
+    def _handle(self, section, data):
+        if not isinstance(data, dict):
+            self.stats['skipped'] += 1
+        elif section == 'persons':
+            self._add_person(data)
+        elif not self._persons_done:
+            # A személyek szakasza még nem jött: a hivatkozások csak utána oldhatók
+            # fel - addig lemezre tesszük, hogy a memória ne nőjön a fájl méretével
+            self._defer(section, data)
+        elif section == 'marriages':
+            self._add_marriage(data)
+        elif section == 'node_positions':
+            self._add_node_position(data)
+        elif section == 'tree_settings':
+            self._add_tree_settings(data)
+        else:
+            self._add_person_record(section, data, 'event_type' if section == 'events' else 'file_path')
+
+    def _defer(self, section, data):
+        if self._deferred is None:
+            self._deferred = tempfile.TemporaryFile('w+', encoding='utf-8')
+        self._deferred.write(json.dumps([section, data], ensure_ascii=False) + '\n')
+
+    def _replay_deferred(self):
+        if self._deferred is None:
+            return
+        self._deferred.seek(0)
+        for line in self._deferred:
+            section, data = json.loads(line)
+            self._handle(section, data)
+
+    # ---------- Írás ----------
+
+    def _append(self, section, row):
+        rows = self._rows[section]
+        rows.append(row)
+        self.stats[section] += 1
+        if len(rows) >= IMPORT_BATCH_SIZE:
+            self._flush(section)
+
+    def _flush(self, section):
+        rows = self._rows[section]
+        if rows:
+            db.session.execute(insert(self._tables[section]), rows)
+            rows.clear()
+
+    def _link_parents(self):
+        """Szülő családok: régi parent_family_id, különben legacy apa/anya pár"""
+        updates = []
+        for person_id, parent_family, adoptive_family, father, mother in self._parent_links:
+            family_id = self._family_ids.get(parent_family)
+            if family_id is None and father is not None and mother is not None:
+                parents = (self._person_ids.get(father), self._person_ids.get(mother))
+                if None not in parents:
+                    family_id = self._couples.get(frozenset(parents))
+                    if family_id is None:
+                        family_id = self._next_family_id
+                        self._next_family_id += 1
+                        self._couples[frozenset(parents)] = family_id
+                        self._rows['marriages'].append(dict(
+                            self._builders['marriages'].defaults, id=family_id,
+                            person1_id=parents[0], person2_id=parents[1],
+                            relationship_type='partnership', status='active',
+                        ))
+                        self.stats['created_families'] += 1
+            adoptive_id = self._family_ids.get(adoptive_family)
+            if family_id is not None or adoptive_id is not None:
+                updates.append({'person': person_id, 'family': family_id, 'adoptive': adoptive_id})
+        self._flush('marriages')
+
+        if updates:
+            persons = self._tables['persons']
+            db.session.execute(
+                persons.update()
+                .where(persons.c.id == db.bindparam('person'))
+                .values(parent_family_id=db.bindparam('family'),
+                        adoptive_family_id=db.bindparam('adoptive')),
+                updates
+            )
+
+    def _replace_existing(self):
+        """Az összes meglévő adat törlése és az új ID tartományok kezdete"""
+        from app.models import (Person, Marriage, Event, Document, DeletedRecord, DuplicateCandidate,
+                                NodePosition)
+
+        # A pozíciók és a duplikátum jelöltek a régi ID-kra mutatnak: ezek is mennek
+        for model in (DuplicateCandidate, NodePosition, Event, Document, DeletedRecord, Marriage, Person):
+            db.session.execute(delete(model.__table__))
+        self._next_person_id = (db.session.execute(select(func.max(Person.id))).scalar() or 0) + 1
+        self._next_family_id = (db.session.execute(select(func.max(Marriage.id))).scalar() or 0) + 1
+
+    def run(self, stream, ndjson=False):
+        """
+        Import egy bináris folyamból (pl. request.stream), egyetlen tranzakcióban.
+        ndjson: soronkénti rekordok (NDJSON export) a JSON objektum helyett.
+        """
+        from app.models import Person, Marriage, Event, Document, NodePosition, TreeSettings
+
+        started = datetime.utcnow()
+        self._tables = {'persons': Person.__table__, 'marriages': Marriage.__table__,
+                        'events': Event.__table__, 'documents': Document.__table__,
+                        'node_positions': NodePosition.__table__, 'tree_settings': TreeSettings.__table__}
+        self._builders = {section: _RowBuilder(table, started) for section, table in self._tables.items()}
+        text_stream = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='strict')
+        records = iter_ndjson(text_stream) if ndjson else iter_json(JsonStreamReader(text_stream))
+
+        try:
+            # Írási zár (és tranzakció) azonnal, még a trigger DDL előtt
+            begin_immediate(db.session)
+            # Az FTS index a végén egyben épül újra (soronkénti trigger helyett)
+            with search_index.bulk_write(db.session.connection()):
+                self._replace_existing()
+
+                for section, item in records:
+                    # Az első nem-személy rekord a személyek után: a hivatkozások feloldhatók
+                    if section != 'persons' and not self._persons_done and self.stats['persons']:
+                        self._flush('persons')
+                        self._persons_done = True
+                    self._handle(section, item)
+
+                self._persons_done = True
+                self._replay_deferred()
+                self._flush('persons')
+                self._flush('marriages')
+                self._link_parents()
+                for section in self.SECTIONS[2:]:
+                    self._flush(section)
+            db.session.commit()
+        except UnicodeDecodeError:
+            db.session.rollback()
+            raise JsonImportError('A fájl nem UTF-8 kódolású') from None
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            if self._deferred is not None:
+                self._deferred.close()
+
+        self.stats['duration_ms'] = round((datetime.utcnow() - started).total_seconds() * 1000)
+        return dict(self.stats)
+
+
+def import_json(stream, ndjson=False):
+    """JSON / NDJSON export visszatöltése (a meglévő adatok helyére)"""
+    return JsonImporter().run(stream, ndjson)
@@ -0,0 +1,240 @@
+"""
+Memóriabeli rokonsági gráf index.
+
+A persons és marriages táblákból egyetlen menetben felépített index:
+    személy -> szülői család, partneri családok
+    család  -> partnerek, gyerekek
+A Person.parents / children / siblings / half_siblings és a családfa
+végpontok ebből olvasnak, így nem kell minden lépéshez SELECT.
+
+Az írásokat a change_tracker értesítései alapján inkrementálisan követjük;
+ha egy másik worker írt (eltér az adatverzió), a következő olvasáskor
+teljes újraépítés történik.
+"""
+
+import threading
+
+from app.changes import change_tracker
+
+
+class KinshipIndex:
+    """Folyamatszintű rokonsági gráf index (csak ID-kat tárol)"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None  # Az adatverzió, amelyhez az index érvényes
+        self._parent_family = {}   # person_id -> family_id
+        self._spouse_families = {}  # person_id -> [family_id, ...] (rendezve)
+        self._partners = {}        # family_id -> (person1_id, person2_id)
+        self._children = {}        # family_id -> [person_id, ...] (rendezve)
+
+    # ---------- Felépítés ----------
+
+    def _build(self):
+        """
+        Teljes felépítés két könnyű oszlop-lekérdezéssel.
+        Külön kapcsolaton: a hívó session flush-olt, de még nem commitolt
+        (esetleg visszagörgetett) sorai nem kerülhetnek az indexbe.
+        """
+        from sqlalchemy import select
+        from app import db
+        from app.models import Person, Marriage
+
+        version = change_tracker.version
+        with db.engine.connect() as conn:
+            person_rows = conn.execute(select(Person.id, Person.parent_family_id)).all()
+            family_rows = conn.execute(select(Marriage.id, Marriage.person1_id, Marriage.person2_id)).all()
+
+        parent_family = {}
+        children = {}
+        for person_id, family_id in person_rows:
+            parent_family[person_id] = family_id
+            if family_id is not None:
+                children.setdefault(family_id, []).append(person_id)
+
+        partners = {}
+        spouse_families = {}
+        for family_id, person1_id, person2_id in family_rows:
+            partners[family_id] = (person1_id, person2_id)
+            for pid in (person1_id, person2_id):
+                if pid is not None:
+                    spouse_families.setdefault(pid, []).append(family_id)
+
+        for ids in children.values():
+            ids.sort()
+        for ids in spouse_families.values():
+            ids.sort()
+
+        self._parent_family = parent_family
+        self._children = children
+        self._partners = partners
+        self._spouse_families = spouse_families
+        self._version = version
+
+    def _ensure_fresh(self):
+        if self._version is None or self._version != change_tracker.version:
+            with self._lock:
+                if self._version is None or self._version != change_tracker.version:
+                    self._build()
+
+    def invalidate(self):
+        """Az index eldobása - a következő olvasás újraépíti"""
+        with self._lock:
+            self._version = None
+
+    # ---------- Inkrementális frissítés ----------
+
+    def on_change(self, old_version, new_version, changes):
+        """change_tracker listener: commit utáni frissítés"""
+        with self._lock:
+            # Ha közben más worker is írt, vagy bulk művelet volt: újraépítés
+            if changes is None or self._version is None or self._version != old_version:
+                self._version = None
+                return
+
+            for table, entity_id, values in changes:
+                if table == 'persons':
+                    self._apply_person(entity_id, values)
+                elif table == 'marriages':
+                    self._apply_family(entity_id, values)
+
+            self._version = new_version
+
+    def _apply_person(self, person_id, values):
+        if values is not None and 'parent_family_id' not in values:
+            return  # A szülői család nem változott (nincs betöltve)
+
+        old_family = self._parent_family.pop(person_id, None)
+        if old_family is not None:
+            siblings = self._children.get(old_family, [])
+            if person_id in siblings:
+                siblings.remove(person_id)
+
+        if values is None:
+            return  # Végleges törlés
+
+        new_family = values['parent_family_id']
+        self._parent_family[person_id] = new_family
+        if new_family is not None:
+            siblings = self._children.setdefault(new_family, [])
+            siblings.append(person_id)
+            siblings.sort()
+
+    def _apply_family(self, family_id, values):
+        old_partners = self._partners.pop(family_id, (None, None))
+        if values is not None:
+            new_partners = (
+                values.get('person1_id', old_partners[0]),
+                values.get('person2_id', old_partners[1]),
+            )
+        else:
+            new_partners = (None, None)
+
+        for pid in old_partners:
+            if pid is not None and family_id in self._spouse_families.get(pid, []):
+                self._spouse_families[pid].remove(family_id)
+
+        if values is None:
+            return  # Végleges törlés
+
+        self._partners[family_id] = new_partners
+        for pid in new_partners:
+            if pid is not None:
+                families = self._spouse_families.setdefault(pid, [])
+                if family_id not in families:
+                    families.append(family_id)
+                    families.sort()
+
+    # ---------- Lekérdezések (csak ID-k) ----------
+
+    def parent_family_id(self, person_id):
+        self._ensure_fresh()
+        return self._parent_family.get(person_id)
+
+    def spouse_family_ids(self, person_id):
+        self._ensure_fresh()
+        return list(self._spouse_families.get(person_id, []))
+
+    def partner_ids(self, family_id):
+        """A család partnereinek ID-jai (None nélkül)"""
+        self._ensure_fresh()
+        return [pid for pid in self._partners.get(family_id, (None, None)) if pid is not None]
+
+    def family_children_ids(self, family_id):
+        self._ensure_fresh()
+        return list(self._children.get(family_id, []))
+
+    def parent_ids(self, person_id):
+        family_id = self.parent_family_id(person_id)
+        if family_id is None:
+            return []
+        return self.partner_ids(family_id)
+
+    def relations_many(self, person_ids):
+        """
+        Kötegelt lekérdezés listázáshoz (egyetlen frissesség-ellenőrzéssel).
+
+        Returns:
+            dict: person_id -> (szülő ID-k, partneri család ID-k)
+        """
+        self._ensure_fresh()
+        result = {}
+        for person_id in person_ids:
+            family_id = self._parent_family.get(person_id)
+            parents = [] if family_id is None else [
+                pid for pid in self._partners.get(family_id, (None, None)) if pid is not None
+            ]
+            result[person_id] = (parents, list(self._spouse_families.get(person_id, [])))
+        return result
+
+    def children_ids(self, person_id):
+        """Összes gyerek az összes partneri családból (duplikáció nélkül)"""
+        self._ensure_fresh()
+        result = []
+        seen = set()
+        for family_id in self._spouse_families.get(person_id, []):
+            for child_id in self._children.get(family_id, []):
+                if child_id not in seen:
+                    seen.add(child_id)
+                    result.append(child_id)
+        return result
+
+    def sibling_ids(self, person_id):
+        family_id = self.parent_family_id(person_id)
+        if family_id is None:
+            return []
+        return [cid for cid in self._children.get(family_id, []) if cid != person_id]
+
+    def half_sibling_ids(self, person_id):
+        """Egy közös szülő, de másik családból származó gyerekek"""
+        family_id = self.parent_family_id(person_id)
+        if family_id is None:
+            return []
+
+        full_siblings = set(self._children.get(family_id, []))
+        result = []
+        seen = set()
+        for parent_id in self.partner_ids(family_id):
+            for child_id in self.children_ids(parent_id):
+                if child_id == person_id or child_id in full_siblings or child_id in seen:
+                    continue
+                seen.add(child_id)
+                result.append(child_id)
+        return result
+
+
+def load_persons(person_ids):
+    """Személyek betöltése ID lista alapján egy lekérdezéssel, a sorrend megtartásával"""
+    from app.models import Person
+
+    by_id = {}
+    # Darabolás: az SQLite a paraméterek számát korlátozza
+    for start in range(0, len(person_ids), 900):
+        chunk = person_ids[start:start + 900]
+        by_id.update((p.id, p) for p in Person.query.filter(Person.id.in_(chunk)).all())
+    return [by_id[pid] for pid in person_ids if pid in by_id]
+
+
+# Singleton instance
+kinship_index = KinshipIndex()
+change_tracker.subscribe(kinship_index.on_change)
@@ -0,0 +1,165 @@
+"""
+Felmenők és leszármazottak lekérdezése egyetlen rekurzív SQL lekérdezéssel.
+
+A WITH RECURSIVE lekérdezés a persons.parent_family_id és a
+marriages.person1_id/person2_id mezőkön járja be a gráfot, és minden
+elért személyhez visszaadja a legkisebb mélységet és a szülői család
+partnereit. A fa bejárása ebből már memóriában történik: a többször elért
+(ősösszeomlás, pl. unokatestvér-házasság) személyek csak egyszer
+szerializálódnak, a további előfordulásaik visszahivatkozások ({'ref': id}).
+
+A lekérdezések száma a mélységtől független: egy rekurzív lekérdezés és a
+személyek kötegelt betöltése.
+"""
+
+from sqlalchemy import text
+
+from app import db
+from app.kinship import kinship_index, load_persons
+
+
+DEFAULT_MAX_DEPTH = 10
+MAX_DEPTH_LIMIT = 50
+
+_ANCESTORS_SQL = text("""
+    WITH RECURSIVE lineage(person_id, depth) AS (
+        SELECT :root_id, 0
+        UNION
+        SELECT CASE side.n WHEN 1 THEN m.person1_id ELSE m.person2_id END, l.depth + 1
+        FROM lineage l
+        JOIN persons child ON child.id = l.person_id
+        JOIN marriages m ON m.id = child.parent_family_id
+        CROSS JOIN (SELECT 1 AS n UNION ALL SELECT 2) side
+        WHERE l.depth < :max_depth
+          AND CASE side.n WHEN 1 THEN m.person1_id ELSE m.person2_id END IS NOT NULL
+    )
+    SELECT l.person_id, MIN(l.depth), m.person1_id, m.person2_id
+    FROM lineage l
+    JOIN persons p ON p.id = l.person_id
+    LEFT JOIN marriages m ON m.id = p.parent_family_id
+    GROUP BY l.person_id
+""")
+
+_DESCENDANTS_SQL = text("""
+    WITH RECURSIVE lineage(person_id, depth) AS (
+        SELECT :root_id, 0
+        UNION
+        SELECT child.id, l.depth + 1
+        FROM lineage l
+        JOIN marriages m ON m.person1_id = l.person_id OR m.person2_id = l.person_id
+        JOIN persons child ON child.parent_family_id = m.id
+        WHERE l.depth < :max_depth
+    )
+    SELECT l.person_id, MIN(l.depth), m.person1_id, m.person2_id
+    FROM lineage l
+    JOIN persons p ON p.id = l.person_id
+    LEFT JOIN marriages m ON m.id = p.parent_family_id
+    GROUP BY l.person_id
+""")
+
+
+def clamp_depth(max_depth):
+    """A kért mélység korlátozása értelmes tartományra"""
+    if max_depth is None:
+        return DEFAULT_MAX_DEPTH
+    return max(0, min(int(max_depth), MAX_DEPTH_LIMIT))
+
+
+def _fetch(sql, root_id, max_depth):
+    """
+    A rekurzív lekérdezés futtatása.
+
+    Returns:
+        tuple: (person_id -> legkisebb mélység, person_id -> [szülő ID-k])
+    """
+    rows = db.session.execute(sql, {'root_id': root_id, 'max_depth': max_depth}).all()
+    depths = {}
+    parents = {}
+    for person_id, depth, person1_id, person2_id in rows:
+        depths[person_id] = depth
+        parents[person_id] = [pid for pid in (person1_id, person2_id) if pid is not None]
+    return depths, parents
+
+
+def _walk(root_id, next_ids, depths, max_depth):
+    """
+    Mélységi bejárás: a személy a legkisebb mélységű előfordulásánál kap
+    teljes bejegyzést, minden más előfordulása visszahivatkozás.
+
+    Returns:
+        list: (person_id, depth, is_ref) hármasok bejárási sorrendben
+    """
+    entries = []
+    visited = set()
+    stack = [(root_id, 0)]
+
+    while stack:
+        person_id, depth = stack.pop()
+        if person_id in visited or depth > depths.get(person_id, depth):
+            entries.append((person_id, depth, True))
+            continue
+        visited.add(person_id)
+        entries.append((person_id, depth, False))
+
+        if depth < max_depth:
+            # Fordított sorrendben a verembe, hogy az eredeti sorrendben járjunk be
+            for next_id in reversed(next_ids.get(person_id, [])):
+                stack.append((next_id, depth + 1))
+
+    return entries
+
+
+def _serialize(entries):
+    """A bejárás szerializálása egy kötegben betöltött személyekkel"""
+    from app.models import Person
+
+    persons = load_persons([person_id for person_id, _depth, is_ref in entries if not is_ref])
+    serialized = dict(zip((p.id for p in persons), Person.to_dict_many(persons)))
+
+    result = []
+    for person_id, depth, is_ref in entries:
+        if is_ref:
+            result.append({'ref': person_id, 'depth': depth})
+        elif person_id in serialized:
+            result.append({'person': serialized[person_id], 'depth': depth})
+    return result
+
+
+def get_ancestors(root_id, max_depth=DEFAULT_MAX_DEPTH):
+    """Felmenők: [{'person': {...}, 'depth': n}, {'ref': id, 'depth': n}, ...]"""
+    max_depth = clamp_depth(max_depth)
+    depths, parents = _fetch(_ANCESTORS_SQL, root_id, max_depth)
+
+    # Csak a lekérdezés által elért szülők (a mélységkorláton belül)
+    next_ids = {
+        person_id: [pid for pid in parent_ids if pid in parents]
+        for person_id, parent_ids in parents.items()
+    }
+    return _serialize(_walk(root_id, next_ids, depths, max_depth))
+
+
+def get_descendants(root_id, max_depth=DEFAULT_MAX_DEPTH):
+    """Leszármazottak: [{'person': {...}, 'depth': n}, {'ref': id, 'depth': n}, ...]"""
+    max_depth = clamp_depth(max_depth)
+    depths, parents = _fetch(_DESCENDANTS_SQL, root_id, max_depth)
+
+    # Szülő -> gyerekek fordított irány, ID szerint rendezve
+    next_ids = {}
+    for person_id in sorted(parents):
+        for parent_id in parents[person_id]:
+            if parent_id in parents and person_id != root_id:
+                next_ids.setdefault(parent_id, []).append(person_id)
+    return _serialize(_walk(root_id, next_ids, depths, max_depth))
+
+
+def get_lineage_ids(root_id, max_depth=DEFAULT_MAX_DEPTH):
+    """A felmenők és leszármazottak ID-i (a gyökérrel), és a partnereik"""
+    max_depth = clamp_depth(max_depth)
+    ids = set()
+    for sql in (_ANCESTORS_SQL, _DESCENDANTS_SQL):
+        depths, _parents = _fetch(sql, root_id, max_depth)
+        ids.update(depths)
+    for person_id in list(ids):
+        for family_id in kinship_index.spouse_family_ids(person_id):
+            ids.update(kinship_index.partner_ids(family_id))
+    return ids
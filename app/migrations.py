@@ -0,0 +1,165 @@
+"""
+Verziózott séma migrációk a családfa SQLite adatbázishoz.
+
+A db.create_all() csak hiányzó táblákat hoz létre, meglévő táblákhoz nem
+ad új oszlopot vagy indexet. Indításkor a run_migrations() lefuttatja a
+még nem alkalmazott migrációkat, és az app_settings táblában
+('schema_version' kulcs) rögzíti az elért verziót.
+
+Minden migráció idempotens, így friss (create_all-lal létrehozott)
+adatbázison is biztonságosan lefut.
+"""
+
+import os
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import inspect, text
+
+try:
+    import fcntl
+except ImportError:  # Windows fejlesztői környezet
+    fcntl = None
+
+
+SCHEMA_VERSION_KEY = 'schema_version'
+
+# Soft delete tombstone: entitás típus -> tábla
+SOFT_DELETE_TABLES = {
+    'person': 'persons',
+    'marriage': 'marriages',
+    'event': 'events',
+    'document': 'documents',
+}
+
+# Idegen kulcs indexek: (tábla, oszlop) - a név megegyezik a create_all által adottal
+FOREIGN_KEY_INDEXES = [
+    ('persons', 'parent_family_id'),
+    ('marriages', 'person1_id'),
+    ('marriages', 'person2_id'),
+    ('events', 'person_id'),
+    ('documents', 'person_id'),
+    ('node_positions', 'root_person_id'),
+]
+
+
+# ==================== MIGRÁCIÓK ====================
+
+def _add_soft_delete_columns(conn):
+    """
+    deleted_at oszlop + index az entitás táblákon, feltöltve a deleted_records
+    tartalmából, és egyedi index a deleted_records (entity_type, entity_id) párra.
+    """
+    inspector = inspect(conn)
+
+    for entity_type, table in SOFT_DELETE_TABLES.items():
+        columns = {c['name'] for c in inspector.get_columns(table)}
+        if 'deleted_at' not in columns:
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN deleted_at DATETIME'))
+            conn.execute(text(f"""
+                UPDATE {table}
+                SET deleted_at = (
+                    SELECT MIN(COALESCE(dr.deleted_at, CURRENT_TIMESTAMP))
+                    FROM deleted_records dr
+                    WHERE dr.entity_type = :entity_type AND dr.entity_id = {table}.id
+                )
+                WHERE id IN (
+                    SELECT entity_id FROM deleted_records WHERE entity_type = :entity_type
+                )
+            """), {'entity_type': entity_type})
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS ix_{table}_deleted_at ON {table} (deleted_at)'))
+
+    # Esetleges duplikált lomtár bejegyzések összevonása az egyedi index előtt
+    conn.execute(text("""
+        DELETE FROM deleted_records
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM deleted_records GROUP BY entity_type, entity_id
+        )
+    """))
+    conn.execute(text("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_deleted_records_entity
+        ON deleted_records (entity_type, entity_id)
+    """))
+
+
+def _add_foreign_key_indexes(conn):
+    """Indexek a gyakran keresett idegen kulcs oszlopokra (gyerekek, partnerek, események)"""
+    for table, column in FOREIGN_KEY_INDEXES:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})'))
+
+
+def _create_search_index(conn):
+    """FTS5 keresőindex a személyekre, szinkron triggerekkel, feltöltve"""
+    from app.search import create_search_index
+
+    if not create_search_index(conn):
+        current_app.logger.warning('Az SQLite nem támogatja az FTS5-öt, a keresés LIKE alapú marad')
+
+
+def _add_backup_log_index(conn):
+    """Index a backup napló időrendi listázásához és ritkításához"""
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_backup_logs_created_at ON backup_logs (created_at)'))
+
+
+# (verzió, leírás, függvény) - csak a lista végére szabad újat felvenni!
+MIGRATIONS = [
+    (1, 'Soft delete tombstone oszlopok és lomtár index', _add_soft_delete_columns),
+    (2, 'Idegen kulcs indexek', _add_foreign_key_indexes),
+    (3, 'FTS5 személykereső index', _create_search_index),
+    (4, 'Backup napló időrendi index', _add_backup_log_index),
+]
+
+
+# ==================== FUTTATÓ ====================
+
+def get_schema_version(conn):
+    row = conn.execute(
+        text('SELECT value FROM app_settings WHERE key = :key'), {'key': SCHEMA_VERSION_KEY}
+    ).first()
+    try:
+        return int(row[0]) if row else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+def _set_schema_version(conn, version):
+    now = datetime.utcnow()
+    conn.execute(text("""
+        INSERT INTO app_settings (key, value, created_at, updated_at)
+        VALUES (:key, :value, :now, :now)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+    """), {'key': SCHEMA_VERSION_KEY, 'value': str(version), 'now': now})
+
+
+def run_migrations(engine, lock_dir=None):
+    """
+    A még nem alkalmazott migrációk futtatása sorrendben.
+    A gunicorn workerek egyszerre indulnak, ezért fájlzárral sorosítjuk.
+
+    Returns:
+        list: az alkalmazott migrációk verziószámai
+    """
+    lock_file = None
+    if fcntl and lock_dir:
+        lock_file = open(os.path.join(lock_dir, '.migrations.lock'), 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+    applied = []
+    try:
+        with engine.connect() as conn:
+            current = get_schema_version(conn)
+
+        for version, description, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            with engine.begin() as conn:
+                migrate(conn)
+                _set_schema_version(conn, version)
+            applied.append(version)
+            current_app.logger.info(f'Séma migráció alkalmazva: #{version} - {description}')
+    finally:
+        if lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    return applied
@@ -1,6 +1,35 @@
 from app import db
+from app.kinship import kinship_index, load_persons
+from app.thumbnails import thumbnail_urls
 from datetime import datetime
 
+
+def format_full_name(last_name, first_name, middle_name=None):
+    """Magyar sorrend: vezetéknév + keresztnév (+ középső név)"""
+    parts = [last_name, first_name]
+    if middle_name:
+        parts.append(middle_name)
+    return ' '.join(parts)
+
+
+# Ennél több ID esetén nem IN listát használunk, hanem egy teljes (szűrt)
+# lekérdezést, és Pythonban válogatunk - az SQLite paraméterszám-korlátja miatt
+MAX_IN_PARAMS = 900
+
+
+def select_in(query, column, ids):
+    """
+    Egy lekérdezés sorai, ahol column az ids halmazban van - egyetlen lekérdezéssel.
+    Az oszlopnak a lekérdezés első elemének kell lennie (sor[0]).
+    """
+    ids = set(ids)
+    if not ids:
+        return []
+    if len(ids) <= MAX_IN_PARAMS:
+        return query.filter(column.in_(ids)).all()
+    return [row for row in query.filter(column.isnot(None)).all() if row[0] in ids]
+
+
 class Person(db.Model):
     """Személy adatmodell - minden családtag"""
     __tablename__ = 'persons'
@@ -57,11 +86,14 @@ class Person(db.Model):
     # Egyéni mezők (JSON formátumban)
     custom_fields = db.Column(db.Text)  # JSON string egyéni mezőkhöz
     
+    # Soft delete (a DeletedRecord-dal szinkronban tartva, indexelt szűréshez)
+    deleted_at = db.Column(db.DateTime, index=True)
+    
     # ========== KAPCSOLATOK - ÚJ GRÁF-ALAPÚ MODELL ==========
     
     # A család ID-ja, ahol ez a személy GYEREKKÉNT szerepel
     # Ez a KULCS a gráf-alapú modellhez!
-    parent_family_id = db.Column(db.Integer, db.ForeignKey('marriages.id'))
+    parent_family_id = db.Column(db.Integer, db.ForeignKey('marriages.id'), index=True)
     
     # Örökbefogadó család (opcionális)
     adoptive_family_id = db.Column(db.Integer, db.ForeignKey('marriages.id'))
@@ -81,11 +113,7 @@ class Person(db.Model):
     
     @property
     def full_name(self):
-        # Magyar sorrend: vezetéknév + keresztnév (+ középső név)
-        parts = [self.last_name, self.first_name]
-        if self.middle_name:
-            parts.append(self.middle_name)
-        return ' '.join(parts)
+        return format_full_name(self.last_name, self.first_name, self.middle_name)
     
     @property
     def display_name(self):
@@ -113,10 +141,15 @@ class Person(db.Model):
     @property
     def spouse_families(self):
         """Visszaadja az összes családot, ahol ez a személy partner"""
-        from app.models import Marriage
-        return Marriage.query.filter(
-            (Marriage.person1_id == self.id) | (Marriage.person2_id == self.id)
-        ).all()
+        family_ids = self.spouse_family_ids
+        if not family_ids:
+            return []
+        return Marriage.query.filter(Marriage.id.in_(family_ids)).order_by(Marriage.id).all()
+    
+    @property
+    def spouse_family_ids(self):
+        """A partneri családok ID-jai (a rokonsági indexből, lekérdezés nélkül)"""
+        return kinship_index.spouse_family_ids(self.id)
     
     @property
     def children(self):
@@ -124,16 +157,7 @@ class Person(db.Model):
         Visszaadja a személy összes gyermekét.
         GRÁF-ALAPÚ MODELL: a gyerekek a családokon (Family) keresztül kapcsolódnak.
         """
-        children = []
-        children_ids = set()
-        
-        for family in self.spouse_families:
-            for child in family.biological_children:
-                if child.id not in children_ids:
-                    children_ids.add(child.id)
-                    children.append(child)
-        
-        return children
+        return load_persons(kinship_index.children_ids(self.id))
     
     @property
     def parents(self):
@@ -143,11 +167,11 @@ class Person(db.Model):
         """
         parents = []
         
-        if self.parent_family:
-            if self.parent_family.person1:
-                parents.append(self.parent_family.person1)
-            if self.parent_family.person2:
-                parents.append(self.parent_family.person2)
+        # db.session.get az identity map-ből szolgál ki, ha a szülő már be van töltve
+        for parent_id in kinship_index.parent_ids(self.id):
+            parent = db.session.get(Person, parent_id)
+            if parent:
+                parents.append(parent)
         
         return parents
     
@@ -157,15 +181,7 @@ class Person(db.Model):
         Visszaadja a személy testvéreit (teljes testvérek).
         GRÁF-ALAPÚ MODELL: ugyanabból a családból származó gyerekek.
         """
-        if not self.parent_family:
-            return []
-        
-        siblings = []
-        for child in self.parent_family.biological_children:
-            if child.id != self.id:
-                siblings.append(child)
-        
-        return siblings
+        return load_persons(kinship_index.sibling_ids(self.id))
     
     @property
     def half_siblings(self):
@@ -173,29 +189,45 @@ class Person(db.Model):
         Visszaadja a féltestvéreket (egy közös szülő).
         GRÁF-ALAPÚ MODELL: más családból származó gyerekek, de közös szülővel.
         """
-        if not self.parent_family:
-            return []
+        return load_persons(kinship_index.half_sibling_ids(self.id))
+    
+    def to_dict(self):
+        parents = [{'id': p.id, 'name': p.full_name} for p in self.parents]
+        return self._to_dict(self.spouse_family_ids, parents)
+    
+    @staticmethod
+    def to_dict_many(persons):
+        """
+        Több személy szerializálása kötegelten (listázó végpontokhoz).
         
-        half_sibs = []
-        parent_ids = [self.parent_family.person1_id, self.parent_family.person2_id]
-        parent_ids = [pid for pid in parent_ids if pid]
+        A partneri családok és a szülők ID-jai a rokonsági indexből jönnek,
+        a szülők nevei pedig egyetlen lekérdezéssel (csak azokhoz a szülőkhöz,
+        akik nincsenek a listában) - soronkénti lekérdezés nélkül.
+        """
+        relations = kinship_index.relations_many([p.id for p in persons])
         
-        for parent_id in parent_ids:
-            parent = Person.query.get(parent_id)
-            if not parent:
-                continue
-            
-            for child in parent.children:
-                if child.id == self.id:
-                    continue
-                if child in self.siblings:
-                    continue  # Teljes testvér, nem féltestvér
-                if child not in half_sibs:
-                    half_sibs.append(child)
+        names = {p.id: p.full_name for p in persons}
+        missing = {pid for parent_ids, _ in relations.values() for pid in parent_ids if pid not in names}
+        names.update(Person.names_by_id(missing))
         
-        return half_sibs
+        result = []
+        for p in persons:
+            parent_ids, spouse_family_ids = relations[p.id]
+            parents = [{'id': pid, 'name': names[pid]} for pid in parent_ids if pid in names]
+            result.append(p._to_dict(spouse_family_ids, parents))
+        return result
     
-    def to_dict(self):
+    @staticmethod
+    def names_by_id(person_ids):
+        """Teljes nevek ID alapján, egyetlen lekérdezéssel"""
+        rows = select_in(
+            db.session.query(Person.id, Person.last_name, Person.first_name, Person.middle_name),
+            Person.id, person_ids
+        )
+        return {pid: format_full_name(last_name, first_name, middle_name)
+                for pid, last_name, first_name, middle_name in rows}
+    
+    def _to_dict(self, spouse_family_ids, parents):
         import json
         return {
             'id': self.id,
@@ -228,14 +260,15 @@ class Person(db.Model):
             'biography': self.biography,
             'notes': self.notes,
             'photo_path': self.photo_path,
+            'photo_thumbs': thumbnail_urls(self.photo_path),
             # Gráf-alapú mezők
             'parent_family_id': self.parent_family_id,
             'adoptive_family_id': self.adoptive_family_id,
             'is_twin': self.is_twin,
             'birth_order': self.birth_order,
-            'spouse_family_ids': [f.id for f in self.spouse_families],
+            'spouse_family_ids': spouse_family_ids,
             # Szülők (gráf-alapú modellből)
-            'parents': [{'id': p.id, 'name': p.full_name} for p in self.parents],
+            'parents': parents,
             # Számított mezők
             'age': self.age,
             'is_alive': self.is_alive,
@@ -262,8 +295,8 @@ class Marriage(db.Model):
     # ========== PARTNEREK ==========
     # Partner1 és Partner2 - NEM "apa" és "anya"!
     # Így kezelhető: azonos nemű párok, ismeretlen szülő, stb.
-    person1_id = db.Column(db.Integer, db.ForeignKey('persons.id'), nullable=True)  # Lehet NULL: ismeretlen szülő
-    person2_id = db.Column(db.Integer, db.ForeignKey('persons.id'), nullable=True)  # Lehet NULL: egyedülálló szülő
+    person1_id = db.Column(db.Integer, db.ForeignKey('persons.id'), nullable=True, index=True)  # Lehet NULL: ismeretlen szülő
+    person2_id = db.Column(db.Integer, db.ForeignKey('persons.id'), nullable=True, index=True)  # Lehet NULL: egyedülálló szülő
     
     # ========== KAPCSOLAT TÍPUSA ==========
     relationship_type = db.Column(db.String(50), default='marriage')
@@ -284,6 +317,9 @@ class Marriage(db.Model):
     # Megjegyzések
     notes = db.Column(db.Text)
     
+    # Soft delete (a DeletedRecord-dal szinkronban tartva, indexelt szűréshez)
+    deleted_at = db.Column(db.DateTime, index=True)
+    
     # Kapcsolatok
     person1 = db.relationship('Person', foreign_keys=[person1_id], backref='families_as_partner1')
     person2 = db.relationship('Person', foreign_keys=[person2_id], backref='families_as_partner2')
@@ -294,7 +330,7 @@ class Marriage(db.Model):
         A családhoz tartozó gyerekek lekérdezése.
         Gyerek = olyan Person, akinek parent_family_id == self.id
         """
-        return Person.query.filter_by(parent_family_id=self.id).all()
+        return load_persons(kinship_index.family_children_ids(self.id))
     
     @property
     def partner_ids(self):
@@ -310,12 +346,75 @@ class Marriage(db.Model):
         return None
     
     def to_dict(self):
+        children = [{'id': c.id, 'name': c.full_name} for c in self.children]
+        return self._to_dict(
+            self.person1.full_name if self.person1 else None,
+            self.person2.full_name if self.person2 else None,
+            children
+        )
+    
+    @staticmethod
+    def children_map(family_ids, details=False, criteria=()):
+        """
+        A családok gyerekei egyetlen lekérdezéssel, család szerint csoportosítva.
+        
+        Args:
+            family_ids: család ID-k
+            details: születési dátum, iker és születési sorrend is kell-e
+            criteria: további szűrőfeltételek a Person lekérdezéshez (pl. soft delete)
+            
+        Returns:
+            dict: family_id -> [{'id', 'name', ...}] születési sorrendben
+        """
+        query = db.session.query(
+            Person.parent_family_id, Person.id, Person.last_name, Person.first_name,
+            Person.middle_name, Person.birth_date, Person.is_twin, Person.birth_order
+        ).filter(*criteria).order_by(Person.birth_order, Person.birth_date, Person.id)
+        
+        result = {family_id: [] for family_id in family_ids}
+        for family_id, pid, last_name, first_name, middle_name, birth_date, is_twin, birth_order \
+                in select_in(query, Person.parent_family_id, family_ids):
+            child = {'id': pid, 'name': format_full_name(last_name, first_name, middle_name)}
+            if details:
+                child['birth_date'] = birth_date.isoformat() if birth_date else None
+                child['is_twin'] = is_twin
+                child['birth_order'] = birth_order
+            result[family_id].append(child)
+        return result
+    
+    @staticmethod
+    def to_dict_many(families, include_details=False, child_criteria=()):
+        """
+        Több család szerializálása kötegelten: a gyerekek egy lekérdezéssel
+        (parent_family_id szerint csoportosítva), a partnerek nevei egy másikkal.
+        include_details esetén 'children_details' mezőt is ad (mint a get_family).
+        """
+        family_ids = [f.id for f in families]
+        children = Marriage.children_map(family_ids, details=include_details, criteria=child_criteria)
+        names = Person.names_by_id(
+            {pid for f in families for pid in (f.person1_id, f.person2_id) if pid is not None}
+        )
+        
+        result = []
+        for family in families:
+            family_children = children.get(family.id, [])
+            data = family._to_dict(
+                names.get(family.person1_id),
+                names.get(family.person2_id),
+                [{'id': c['id'], 'name': c['name']} for c in family_children]
+            )
+            if include_details:
+                data['children_details'] = family_children
+            result.append(data)
+        return result
+    
+    def _to_dict(self, person1_name, person2_name, children):
         return {
             'id': self.id,
             'person1_id': self.person1_id,
             'person2_id': self.person2_id,
-            'person1_name': self.person1.full_name if self.person1 else None,
-            'person2_name': self.person2.full_name if self.person2 else None,
+            'person1_name': person1_name,
+            'person2_name': person2_name,
             'relationship_type': self.relationship_type,
             'status': self.status or 'active',
             'start_date': self.start_date.isoformat() if self.start_date else None,
@@ -323,8 +422,8 @@ class Marriage(db.Model):
             'end_reason': self.end_reason,
             'marriage_place': self.marriage_place,
             'notes': self.notes,
-            'children_ids': [c.id for c in self.children],
-            'children': [{'id': c.id, 'name': c.full_name} for c in self.children]
+            'children_ids': [c['id'] for c in children],
+            'children': children
         }
 
 
@@ -343,13 +442,16 @@ class Event(db.Model):
     __tablename__ = 'events'
     
     id = db.Column(db.Integer, primary_key=True)
-    person_id = db.Column(db.Integer, db.ForeignKey('persons.id'), nullable=False)
+    person_id = db.Column(db.Integer, db.ForeignKey('persons.id'), nullable=False, index=True)
     
     event_type = db.Column(db.String(100), nullable=False)  # baptism, confirmation, graduation, military, immigration, etc.
     event_date = db.Column(db.Date)
     event_place = db.Column(db.String(200))
     description = db.Column(db.Text)
     
+    # Soft delete
+    deleted_at = db.Column(db.DateTime, index=True)
+    
     # Kapcsolat
     person = db.relationship('Person', backref='events')
     
@@ -369,7 +471,7 @@ class Document(db.Model):
     __tablename__ = 'documents'
     
     id = db.Column(db.Integer, primary_key=True)
-    person_id = db.Column(db.Integer, db.ForeignKey('persons.id'))
+    person_id = db.Column(db.Integer, db.ForeignKey('persons.id'), index=True)
     
     document_type = db.Column(db.String(50))  # photo, certificate, letter, etc.
     title = db.Column(db.String(200))
@@ -378,6 +480,9 @@ class Document(db.Model):
     file_type = db.Column(db.String(50))  # image, pdf, etc.
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Soft delete
+    deleted_at = db.Column(db.DateTime, index=True)
+    
     # Kapcsolat
     person = db.relationship('Person', backref='documents')
     
@@ -394,6 +499,26 @@ class Document(db.Model):
         }
 
 
+class UploadRef(db.Model):
+    """
+    Feltöltött fájl hivatkozás: melyik személy profilképe / dokumentum
+    melyik tartalom-címzett fájlra (blob) mutat (app/upload_store.py).
+    A nem hivatkozott blobokat a háttérben futó takarítás törli.
+    """
+    __tablename__ = 'upload_refs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    blob = db.Column(db.String(80), nullable=False, index=True)  # <sha256>.<kiterjesztés>
+    entity_type = db.Column(db.String(20), nullable=False)  # person (profilkép), document
+    entity_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Entitásonként egy fájl
+    __table_args__ = (
+        db.UniqueConstraint('entity_type', 'entity_id', name='unique_upload_ref_entity'),
+    )
+
+
 class TreeSettings(db.Model):
     """Családfa megjelenítési beállítások"""
     __tablename__ = 'tree_settings'
@@ -469,6 +594,11 @@ class DeletedRecord(db.Model):
     entity_id = db.Column(db.Integer, nullable=False)
     deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Egy entitás csak egyszer lehet a lomtárban; az index a keresést is kiszolgálja
+    __table_args__ = (
+        db.Index('uq_deleted_records_entity', 'entity_type', 'entity_id', unique=True),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -518,7 +648,7 @@ class BackupLog(db.Model):
     file_size = db.Column(db.Integer)  # bytes
     trigger = db.Column(db.String(50))  # auto, manual, scheduled
     description = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     def to_dict(self):
         return {
@@ -531,13 +661,61 @@ class BackupLog(db.Model):
         }
 
 
+class ChangeJournal(db.Model):
+    """
+    Append-only változásnapló: minden adatmódosítás előtte/utána képe.
+    Pont-időpontra visszaállításhoz és inkrementális mentéshez (app/journal.py).
+    """
+    __tablename__ = 'change_journal'
+    
+    seq = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    row_id = db.Column(db.Integer)
+    operation = db.Column(db.String(10), nullable=False)  # insert, update, delete, bulk
+    before = db.Column(db.Text)  # JSON; update-nél csak a változott oszlopok
+    after = db.Column(db.Text)  # JSON; update-nél csak a változott oszlopok
+    
+    # A sorszám törlés (ritkítás) után sem használódik fel újra
+    __table_args__ = {'sqlite_autoincrement': True}
+
+
+class DuplicateCandidate(db.Model):
+    """Lehetséges duplikált személypár - a duplikátum kereső (app/duplicates.py) eredménye"""
+    __tablename__ = 'duplicate_candidates'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    person1_id = db.Column(db.Integer, db.ForeignKey('persons.id'), nullable=False)  # person1_id < person2_id
+    person2_id = db.Column(db.Integer, db.ForeignKey('persons.id'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False, index=True)  # 0..1
+    reasons = db.Column(db.Text)  # JSON: részpontszámok (név, születés, hely, szülők)
+    status = db.Column(db.String(20), default='open')  # open, dismissed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('person1_id', 'person2_id', name='unique_duplicate_pair'),
+    )
+    
+    def to_dict(self):
+        import json
+        return {
+            'id': self.id,
+            'person1_id': self.person1_id,
+            'person2_id': self.person2_id,
+            'score': self.score,
+            'reasons': json.loads(self.reasons) if self.reasons else {},
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
 class NodePosition(db.Model):
     """Családfa csomópontok egyedi pozíciói - drag & drop után mentett helyzetek"""
     __tablename__ = 'node_positions'
     
     id = db.Column(db.Integer, primary_key=True)
     person_id = db.Column(db.Integer, db.ForeignKey('persons.id'), nullable=False)
-    root_person_id = db.Column(db.Integer, db.ForeignKey('persons.id'), nullable=False)  # Melyik root személynél érvényes ez a pozíció
+    root_person_id = db.Column(db.Integer, db.ForeignKey('persons.id'), nullable=False, index=True)  # Melyik root személynél érvényes ez a pozíció
     
     # Pozíció koordináták
     x = db.Column(db.Float, nullable=False)
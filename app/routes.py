@@ -1,17 +1,35 @@
 
-from flask import Blueprint, render_template, request, jsonify, current_app, redirect, url_for, session
+from flask import (
+    Blueprint, render_template, request, jsonify, current_app, redirect, url_for, session,
+    Response, stream_with_context, send_file
+)
 from werkzeug.utils import secure_filename
 from app import db
-from app.models import Person, Marriage, Event, Document, TreeSettings, DeletedRecord, AppSettings, BackupLog, NodePosition
+from app.models import Person, Marriage, Event, Document, TreeSettings, DeletedRecord, AppSettings, BackupLog, NodePosition, DuplicateCandidate
 from app.auth import (
     login_required, api_login_required, is_authenticated, 
     login_user, logout_user, verify_password, change_password
 )
-from app.backup import backup_manager, auto_backup_on_change
-from sqlalchemy import exists
+from app.backup import backup_manager
+from app.auto_backup import auto_backup_coordinator
+from app.journal import journal
+from app.kinship import kinship_index, load_persons
+from app import lineage
+from app import search as search_index
+from app import duplicates
+from app import gedcom
+from app import gedcom_import
+from app import json_import
+from app import json_export
+from app import thumbnails
+from app import sprites
+from app import upload_store
+from app.suggest import suggest_index, DEFAULT_LIMIT as SUGGEST_DEFAULT_LIMIT, MAX_LIMIT as SUGGEST_MAX_LIMIT
+from app.stats import stats_cache
+from app.analytics import analytics_cache
 import os
 import json
-from datetime import datetime
+from datetime import datetime, timezone
 
 # Blueprint-ek létrehozása
 main_bp = Blueprint('main', __name__)
@@ -21,19 +39,42 @@ api_bp = Blueprint('api', __name__)
 # Megengedett fájltípusok
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx'}
 
+# Soft delete: entitás típus -> modell
+SOFT_DELETE_MODELS = {
+    'person': Person,
+    'marriage': Marriage,
+    'event': Event,
+    'document': Document
+}
+
 # Soft delete helper
+# A törlési állapot az entitás indexelt deleted_at oszlopában is megvan,
+# így a szűrés nem igényel soronkénti al-lekérdezést a deleted_records táblára.
 def not_deleted_filter(model, entity_type):
-    return ~exists().where((DeletedRecord.entity_type == entity_type) & (DeletedRecord.entity_id == model.id))
+    return model.deleted_at.is_(None)
 
 def mark_deleted(entity_type, entity_id):
     # Ha már jelölve, ne duplikáljuk
     existing = DeletedRecord.query.filter_by(entity_type=entity_type, entity_id=entity_id).first()
     if existing:
         return existing
-    rec = DeletedRecord(entity_type=entity_type, entity_id=entity_id)
+    rec = DeletedRecord(entity_type=entity_type, entity_id=entity_id, deleted_at=datetime.utcnow())
     db.session.add(rec)
+    
+    model = SOFT_DELETE_MODELS.get(entity_type)
+    instance = db.session.get(model, entity_id) if model else None
+    if instance:
+        instance.deleted_at = rec.deleted_at
     return rec
 
+def unmark_deleted(record):
+    """Lomtár bejegyzés törlése és az entitás tombstone-jának visszavonása"""
+    model = SOFT_DELETE_MODELS.get(record.entity_type)
+    instance = db.session.get(model, record.entity_id) if model else None
+    if instance:
+        instance.deleted_at = None
+    db.session.delete(record)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -95,30 +136,78 @@ def api_change_password():
 @api_bp.route('/backups', methods=['GET'])
 @api_login_required
 def list_backups():
-    """Összes backup listázása"""
-    return jsonify(backup_manager.list_backups())
+    """Backup-ok listázása (legújabb elöl; opcionális limit / offset lapozás)"""
+    limit = request.args.get('limit', type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if limit is not None and limit < 1:
+        return jsonify({'error': 'Érvénytelen limit'}), 400
+    return jsonify(backup_manager.list_backups(limit=limit, offset=max(offset, 0)))
 
 
 @api_bp.route('/backups', methods=['POST'])
 @api_login_required
 def create_backup():
-    """Új backup létrehozása"""
-    data = request.get_json() or {}
+    """Új backup indítása háttérben (az állapot a /backups/jobs/<job_id> végponton)"""
+    data = request.get_json(silent=True) or {}
     description = data.get('description', 'Manuális mentés')
     
-    result = backup_manager.create_backup(trigger='manual', description=description)
+    job = backup_manager.start_backup(trigger='manual', description=description)
+    return jsonify(job), 202
+
+
+@api_bp.route('/backups/jobs/<job_id>', methods=['GET'])
+@api_login_required
+def get_backup_job(job_id):
+    """Backup job állapota (running / done / error, integritás ellenőrzés eredménye)"""
+    job = backup_manager.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Backup job nem található'}), 404
+    return jsonify(job)
+
+
+def _parse_restore_point(value):
+    """ISO időpont -> naiv UTC datetime (időzóna nélkül UTC-nek vesszük)"""
+    point = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if point.tzinfo is not None:
+        point = point.astimezone(timezone.utc).replace(tzinfo=None)
+    return point
+
+
+@api_bp.route('/backups/<int:backup_id>/restore', methods=['POST'])
+@api_login_required
+def restore_backup(backup_id):
+    """Backup visszaállítása; opcionális 'until' időpontig előregörgetve a változásnaplóból"""
+    data = request.get_json(silent=True) or {}
+    until = None
+    if data.get('until'):
+        try:
+            until = _parse_restore_point(data['until'])
+        except ValueError:
+            return jsonify({'error': 'Érvénytelen időpont'}), 400
+    if gedcom_import.is_running(current_app):
+        return jsonify({'error': 'Fut egy GEDCOM import, a visszaállítás utána lehetséges'}), 409
+    
+    result = backup_manager.restore_backup(backup_id, until=until)
     
     if 'error' in result:
-        return jsonify(result), 500
+        return jsonify(result), 400
     
     return jsonify(result)
 
 
-@api_bp.route('/backups/<int:backup_id>/restore', methods=['POST'])
+@api_bp.route('/backups/restore', methods=['POST'])
 @api_login_required
-def restore_backup(backup_id):
-    """Backup visszaállítása"""
-    result = backup_manager.restore_backup(backup_id)
+def restore_to_time():
+    """Pont-időpontra visszaállítás (legutóbbi teljes mentés + változásnapló)"""
+    data = request.get_json(silent=True) or {}
+    try:
+        until = _parse_restore_point(data['until'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Hiányzó vagy érvénytelen időpont (until)'}), 400
+    if gedcom_import.is_running(current_app):
+        return jsonify({'error': 'Fut egy GEDCOM import, a visszaállítás utána lehetséges'}), 409
+    
+    result = backup_manager.restore_to_time(until)
     
     if 'error' in result:
         return jsonify(result), 400
@@ -126,6 +215,13 @@ def restore_backup(backup_id):
     return jsonify(result)
 
 
+@api_bp.route('/backups/journal', methods=['GET'])
+@api_login_required
+def backup_journal_status():
+    """Változásnapló állapota (szállított szegmensek, legkorábbi visszaállítási pont)"""
+    return jsonify(journal.get_status())
+
+
 @api_bp.route('/backups/<int:backup_id>', methods=['DELETE'])
 @api_login_required
 def delete_backup(backup_id):
@@ -141,8 +237,10 @@ def delete_backup(backup_id):
 @api_bp.route('/backups/stats', methods=['GET'])
 @api_login_required
 def backup_stats():
-    """Backup statisztikák"""
-    return jsonify(backup_manager.get_backup_stats())
+    """Backup statisztikák (az automatikus mentés állapotával és késésével)"""
+    stats = backup_manager.get_backup_stats()
+    stats['auto_backup'] = auto_backup_coordinator.get_status()
+    return jsonify(stats)
 
 
 # ==================== FŐOLDAL ====================
@@ -160,7 +258,17 @@ def index():
 def get_persons():
     """Összes személy lekérdezése"""
     persons = Person.query.filter(not_deleted_filter(Person, 'person')).all()
-    return jsonify([p.to_dict() for p in persons])
+    return jsonify(Person.to_dict_many(persons))
+
+
+@api_bp.route('/persons/suggest', methods=['GET'])
+@api_login_required
+def suggest_persons():
+    """Névjavaslatok gépelés közben (memóriabeli prefix index, SQL nélkül)"""
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', SUGGEST_DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, SUGGEST_MAX_LIMIT))
+    return jsonify(suggest_index.suggest(query, limit))
 
 
 @api_bp.route('/persons/<int:person_id>', methods=['GET'])
@@ -286,14 +394,33 @@ def upload_photo(person_id):
         return jsonify({'error': 'Nincs kiválasztott fájl'}), 400
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(f"person_{person_id}_{file.filename}")
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        try:
+            blob, created = upload_store.save_stream(file.stream, upload_store.extension(file.filename), upload_folder)
+        except upload_store.UploadStoreError as e:
+            return jsonify({'error': str(e)}), 500
+        photo_path = upload_store.blob_url(blob)
+        
+        # Azonos tartalom már meglévő bélyegképekkel: nem kell újra elkészíteni
+        if thumbnails.is_available() and (created or not thumbnails.thumbnail_urls(photo_path)):
+            target_dir = thumbnails.thumb_dir(upload_folder)
+            try:
+                thumbnails.generate_thumbnails(os.path.join(upload_folder, blob), target_dir)
+            except thumbnails.ThumbnailError:
+                if created:
+                    os.remove(os.path.join(upload_folder, blob))
+                    thumbnails.remove_thumbnails(blob, target_dir)
+                return jsonify({'error': 'A fájl nem olvasható képként'}), 400
         
-        person.photo_path = f'/static/uploads/{filename}'
+        person.photo_path = photo_path
+        upload_store.set_reference('person', person.id, blob)
         db.session.commit()
+        upload_store.upload_collector.schedule(current_app._get_current_object())
         
-        return jsonify({'photo_path': person.photo_path})
+        return jsonify({
+            'photo_path': person.photo_path,
+            'photo_thumbs': thumbnails.thumbnail_urls(person.photo_path)
+        })
     
     return jsonify({'error': 'Nem megengedett fájltípus'}), 400
 
@@ -308,7 +435,7 @@ def upload_photo(person_id):
 def get_marriages():
     """Összes család/házasság lekérdezése"""
     marriages = Marriage.query.filter(not_deleted_filter(Marriage, 'marriage')).all()
-    return jsonify([m.to_dict() for m in marriages])
+    return jsonify(Marriage.to_dict_many(marriages))
 
 
 @api_bp.route('/families/<int:family_id>', methods=['GET'])
@@ -321,15 +448,8 @@ def get_family(family_id):
         Marriage.id == family_id
     ).first_or_404()
     
-    result = family.to_dict()
-    # Gyerekek részletes adatai
-    result['children_details'] = [{
-        'id': c.id,
-        'name': c.full_name,
-        'birth_date': c.birth_date.isoformat() if c.birth_date else None,
-        'is_twin': c.is_twin,
-        'birth_order': c.birth_order
-    } for c in family.children]
+    # Gyerekek részletes adataival (children_details)
+    result = Marriage.to_dict_many([family], include_details=True)[0]
     return jsonify(result)
 
 
@@ -486,18 +606,10 @@ def get_family_children(family_id):
         Marriage.id == family_id
     ).first_or_404()
     
-    children = Person.query.filter(
-        not_deleted_filter(Person, 'person'),
-        Person.parent_family_id == family_id
-    ).order_by(Person.birth_order, Person.birth_date).all()
-    
-    return jsonify([{
-        'id': c.id,
-        'name': c.full_name,
-        'birth_date': c.birth_date.isoformat() if c.birth_date else None,
-        'is_twin': c.is_twin,
-        'birth_order': c.birth_order
-    } for c in children])
+    children = Marriage.children_map(
+        [family.id], details=True, criteria=[not_deleted_filter(Person, 'person')]
+    )
+    return jsonify(children[family.id])
 
 
 @api_bp.route('/families/<int:family_id>/children', methods=['POST'])
@@ -636,24 +748,29 @@ def upload_document():
         return jsonify({'error': 'Nincs kiválasztott fájl'}), 400
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(f"doc_{datetime.now().strftime('%Y%m%d%H%M%S')}_{file.filename}")
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        try:
+            blob, _created = upload_store.save_stream(
+                file.stream, upload_store.extension(file.filename), current_app.config['UPLOAD_FOLDER']
+            )
+        except upload_store.UploadStoreError as e:
+            return jsonify({'error': str(e)}), 500
         
         # Fájl típus meghatározása
-        ext = filename.rsplit('.', 1)[1].lower()
+        ext = upload_store.extension(file.filename)
         file_type = 'image' if ext in {'png', 'jpg', 'jpeg', 'gif'} else 'document'
         
         document = Document(
             person_id=request.form.get('person_id'),
             document_type=request.form.get('document_type', 'other'),
-            title=request.form.get('title', filename),
+            title=request.form.get('title', secure_filename(file.filename)),
             description=request.form.get('description'),
-            file_path=f'/static/uploads/{filename}',
+            file_path=upload_store.blob_url(blob),
             file_type=file_type
         )
         
         db.session.add(document)
+        db.session.flush()
+        upload_store.set_reference('document', document.id, blob)
         db.session.commit()
         
         return jsonify(document.to_dict()), 201
@@ -700,6 +817,7 @@ def get_tree_data():
             'birth_place': person.birth_place,
             'occupation': person.occupation,
             'photo': person.photo_path,
+            'photo_thumbs': thumbnails.thumbnail_urls(person.photo_path),
             'is_alive': person.is_alive,
             'age': person.age,
             # Gráf-alapú mezők
@@ -747,44 +865,67 @@ def get_tree_data():
 @api_bp.route('/tree/ancestors/<int:person_id>', methods=['GET'])
 @api_login_required
 def get_ancestors(person_id):
-    """Ősök lekérdezése (felmenők)"""
-    def get_ancestors_recursive(person, depth=0, max_depth=10):
-        if not person or depth > max_depth:
-            return []
-        
-        ancestors = [{'person': person.to_dict(), 'depth': depth}]
-        
-        # GRÁF-ALAPÚ MODELL: szülők a parent_family-n keresztül
-        for parent in person.parents:
-            ancestors.extend(get_ancestors_recursive(parent, depth + 1, max_depth))
-        
-        return ancestors
+    """Ősök lekérdezése (felmenők)
     
+    Query paraméter: max_depth (alapértelmezett 10)
+    A többször előforduló ősök (ősösszeomlás) második előfordulása
+    visszahivatkozás: {'ref': <person_id>, 'depth': n}
+    """
     person = Person.query.get_or_404(person_id)
-    ancestors = get_ancestors_recursive(person)
-    
-    return jsonify(ancestors)
+    max_depth = request.args.get('max_depth', lineage.DEFAULT_MAX_DEPTH, type=int)
+    return jsonify(lineage.get_ancestors(person.id, max_depth))
 
 
 @api_bp.route('/tree/descendants/<int:person_id>', methods=['GET'])
 @api_login_required
 def get_descendants(person_id):
-    """Leszármazottak lekérdezése"""
-    def get_descendants_recursive(person, depth=0, max_depth=10):
-        if not person or depth > max_depth:
-            return []
-        
-        descendants = [{'person': person.to_dict(), 'depth': depth}]
-        
-        for child in person.children:
-            descendants.extend(get_descendants_recursive(child, depth + 1, max_depth))
-        
-        return descendants
+    """Leszármazottak lekérdezése
     
+    Query paraméter: max_depth (alapértelmezett 10)
+    """
     person = Person.query.get_or_404(person_id)
-    descendants = get_descendants_recursive(person)
+    max_depth = request.args.get('max_depth', lineage.DEFAULT_MAX_DEPTH, type=int)
+    return jsonify(lineage.get_descendants(person.id, max_depth))
+
+
+@api_bp.route('/tree/avatars', methods=['GET', 'POST'])
+@api_login_required
+def get_avatar_atlas():
+    """Profilkép sprite atlasz: egy kép + személyenkénti eltolások
+    
+    Személyek: 'ids' (GET: vesszővel elválasztva, POST: JSON lista), vagy
+    'root' + 'depth' (felmenők, leszármazottak és partnereik).
+    Opcionális 'size' (64 vagy 128, alapból 128).
+    """
+    params = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    try:
+        size = int(params.get('size', sprites.DEFAULT_SIZE))
+        if params.get('root') is not None:
+            root = Person.query.get_or_404(int(params['root']))
+            depth = int(params.get('depth', lineage.DEFAULT_MAX_DEPTH))
+            person_ids = lineage.get_lineage_ids(root.id, depth)
+        else:
+            ids = params.get('ids') or []
+            if isinstance(ids, str):
+                ids = ids.split(',')
+            person_ids = {int(pid) for pid in ids}
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Érvénytelen paraméter'}), 400
     
-    return jsonify(descendants)
+    try:
+        return jsonify(sprites.get_atlas(person_ids, size))
+    except sprites.SpriteError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@api_bp.route('/tree/avatars/<filename>', methods=['GET'])
+@api_login_required
+def get_avatar_atlas_image(filename):
+    """Gyorsítótárazott atlasz kép (tartalom-címzett, korlátlanul cache-elhető)"""
+    path = sprites.atlas_path(filename)
+    if path is None:
+        return jsonify({'error': 'Az atlasz nem található'}), 404
+    return send_file(path, max_age=365 * 24 * 3600)
 
 
 # ==================== BEÁLLÍTÁSOK API ====================
@@ -796,8 +937,11 @@ def fan_chart(person_id):
     Sunburst/fan chart nézethez: visszaad egy D3 hierarchy-kompatibilis JSON-t,
     ahol a root a kiválasztott személy, a 'children' a szülők (és azok szülei, stb.).
     """
-    def build_ancestor_tree(person, depth=0, max_depth=10):
-        if not person or depth > max_depth:
+    def build_ancestor_tree(pid, depth=0, max_depth=10):
+        if depth > max_depth:
+            return None
+        person = persons.get(pid)
+        if not person:
             return None
         node = {
             'id': person.id,
@@ -808,9 +952,8 @@ def fan_chart(person_id):
             'children': []
         }
         # Szülők (parent_family-n keresztül)
-        parents = person.parents
-        for parent in parents:
-            parent_node = build_ancestor_tree(parent, depth+1, max_depth)
+        for parent_id in kinship_index.parent_ids(pid):
+            parent_node = build_ancestor_tree(parent_id, depth+1, max_depth)
             if parent_node:
                 node['children'].append(parent_node)
         # Ha nincs szülő, legyen üres children (D3 sunburst igényli)
@@ -818,8 +961,18 @@ def fan_chart(person_id):
             node['children'] = []
         return node
 
+    def collect_ancestor_ids(pid, depth=0, max_depth=10):
+        if depth > max_depth:
+            return []
+        ids = [pid]
+        for parent_id in kinship_index.parent_ids(pid):
+            ids.extend(collect_ancestor_ids(parent_id, depth + 1, max_depth))
+        return ids
+
     person = Person.query.get_or_404(person_id)
-    tree = build_ancestor_tree(person)
+    # Az összes érintett ős egyetlen lekérdezéssel
+    persons = {p.id: p for p in load_persons(list(dict.fromkeys(collect_ancestor_ids(person.id))))}
+    tree = build_ancestor_tree(person.id)
     return jsonify(tree)
 
 @api_bp.route('/settings', methods=['GET'])
@@ -863,63 +1016,42 @@ def update_settings():
 @api_bp.route('/export/gedcom', methods=['GET'])
 @api_login_required
 def export_gedcom():
-    """Export GEDCOM formátumban (genealógiai standard)"""
-    persons = Person.query.filter(not_deleted_filter(Person, 'person')).all()
-    marriages = Marriage.query.filter(not_deleted_filter(Marriage, 'marriage')).all()
-    
-    gedcom = "0 HEAD\n"
-    gedcom += "1 SOUR FamilySearch\n"
-    gedcom += "1 GEDC\n"
-    gedcom += "2 VERS 5.5.1\n"
-    gedcom += "1 CHAR UTF-8\n"
+    """Export GEDCOM formátumban (genealógiai standard), folyamként"""
+    return Response(
+        stream_with_context(gedcom.generate_gedcom()),
+        mimetype='text/plain',
+        headers={'Content-Disposition': 'attachment; filename=family_tree.ged'}
+    )
+
+
+@api_bp.route('/import/gedcom', methods=['POST'])
+@api_login_required
+def import_gedcom():
+    """GEDCOM fájl importálása a meglévő fába (háttérben; állapot: GET /api/import/gedcom)"""
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({'error': 'Nincs fájl kiválasztva'}), 400
     
-    # Személyek
-    for person in persons:
-        gedcom += f"0 @I{person.id}@ INDI\n"
-        gedcom += f"1 NAME {person.first_name} /{person.last_name}/\n"
-        
-        if person.gender == 'male':
-            gedcom += "1 SEX M\n"
-        elif person.gender == 'female':
-            gedcom += "1 SEX F\n"
-        
-        if person.birth_date:
-            gedcom += "1 BIRT\n"
-            gedcom += f"2 DATE {person.birth_date.strftime('%d %b %Y').upper()}\n"
-            if person.birth_place:
-                gedcom += f"2 PLAC {person.birth_place}\n"
-        
-        if person.death_date:
-            gedcom += "1 DEAT\n"
-            gedcom += f"2 DATE {person.death_date.strftime('%d %b %Y').upper()}\n"
-            if person.death_place:
-                gedcom += f"2 PLAC {person.death_place}\n"
-        
-        if person.occupation:
-            gedcom += f"1 OCCU {person.occupation}\n"
-    
-    # Családok (házasságok)
-    for i, marriage in enumerate(marriages, 1):
-        gedcom += f"0 @F{i}@ FAM\n"
-        gedcom += f"1 HUSB @I{marriage.person1_id}@\n"
-        gedcom += f"1 WIFE @I{marriage.person2_id}@\n"
-        
-        if marriage.start_date:
-            gedcom += "1 MARR\n"
-            gedcom += f"2 DATE {marriage.start_date.strftime('%d %b %Y').upper()}\n"
-        
-        # Gyerekek hozzáadása (parent_family_id alapján)
-        children = Person.query.filter(
-            Person.parent_family_id == marriage.id
-        ).all()
-        
-        for child in children:
-            gedcom += f"1 CHIL @I{child.id}@\n"
+    import tempfile
     
-    gedcom += "0 TRLR\n"
+    import_dir = os.path.join(current_app.config['DATA_DIR'], 'imports')
+    os.makedirs(import_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=import_dir, suffix='.ged')
+    with os.fdopen(fd, 'wb') as f:
+        file.save(f)
     
-    return gedcom, 200, {'Content-Type': 'text/plain; charset=utf-8', 
-                         'Content-Disposition': 'attachment; filename=family_tree.ged'}
+    started, status = gedcom_import.start_import(current_app._get_current_object(), path, file.filename)
+    if not started:
+        os.remove(path)
+        return jsonify({'error': 'Már fut egy import', 'job': status}), 409
+    return jsonify(status), 202
+
+
+@api_bp.route('/import/gedcom', methods=['GET'])
+@api_login_required
+def get_gedcom_import_status():
+    """A GEDCOM import állapota és előrehaladása"""
+    return jsonify(gedcom_import.get_job_status(current_app))
 
 
 @api_bp.route('/export/json', methods=['GET'])
@@ -931,186 +1063,56 @@ def export_json():
     events = Event.query.filter(not_deleted_filter(Event, 'event')).all()
     
     data = {
-        'persons': [p.to_dict() for p in persons],
-        'marriages': [m.to_dict() for m in marriages],
+        'persons': Person.to_dict_many(persons),
+        'marriages': Marriage.to_dict_many(marriages),
         'events': [e.to_dict() for e in events],
         'export_date': datetime.utcnow().isoformat()
     }
     
-    return jsonify(data)
+    # Nem jsonify: az rendezi a kulcsokat, a JSON import viszont a 'persons'
+    # szakaszt várja elöl (különben a többit ideiglenes fájlba kell tennie)
+    return Response(json.dumps(data), mimetype='application/json')
+
+
+@api_bp.route('/export/ndjson', methods=['GET'])
+@api_login_required
+def export_ndjson():
+    """Teljes export NDJSON formátumban (soronként egy rekord, folyamként)"""
+    return Response(
+        stream_with_context(json_export.generate_ndjson()),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename=family_tree.ndjson'}
+    )
 
 
 @api_bp.route('/import/json', methods=['POST'])
 @api_login_required
 def import_json():
-    """Import JSON formátumból - teljes adatbázis csere"""
-    import shutil
-    from pathlib import Path
+    """Import JSON / NDJSON formátumból - teljes adatbázis csere (folyamként, egy tranzakcióban)"""
+    # Régi adatbázis mentése
+    backup = backup_manager.create_backup(trigger='auto', description='JSON import előtt')
     
-    data = request.get_json()
-    
-    # Adatbázis útvonal meghatározása
-    db_path = Path(current_app.instance_path).parent / 'data' / 'familytree.db'
-    backup_dir = Path(current_app.instance_path).parent / 'data' / 'backups'
-    backup_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Régi adatbázis mentése időbélyeggel
-    if db_path.exists():
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_path = backup_dir / f'familytree_backup_{timestamp}.db'
-        shutil.copy2(db_path, backup_path)
-    
-    # ÖSSZES meglévő adat törlése
     try:
-        Marriage.query.delete()
-        Event.query.delete()
-        Document.query.delete()
-        DeletedRecord.query.delete()
-        Person.query.delete()
-        db.session.commit()
+        ndjson = request.mimetype in json_import.NDJSON_MIMETYPES or request.args.get('format') == 'ndjson'
+        result = json_import.import_json(request.stream, ndjson=ndjson)
+    except json_import.JsonImportError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': f'Törlés hiba: {str(e)}'}), 500
-    
-    id_mapping = {}  # Régi ID -> Új ID mapping
-    marriage_id_mapping = {}  # Régi marriage ID -> Új marriage ID mapping
-    persons_with_parents = []  # (person, old_father_id, old_mother_id, old_parent_family_id)
-    
-    # 1. LÉPÉS: Személyek importálása szülők nélkül
-    for person_data in data.get('persons', []):
-        old_id = person_data.pop('id', None)
-        
-        # Számított mezők eltávolítása (ezeket a to_dict() generálja, de nem DB oszlopok)
-        for field in ['full_name', 'display_name', 'age', 'is_alive', 'created_at', 'updated_at', 
-                      'spouse_family_ids', 'parents']:
-            person_data.pop(field, None)
-        
-        # Dátumok konvertálása
-        if person_data.get('birth_date'):
-            try:
-                person_data['birth_date'] = datetime.fromisoformat(person_data['birth_date']).date()
-            except:
-                person_data['birth_date'] = None
-        if person_data.get('death_date'):
-            try:
-                person_data['death_date'] = datetime.fromisoformat(person_data['death_date']).date()
-            except:
-                person_data['death_date'] = None
-        
-        # Egyéni mezők - MINDIG stringgé alakítjuk ha dict
-        if 'custom_fields' in person_data:
-            if isinstance(person_data['custom_fields'], dict):
-                person_data['custom_fields'] = json.dumps(person_data['custom_fields'])
-            elif person_data['custom_fields'] is None:
-                person_data['custom_fields'] = '{}'
-        
-        # Szülő ID-k elmentése és eltávolítása (legacy és új modell)
-        old_father_id = person_data.pop('father_id', None)
-        old_mother_id = person_data.pop('mother_id', None)
-        old_parent_family_id = person_data.pop('parent_family_id', None)
-        person_data.pop('adoptive_family_id', None)  # Majd később állítjuk be
-        
-        try:
-            person = Person(**person_data)
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'error': f'Person létrehozás hiba: {str(e)}', 'fields': list(person_data.keys())}), 500
-        db.session.add(person)
-        db.session.flush()
-        
-        if old_id:
-            id_mapping[old_id] = person.id
-        
-        persons_with_parents.append((person, old_father_id, old_mother_id, old_parent_family_id))
-    
-    # 2. LÉPÉS: Házasságok importálása (ELŐBB, mert a parent_family_id-hez kellenek)
-    for marriage_data in data.get('marriages', []):
-        old_marriage_id = marriage_data.get('id')
-        old_person1_id = marriage_data.get('person1_id')
-        old_person2_id = marriage_data.get('person2_id')
-        
-        if old_person1_id in id_mapping and old_person2_id in id_mapping:
-            # Dátumok konvertálása
-            start_date = None
-            end_date = None
-            if marriage_data.get('start_date'):
-                try:
-                    start_date = datetime.fromisoformat(marriage_data['start_date']).date()
-                except:
-                    pass
-            if marriage_data.get('end_date'):
-                try:
-                    end_date = datetime.fromisoformat(marriage_data['end_date']).date()
-                except:
-                    pass
-            
-            marriage = Marriage(
-                person1_id=id_mapping[old_person1_id],
-                person2_id=id_mapping[old_person2_id],
-                relationship_type=marriage_data.get('relationship_type', 'marriage'),
-                status=marriage_data.get('status', 'active'),
-                start_date=start_date,
-                end_date=end_date,
-                end_reason=marriage_data.get('end_reason'),
-                marriage_place=marriage_data.get('marriage_place'),
-                notes=marriage_data.get('notes')
-            )
-            db.session.add(marriage)
-            db.session.flush()
-            
-            # Marriage ID mapping mentése
-            if old_marriage_id:
-                marriage_id_mapping[old_marriage_id] = marriage.id
-    
-    # 3. LÉPÉS: Szülő kapcsolatok frissítése az új modell szerint
-    # Segéd: Család keresése/létrehozása szülőpárhoz
-    def find_or_create_family(father_id, mother_id):
-        """Megkeresi vagy létrehozza a családot a szülőpár alapján"""
-        if not father_id or not mother_id:
-            return None
-        
-        # Keressük meg a meglévő családot
-        existing = Marriage.query.filter(
-            ((Marriage.person1_id == father_id) & (Marriage.person2_id == mother_id)) |
-            ((Marriage.person1_id == mother_id) & (Marriage.person2_id == father_id))
-        ).first()
-        
-        if existing:
-            return existing.id
-        
-        # Hozzunk létre újat
-        new_family = Marriage(
-            person1_id=father_id,
-            person2_id=mother_id,
-            relationship_type='partnership',
-            status='active'
-        )
-        db.session.add(new_family)
-        db.session.flush()
-        return new_family.id
-    
-    for person, old_father_id, old_mother_id, old_parent_family_id in persons_with_parents:
-        # Ha van parent_family_id, használjuk azt
-        if old_parent_family_id and old_parent_family_id in marriage_id_mapping:
-            person.parent_family_id = marriage_id_mapping[old_parent_family_id]
-        # Ha legacy father_id/mother_id van, konvertáljuk parent_family_id-re
-        elif old_father_id and old_mother_id:
-            new_father_id = id_mapping.get(old_father_id)
-            new_mother_id = id_mapping.get(old_mother_id)
-            if new_father_id and new_mother_id:
-                person.parent_family_id = find_or_create_family(new_father_id, new_mother_id)
-    
-    try:
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
+        current_app.logger.exception('JSON import hiba')
         return jsonify({'error': f'Mentés hiba: {str(e)}'}), 500
     
     return jsonify({
         'message': 'Import sikeres',
-        'imported_persons': len(data.get('persons', [])),
-        'imported_marriages': len(data.get('marriages', [])),
-        'backup_created': str(backup_path) if db_path.exists() else None
+        'imported_persons': result['persons'],
+        'imported_marriages': result['marriages'],
+        'imported_events': result['events'],
+        'imported_documents': result['documents'],
+        'imported_node_positions': result['node_positions'],
+        'imported_tree_settings': result['tree_settings'],
+        'created_families': result['created_families'],
+        'skipped_records': result['skipped'],
+        'duration_ms': result['duration_ms'],
+        'backup_created': backup.get('filename')
     })
 
 
@@ -1119,74 +1121,136 @@ def import_json():
 @api_bp.route('/search', methods=['GET'])
 @api_login_required
 def search():
-    """Keresés személyek között"""
+    """Keresés személyek között (FTS5, ékezetfüggetlen, relevancia szerint)"""
     query = request.args.get('q', '')
     
     if len(query) < 2:
         return jsonify([])
     
+    limit, offset = search_index.clamp_paging(
+        request.args.get('limit', type=int), request.args.get('offset', type=int)
+    )
+    
+    person_ids = search_index.search_person_ids(query, limit, offset)
+    if person_ids is not None:
+        return jsonify(Person.to_dict_many(load_persons(person_ids)))
+    
+    # Visszaesés: nincs FTS index
     persons = Person.query.filter(not_deleted_filter(Person, 'person')).filter(
         (Person.first_name.ilike(f'%{query}%')) |
         (Person.last_name.ilike(f'%{query}%')) |
         (Person.maiden_name.ilike(f'%{query}%')) |
         (Person.nickname.ilike(f'%{query}%'))
-    ).limit(20).all()
+    ).order_by(Person.id).offset(offset).limit(limit).all()
     
-    return jsonify([p.to_dict() for p in persons])
+    return jsonify(Person.to_dict_many(persons))
 
 
-# ==================== STATISZTIKÁK API ====================
+# ==================== DUPLIKÁTUMOK API ====================
 
-@api_bp.route('/stats', methods=['GET'])
+@api_bp.route('/duplicates', methods=['GET'])
 @api_login_required
-def get_stats():
-    """Statisztikák lekérdezése"""
-    active_persons = Person.query.filter(not_deleted_filter(Person, 'person'))
-    total_persons = active_persons.count()
-    living_persons = active_persons.filter(Person.death_date.is_(None)).count()
-    male_count = active_persons.filter_by(gender='male').count()
-    female_count = active_persons.filter_by(gender='female').count()
-    marriages_count = Marriage.query.filter(not_deleted_filter(Marriage, 'marriage')).count()
-    
-    # Legidősebb személy
-    oldest_living = active_persons.filter(
-        Person.death_date.is_(None),
-        Person.birth_date.isnot(None)
-    ).order_by(Person.birth_date).first()
-    
-    # Generációk száma (becsült)
-    earliest_birth = active_persons.filter(Person.birth_date.isnot(None)).order_by(Person.birth_date).first()
-    latest_birth = active_persons.filter(Person.birth_date.isnot(None)).order_by(Person.birth_date.desc()).first()
-    
-    generations = 1
-    if earliest_birth and latest_birth and earliest_birth.birth_date and latest_birth.birth_date:
-        years_span = (latest_birth.birth_date.year - earliest_birth.birth_date.year)
-        generations = max(1, years_span // 25 + 1)
+def get_duplicates():
+    """Lehetséges duplikált személypárok, pontszám szerint csökkenő sorrendben, lapozva"""
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 50, type=int)
+    min_score = request.args.get('min_score', type=float)
+    status = request.args.get('status', 'open')
+    
+    Person1 = db.aliased(Person)
+    Person2 = db.aliased(Person)
+    query = DuplicateCandidate.query.join(
+        Person1, Person1.id == DuplicateCandidate.person1_id
+    ).join(
+        Person2, Person2.id == DuplicateCandidate.person2_id
+    ).filter(
+        DuplicateCandidate.status == status,
+        Person1.deleted_at.is_(None),
+        Person2.deleted_at.is_(None)
+    )
+    if min_score is not None:
+        query = query.filter(DuplicateCandidate.score >= min_score)
+    
+    pagination = query.order_by(DuplicateCandidate.score.desc(), DuplicateCandidate.id).paginate(
+        page=page, per_page=per_page, max_per_page=200, error_out=False
+    )
+    
+    person_ids = list({pid for c in pagination.items for pid in (c.person1_id, c.person2_id)})
+    persons = {p.id: duplicates.person_summary(p) for p in load_persons(person_ids)}
+    
+    items = []
+    for candidate in pagination.items:
+        item = candidate.to_dict()
+        item['person1'] = persons.get(candidate.person1_id)
+        item['person2'] = persons.get(candidate.person2_id)
+        items.append(item)
     
     return jsonify({
-        'total_persons': total_persons,
-        'living_persons': living_persons,
-        'deceased_persons': total_persons - living_persons,
-        'male_count': male_count,
-        'female_count': female_count,
-        'unknown_gender_count': total_persons - male_count - female_count,
-        'marriages_count': marriages_count,
-        'estimated_generations': generations,
-        'oldest_living': oldest_living.to_dict() if oldest_living else None
+        'items': items,
+        'page': pagination.page,
+        'per_page': pagination.per_page,
+        'total': pagination.total,
+        'pages': pagination.pages,
+        'job': duplicates.get_job_status()
     })
 
 
+@api_bp.route('/duplicates/scan', methods=['GET'])
+@api_login_required
+def get_duplicate_scan():
+    """A duplikátum keresés állapota"""
+    return jsonify(duplicates.get_job_status())
+
+
+@api_bp.route('/duplicates/scan', methods=['POST'])
+@api_login_required
+def start_duplicate_scan():
+    """Duplikátum keresés indítása a háttérben"""
+    data = request.get_json(silent=True) or {}
+    try:
+        threshold = float(data.get('threshold', duplicates.DEFAULT_THRESHOLD))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Érvénytelen küszöbérték'}), 400
+    if not 0 < threshold <= 1:
+        return jsonify({'error': 'A küszöbérték 0 és 1 közötti szám'}), 400
+    
+    started, status = duplicates.start_scan(current_app._get_current_object(), threshold)
+    if not started:
+        return jsonify({'error': 'A keresés már fut', 'job': status}), 409
+    return jsonify(status), 202
+
+
+@api_bp.route('/duplicates/<int:candidate_id>/dismiss', methods=['POST'])
+@api_login_required
+def dismiss_duplicate(candidate_id):
+    """Pár elvetése: nem duplikátum, újrakereséskor sem jelenik meg"""
+    candidate = DuplicateCandidate.query.get_or_404(candidate_id)
+    candidate.status = 'dismissed'
+    db.session.commit()
+    return jsonify(candidate.to_dict())
+
+
+# ==================== STATISZTIKÁK API ====================
+
+@api_bp.route('/stats', methods=['GET'])
+@api_login_required
+def get_stats():
+    """Statisztikák lekérdezése (adatverzióhoz kötött cache-ből)"""
+    return jsonify(stats_cache.get())
+
+
+@api_bp.route('/analytics', methods=['GET'])
+@api_login_required
+def get_analytics():
+    """Demográfiai elemzések (élettartam, házassági kor, névgyakoriság, generációk)"""
+    return jsonify(analytics_cache.get())
+
+
 # ==================== LOMTÁR / VISSZAÁLLÍTÁS API ====================
 
 def _entity_to_dict(entity_type, entity_id):
     """Segédfüggvény: visszaadja az entitás to_dict-jét, ha létezik."""
-    model_map = {
-        'person': Person,
-        'marriage': Marriage,
-        'event': Event,
-        'document': Document
-    }
-    model = model_map.get(entity_type)
+    model = SOFT_DELETE_MODELS.get(entity_type)
     if not model:
         return None
     instance = model.query.get(entity_id)
@@ -1223,7 +1287,7 @@ def restore_from_trash():
     if not record:
         return jsonify({'error': 'Nem található a lomtárban'}), 404
 
-    db.session.delete(record)
+    unmark_deleted(record)
     db.session.commit()
 
     return jsonify({'status': 'restored', 'entity_type': entity_type, 'entity_id': entity_id})
@@ -1246,19 +1310,15 @@ def delete_permanently():
         db.session.delete(record)
 
     # Entitás törlése az adatbázisból
-    model_map = {
-        'person': Person,
-        'marriage': Marriage,
-        'event': Event,
-        'document': Document
-    }
-    model = model_map.get(entity_type)
+    model = SOFT_DELETE_MODELS.get(entity_type)
     if model:
         instance = model.query.get(entity_id)
         if instance:
             db.session.delete(instance)
     
     db.session.commit()
+    if entity_type in ('person', 'document'):
+        upload_store.upload_collector.schedule(current_app._get_current_object())
 
     return jsonify({'status': 'deleted', 'entity_type': entity_type, 'entity_id': entity_id})
 
@@ -0,0 +1,180 @@
+"""
+Teljes szöveges személykeresés SQLite FTS5 indexszel.
+
+A persons_fts egy külső tartalmú (content='persons') FTS5 tábla: csak az
+invertált indexet tárolja, a szöveget a persons táblából olvassa. A szinkront
+triggerek tartják fenn, így az ORM, a tömeges (core) írások és a kézi SQL is
+frissíti az indexet.
+
+A unicode61 tokenizáló remove_diacritics 2 beállítással az ékezeteket
+lehagyja mindkét oldalon: a "Kovacs" keresés megtalálja a "Kovács" nevet,
+az "Ördög" az "Ordog"-ot. A találatok BM25 szerint rendeződnek, a névmezők
+nagyobb súllyal.
+
+Ha az SQLite FTS5 nélkül van fordítva, vagy az index még nem létezik,
+a keresés a régi LIKE alapú szűrésre esik vissza.
+"""
+
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+
+
+FTS_TABLE = 'persons_fts'
+FTS_TRIGGERS = ('persons_fts_ai', 'persons_fts_ad', 'persons_fts_au')
+
+# Indexelt oszlop -> BM25 súly (a nevek számítanak a legtöbbet)
+FTS_COLUMNS = {
+    'first_name': 10.0,
+    'middle_name': 5.0,
+    'last_name': 10.0,
+    'maiden_name': 8.0,
+    'nickname': 8.0,
+    'birth_place': 2.0,
+    'death_place': 2.0,
+    'burial_place': 2.0,
+    'occupation': 2.0,
+    'biography': 1.0,
+}
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _column_list(prefix=''):
+    return ', '.join(f'{prefix}{name}' for name in FTS_COLUMNS)
+
+
+def _ddl():
+    """Az FTS tábla és a szinkron triggerek létrehozó utasításai"""
+    columns = _column_list()
+    new_values = _column_list('new.')
+    old_values = _column_list('old.')
+    return [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            {columns},
+            content='persons', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS persons_fts_ai AFTER INSERT ON persons BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS persons_fts_ad AFTER DELETE ON persons BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        END
+        """,
+        # Csak az indexelt oszlopok változása érinti az indexet (pl. deleted_at nem)
+        f"""
+        CREATE TRIGGER IF NOT EXISTS persons_fts_au AFTER UPDATE OF {columns} ON persons BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values});
+        END
+        """,
+    ]
+
+
+def fts5_supported(conn):
+    """Az SQLite könyvtár támogatja-e az FTS5-öt"""
+    return bool(conn.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar())
+
+
+def create_search_index(conn, rebuild=True):
+    """
+    Az FTS tábla és a triggerek létrehozása (idempotens), és az index
+    feltöltése a meglévő személyekből.
+
+    Returns:
+        bool: False, ha az SQLite nem támogatja az FTS5-öt
+    """
+    if not fts5_supported(conn):
+        return False
+    for statement in _ddl():
+        conn.execute(text(statement))
+    if rebuild:
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    return True
+
+
+@contextmanager
+def bulk_write(conn):
+    """
+    Tömeges írás a persons táblába a szinkron triggerek nélkül; a végén egy
+    teljes 'rebuild' (a soronkénti FTS frissítésnél nagyságrenddel olcsóbb).
+    A hívó már megnyitott írási tranzakciójában fut (a pysqlite a DDL előtt
+    magától nem nyit tranzakciót): rollback esetén a triggerek is visszaállnak.
+    """
+    if not conn.connection.dbapi_connection.in_transaction:
+        raise RuntimeError('bulk_write csak megnyitott írási tranzakcióban használható')
+    names = ', '.join(f"'{name}'" for name in FTS_TRIGGERS)
+    existing = conn.execute(text(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN ({names})"
+    )).scalar()
+    if not existing:
+        yield
+        return
+    for name in FTS_TRIGGERS:
+        conn.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+    yield
+    create_search_index(conn)
+
+
+def optimize_search_index(conn):
+    """Az index szegmenseinek összevonása (nagy importok után hasznos)"""
+    conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+
+
+def build_match_query(query):
+    """
+    Felhasználói keresőszöveg -> FTS5 MATCH kifejezés.
+    Minden szó prefix keresés, a szavak között ÉS kapcsolat; az FTS
+    operátorokat és idézőjeleket nem engedjük át.
+    """
+    tokens = _TOKEN_RE.findall(query)
+    return ' AND '.join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+
+
+def clamp_paging(limit, offset):
+    """limit/offset korlátozása értelmes tartományra"""
+    limit = DEFAULT_LIMIT if limit is None else max(1, min(int(limit), MAX_LIMIT))
+    offset = 0 if offset is None else max(0, int(offset))
+    return limit, offset
+
+
+def search_person_ids(query, limit=DEFAULT_LIMIT, offset=0):
+    """
+    Nem törölt személyek ID-i relevancia szerint rendezve.
+
+    Returns:
+        list | None: ID-k, vagy None ha az FTS index nem elérhető
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    weights = ', '.join(str(w) for w in FTS_COLUMNS.values())
+    sql = text(f"""
+        SELECT p.id
+        FROM {FTS_TABLE} f
+        JOIN persons p ON p.id = f.rowid
+        WHERE {FTS_TABLE} MATCH :match AND p.deleted_at IS NULL
+        ORDER BY bm25({FTS_TABLE}, {weights}), p.id
+        LIMIT :limit OFFSET :offset
+    """)
+    try:
+        return db.session.execute(sql, {'match': match, 'limit': limit, 'offset': offset}).scalars().all()
+    except OperationalError:
+        # Nincs FTS index (régi adatbázis / FTS5 nélküli SQLite)
+        db.session.rollback()
+        return None
@@ -0,0 +1,145 @@
+"""
+Avatar sprite atlasz a fa nézethez.
+
+Sok látható kártya esetén a profilképek egyenkénti letöltése (kártyánként
+egy kérés) dominálja a fa első megjelenését, különösen lassú Wi-Fi-n. Az
+atlasz a kért személyek négyzetes bélyegképeit (app/thumbnails.py) egyetlen
+rácsba pakolja; a kliens egy JSON-t kap a kép URL-jével és személyenként a
+cella bal felső sarkával.
+
+Az atlasz a lemezen gyorsítótárazott (DATA_DIR/sprites/), a kulcsa a
+benne lévő személyek és a bélyegképeik verziója (fájlnév + módosítási
+idő) - egy új fotó új kulcsot ad, így a kép URL-je változatlan tartalmú
+és a böngésző korlátlan ideig cache-elheti.
+"""
+
+import hashlib
+import json
+import math
+import os
+
+from flask import current_app
+
+from app import db
+from app import thumbnails
+from app.models import Person, select_in
+
+
+DEFAULT_SIZE = 128
+MAX_SPRITES = 2000  # 45x45-ös rács 128 px-es cellákkal: ~5800 px oldal
+MAX_CACHED = 32  # Ennyi atlasz marad a lemezen (a legrégebben használtak törlődnek)
+
+
+class SpriteError(Exception):
+    """Az atlasz nem készíthető el (nincs Pillow, érvénytelen méret)"""
+
+
+def cache_dir():
+    return os.path.join(current_app.config['DATA_DIR'], 'sprites')
+
+
+def _entries(person_ids, size):
+    """
+    A fotóval és kész bélyegképpel rendelkező személyek ID szerint rendezve.
+
+    Returns:
+        list: (person_id, bélyegkép fájlnév, módosítási idő ns) hármasok
+    """
+    query = db.session.query(Person.id, Person.photo_path).filter(Person.deleted_at.is_(None))
+    target_dir = thumbnails.thumb_dir(current_app.config['UPLOAD_FOLDER'])
+    entries = []
+    for person_id, photo_path in sorted(select_in(query, Person.id, person_ids)):
+        url = (thumbnails.thumbnail_urls(photo_path) or {}).get(size)
+        if url is None:
+            continue
+        name = url.rsplit('/', 1)[1]
+        try:
+            entries.append((person_id, name, os.stat(os.path.join(target_dir, name)).st_mtime_ns))
+        except OSError:
+            continue
+        if len(entries) >= MAX_SPRITES:
+            break
+    return entries
+
+
+def _build(entries, size, columns, path):
+    from PIL import Image
+
+    rows = math.ceil(len(entries) / columns)
+    target_dir = thumbnails.thumb_dir(current_app.config['UPLOAD_FOLDER'])
+    atlas = Image.new('RGB', (columns * size, rows * size), (255, 255, 255))
+    for index, (_person_id, name, _mtime) in enumerate(entries):
+        try:
+            with Image.open(os.path.join(target_dir, name)) as tile:
+                tile = tile.convert('RGBA')
+                if tile.size != (size, size):
+                    tile = tile.resize((size, size))
+                atlas.paste(tile, ((index % columns) * size, (index // columns) * size), tile)
+        except OSError:
+            continue  # Közben törölt bélyegkép: üres cella
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    atlas.save(tmp_path, thumbnails.THUMB_FORMAT, **thumbnails.SAVE_OPTIONS)
+    os.replace(tmp_path, path)
+
+
+def _prune(directory):
+    files = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(f'.{thumbnails.THUMB_EXT}')),
+        key=lambda entry: entry.stat().st_mtime, reverse=True
+    )
+    for entry in files[MAX_CACHED:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def get_atlas(person_ids, size=DEFAULT_SIZE):
+    """
+    Az atlasz leírója (szükség esetén elkészíti).
+
+    Returns:
+        dict: {'key', 'url', 'size', 'width', 'height', 'sprites': {person_id: [x, y]}}
+              - a sprites-ból hiányzó személyeknek nincs bélyegképe
+    """
+    if not thumbnails.is_available():
+        raise SpriteError('A Pillow nincs telepítve')
+    if size not in thumbnails.SIZES or size > thumbnails.SQUARE_MAX:
+        raise SpriteError(f'Érvénytelen méret: {size}')
+
+    entries = _entries(person_ids, size)
+    if not entries:
+        return {'key': None, 'url': None, 'size': size, 'width': 0, 'height': 0, 'sprites': {}}
+
+    key = hashlib.sha256(json.dumps([size, entries]).encode()).hexdigest()[:32]
+    columns = math.ceil(math.sqrt(len(entries)))
+    directory = cache_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{key}.{thumbnails.THUMB_EXT}')
+    if os.path.exists(path):
+        os.utime(path)  # A legutóbbi használat ideje (a ritkításhoz)
+    else:
+        _build(entries, size, columns, path)
+        _prune(directory)
+
+    return {
+        'key': key,
+        'url': f'/api/tree/avatars/{key}.{thumbnails.THUMB_EXT}',
+        'size': size,
+        'width': columns * size,
+        'height': math.ceil(len(entries) / columns) * size,
+        'sprites': {
+            person_id: [(index % columns) * size, (index // columns) * size]
+            for index, (person_id, _name, _mtime) in enumerate(entries)
+        },
+    }
+
+
+def atlas_path(filename):
+    """A gyorsítótárazott atlasz fájl útvonala, vagy None"""
+    key, _, ext = filename.partition('.')
+    if ext != thumbnails.THUMB_EXT or len(key) != 32 or not all(c in '0123456789abcdef' for c in key):
+        return None
+    path = os.path.join(cache_dir(), filename)
+    return path if os.path.exists(path) else None
@@ -0,0 +1,112 @@
+"""
+SQLite kapcsolat-beállítások több workeres (gunicorn) futtatáshoz.
+
+Minden új adatbázis kapcsolaton lefutnak a PRAGMA beállítások:
+  - journal_mode=WAL:     az olvasók nem blokkolják az írót és fordítva
+  - busy_timeout:         zárolt adatbázisnál várakozás hiba helyett
+  - synchronous=NORMAL:   WAL módban biztonságos, jóval kevesebb fsync (SD kártya!)
+  - mmap_size:            memóriába leképezett olvasás
+  - cache_size:           oldal cache mérete (negatív érték = KiB)
+  - temp_store=MEMORY:    ideiglenes táblák/indexek memóriában
+
+Az értékek környezeti változókkal felülírhatók (pl. SQLITE_BUSY_TIMEOUT=10000).
+"""
+
+import os
+
+from sqlalchemy import event
+
+
+# PRAGMA név -> alapértelmezett érték
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,  # ms
+    'synchronous': 'NORMAL',
+    'mmap_size': 64 * 1024 * 1024,  # 64 MB
+    'cache_size': -16000,  # ~16 MB
+    'temp_store': 'MEMORY',
+}
+
+# Szöveges PRAGMA-k megengedett értékei (a PRAGMA nem paraméterezhető, ezért ellenőrizzük)
+ALLOWED_VALUES = {
+    'journal_mode': {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'},
+    'synchronous': {'OFF', 'NORMAL', 'FULL', 'EXTRA'},
+    'temp_store': {'DEFAULT', 'FILE', 'MEMORY'},
+}
+
+
+def load_pragma_settings(environ=None):
+    """
+    PRAGMA beállítások a környezeti változókból (SQLITE_<NÉV>), alapértékekkel.
+    Üres érték ('') esetén az adott PRAGMA nem kerül beállításra.
+    """
+    environ = os.environ if environ is None else environ
+    settings = {}
+
+    for name, default in DEFAULT_PRAGMAS.items():
+        raw = environ.get(f'SQLITE_{name.upper()}')
+        if raw is None:
+            settings[name] = default
+            continue
+
+        raw = raw.strip()
+        if raw == '':
+            continue
+
+        if name in ALLOWED_VALUES:
+            value = raw.upper()
+            if value not in ALLOWED_VALUES[name]:
+                raise ValueError(f'Érvénytelen SQLITE_{name.upper()} érték: {raw}')
+        else:
+            try:
+                value = int(raw)
+            except ValueError:
+                raise ValueError(f'Érvénytelen SQLITE_{name.upper()} érték: {raw}')
+        settings[name] = value
+
+    return settings
+
+
+def apply_pragmas(dbapi_connection, settings):
+    """PRAGMA-k alkalmazása egy nyers sqlite3 kapcsolaton"""
+    cursor = dbapi_connection.cursor()
+    try:
+        # A busy_timeout legyen az első, hogy a journal_mode váltás is várjon a zárra
+        if 'busy_timeout' in settings:
+            cursor.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout'])}")
+        for name, value in settings.items():
+            if name == 'busy_timeout':
+                continue
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+
+def init_engine(app, engine):
+    """PRAGMA-k regisztrálása az engine minden új kapcsolatára"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    settings = app.config.setdefault('SQLITE_PRAGMAS', load_pragma_settings())
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, settings)
+
+
+def begin_immediate(session):
+    """
+    A session tranzakciójának megnyitása azonnali írási zárral (BEGIN IMMEDIATE).
+
+    A pysqlite a tranzakciót csak az első INSERT/UPDATE/DELETE előtt nyitja
+    meg, DEFERRED módban. Hosszú tömeges írásnál (import) ez két gondot okoz:
+    az előtte futó DDL (pl. az FTS triggerek eldobása) a tranzakción kívül,
+    vissza nem görgethetően futna, és egy másik worker közbeni írása miatt a
+    zár későbbi felminősítése SQLITE_BUSY hibával bukhat. Az elején
+    megszerzett zárral a többi író a busy_timeout-ig vár.
+    """
+    connection = session.connection()
+    if connection.dialect.name != 'sqlite':
+        return
+    if not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
@@ -0,0 +1,80 @@
+"""
+Összesítő statisztikák (/api/stats) egyetlen aggregáló lekérdezéssel.
+
+A számlálók (összes, élő, férfi, nő, házasságok) és a legkorábbi/legkésőbbi
+születési dátum feltételes összegzéssel egy menetben jönnek; a legidősebb
+élő személy ezután egy ID szerinti betöltés.
+
+Az eredmény folyamatszinten cache-elve van az adatverzióhoz kötve: amíg a
+change_tracker nem jelez írást (bármelyik workerből), az ismételt
+dashboard betöltés nem fut le SQL-t.
+"""
+
+from sqlalchemy import case, func, select
+
+from app import db
+from app.changes import VersionedCache
+
+
+# A generációk becsléséhez használt átlagos generációs időköz (év)
+GENERATION_YEARS = 25
+
+
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def compute_stats():
+    """A statisztikák kiszámítása (cache nélkül)"""
+    from app.models import Person, Marriage
+
+    alive = Person.death_date.is_(None)
+    marriages_count = (
+        select(func.count(Marriage.id))
+        .where(Marriage.deleted_at.is_(None))
+        .scalar_subquery()
+    )
+    row = db.session.execute(
+        select(
+            func.count(Person.id),
+            _count_if(alive),
+            _count_if(Person.gender == 'male'),
+            _count_if(Person.gender == 'female'),
+            func.min(Person.birth_date),
+            func.max(Person.birth_date),
+            func.min(case((alive, Person.birth_date))),
+            marriages_count,
+        )
+        .where(Person.deleted_at.is_(None))
+    ).one()
+    (total, living, male, female, earliest_birth, latest_birth,
+     oldest_living_birth, marriages) = row
+
+    oldest_living = None
+    if oldest_living_birth is not None:
+        oldest_living = Person.query.filter(
+            Person.deleted_at.is_(None),
+            alive,
+            Person.birth_date == oldest_living_birth
+        ).order_by(Person.id).first()
+
+    generations = 1
+    if earliest_birth and latest_birth:
+        years_span = latest_birth.year - earliest_birth.year
+        generations = max(1, years_span // GENERATION_YEARS + 1)
+
+    return {
+        'total_persons': total,
+        'living_persons': living,
+        'deceased_persons': total - living,
+        'male_count': male,
+        'female_count': female,
+        'unknown_gender_count': total - male - female,
+        'marriages_count': marriages,
+        'estimated_generations': generations,
+        'oldest_living': oldest_living.to_dict() if oldest_living else None
+    }
+
+
+# Singleton instance
+stats_cache = VersionedCache(compute_stats)
@@ -0,0 +1,59 @@
+"""
+Közös segédek a folyamként generált exportokhoz (GEDCOM, NDJSON).
+
+- stream_rows: lekérdezés yield_per kötegekben (nem tölti be a teljes táblát)
+- SortedGroups: azonos kulcs szerint rendezett folyamok összefésülése
+  (merge join) soronkénti lekérdezés helyett
+- chunked: a rekordok összefűzése ~CHUNK_SIZE méretű darabokba a kliensnek
+"""
+
+from itertools import groupby
+from operator import itemgetter
+
+from app import db
+
+
+BATCH_SIZE = 1000
+
+# A kimenet ekkora darabokban megy a kliensnek (nem rekordonként)
+CHUNK_SIZE = 64 * 1024
+
+
+def stream_rows(statement):
+    return db.session.execute(statement.execution_options(yield_per=BATCH_SIZE))
+
+
+class SortedGroups:
+    """
+    Az első oszlop szerint rendezett sorfolyam; take(kulcs) növekvő kulcsokra
+    visszaadja (és elfogyasztja) a kulcshoz tartozó sorokat.
+    """
+
+    def __init__(self, rows):
+        self._groups = groupby(rows, key=itemgetter(0))
+        self._current = next(self._groups, None)
+
+    def take(self, key):
+        while self._current is not None and self._current[0] < key:
+            self._current = next(self._groups, None)
+        if self._current is None or self._current[0] != key:
+            return []
+        group = list(self._current[1])
+        self._current = next(self._groups, None)
+        return group
+
+
+def chunked(records):
+    """
+    Szöveg rekordok ~CHUNK_SIZE méretű darabokban.
+    Alkalmazás kontextusban kell iterálni (stream_with_context).
+    """
+    buffer, size = [], 0
+    for record in records:
+        buffer.append(record)
+        size += len(record)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
@@ -0,0 +1,193 @@
+"""
+Memóriabeli prefix index a gépelés közbeni névjavaslatokhoz (typeahead).
+
+A személyek névmezőinek (vezeték-, kereszt-, középső, leánykori név,
+becenév) normalizált - kisbetűs, ékezet nélküli - szavai egy rendezett
+(token, person_id) listában vannak; egy prefix találatai a listában
+egymás utáni tartományt alkotnak, amit bisect-tel érünk el.
+
+A KinshipIndex mintájára a change_tracker értesítései alapján
+inkrementálisan frissül; ha más worker írt, újraépül.
+"""
+
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+from app.changes import change_tracker
+from app.models import format_full_name
+from app.thumbnails import thumbnail_urls
+
+
+NAME_FIELDS = ('first_name', 'middle_name', 'last_name', 'maiden_name', 'nickname')
+RECORD_FIELDS = NAME_FIELDS + ('birth_date', 'death_date', 'photo_path', 'deleted_at')
+
+# Ennél több változásnál olcsóbb a teljes újraépítés, mint a soronkénti beszúrás
+REBUILD_THRESHOLD = 2000
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(value):
+    """Kisbetűs, ékezet nélküli alak (Őrsi -> orsi)"""
+    decomposed = unicodedata.normalize('NFKD', value)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def tokenize(value):
+    return _TOKEN_RE.findall(normalize(value)) if value else []
+
+
+class SuggestIndex:
+    """Folyamatszintű név prefix index"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self._records = {}  # person_id -> {mező: érték} (törölt személyek is)
+        self._tokens = []   # rendezett [(token, person_id), ...] - csak nem törölt személyek
+
+    # ---------- Felépítés ----------
+
+    def _build(self):
+        from app import db
+        from app.models import Person
+
+        version = change_tracker.version
+        columns = [getattr(Person, name) for name in RECORD_FIELDS]
+        records = {}
+        tokens = []
+        for row in db.session.query(Person.id, *columns).all():
+            record = dict(zip(RECORD_FIELDS, row[1:]))
+            records[row[0]] = record
+            tokens.extend(self._tokens_for(row[0], record))
+        tokens.sort()
+
+        self._records = records
+        self._tokens = tokens
+        self._version = version
+
+    def _ensure_fresh(self):
+        if self._version is None or self._version != change_tracker.version:
+            with self._lock:
+                if self._version is None or self._version != change_tracker.version:
+                    self._build()
+
+    @staticmethod
+    def _tokens_for(person_id, record):
+        if record.get('deleted_at') is not None:
+            return set()
+        tokens = set()
+        for field in NAME_FIELDS:
+            tokens.update(tokenize(record.get(field)))
+        return {(token, person_id) for token in tokens}
+
+    # ---------- Inkrementális frissítés ----------
+
+    def on_change(self, old_version, new_version, changes):
+        """change_tracker listener: commit utáni frissítés"""
+        with self._lock:
+            if (changes is None or len(changes) > REBUILD_THRESHOLD
+                    or self._version is None or self._version != old_version):
+                self._version = None
+                return
+
+            for table, entity_id, values in changes:
+                if table == 'persons':
+                    self._apply_person(entity_id, values)
+
+            self._version = new_version
+
+    def _apply_person(self, person_id, values):
+        if values is not None and not any(field in values for field in RECORD_FIELDS):
+            return
+
+        old_record = self._records.pop(person_id, None)
+        if old_record is not None:
+            for entry in self._tokens_for(person_id, old_record):
+                pos = bisect_left(self._tokens, entry)
+                if pos < len(self._tokens) and self._tokens[pos] == entry:
+                    del self._tokens[pos]
+
+        if values is None:
+            return  # Végleges törlés
+
+        # Új személynél a be nem állított mezők üresek
+        record = dict(old_record or dict.fromkeys(RECORD_FIELDS))
+        record.update((k, v) for k, v in values.items() if k in RECORD_FIELDS)
+        self._records[person_id] = record
+        for entry in self._tokens_for(person_id, record):
+            insort(self._tokens, entry)
+
+    # ---------- Lekérdezés ----------
+
+    def suggest(self, query, limit=DEFAULT_LIMIT):
+        """
+        Javaslatok: minden keresett szó prefixe a személy valamelyik névszavának.
+        A legszűkebb tartományú szó adja a jelölteket, a többi szűr;
+        a sorrend a token ábécérendje (a pontos egyezés megelőzi a hosszabbat).
+
+        Returns:
+            list: [{'id', 'display_name', 'birth_year', 'death_year', 'photo_path', 'photo_thumbs'}, ...]
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        self._ensure_fresh()
+        with self._lock:
+            tokens = self._tokens
+            ranges = []
+            for term in terms:
+                start = bisect_left(tokens, (term,))
+                end = bisect_left(tokens, (term + '\uffff',))
+                if start == end:
+                    return []
+                ranges.append((end - start, start, end, term))
+            ranges.sort()
+            _, start, end, term = ranges[0]
+            others = [t for _, _, _, t in ranges[1:]]
+
+            results = []
+            seen = set()
+            for pos in range(start, end):
+                person_id = tokens[pos][1]
+                if person_id in seen:
+                    continue
+                seen.add(person_id)
+                record = self._records[person_id]
+                if others and not self._matches_all(record, others):
+                    continue
+                results.append(self._serialize(person_id, record))
+                if len(results) >= limit:
+                    break
+            return results
+
+    @staticmethod
+    def _matches_all(record, terms):
+        words = [w for field in NAME_FIELDS for w in tokenize(record.get(field))]
+        return all(any(w.startswith(term) for w in words) for term in terms)
+
+    @staticmethod
+    def _serialize(person_id, record):
+        name = format_full_name(record['last_name'], record['first_name'], record['middle_name'])
+        if record['maiden_name']:
+            name += f" (szül. {record['maiden_name']})"
+        birth, death = record['birth_date'], record['death_date']
+        return {
+            'id': person_id,
+            'display_name': name,
+            'birth_year': birth.year if birth else None,
+            'death_year': death.year if death else None,
+            'photo_path': record['photo_path'],
+            'photo_thumbs': thumbnail_urls(record['photo_path']),
+        }
+
+
+# Singleton instance
+suggest_index = SuggestIndex()
+change_tracker.subscribe(suggest_index.on_change)
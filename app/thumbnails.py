@@ -0,0 +1,204 @@
+"""
+Profilkép bélyegképek (Pillow).
+
+A feltöltött eredeti fotó (gyakran 6-12 MB-os telefonkép) mellé
+static/uploads/thumbs/ alá kicsinyített, EXIF szerint elforgatott
+változatok készülnek SIZES méretekben: a kicsik (fa kártya, lista, kereső)
+négyzetesre vágva, a nagy (előnézet) arányosan kicsinyítve. Formátum WebP,
+ha a Pillow build nem tudja, JPEG. Az EXIF adatok (GPS, eszköz) nem
+kerülnek át a bélyegképekbe.
+
+A változatok URL-jei a photo_path-ból számolhatók (thumbnail_urls); csak a
+ténylegesen létező változatok kerülnek a válaszba, különben a kliens az
+eredetit használja. A meglévő fotókhoz a `flask generate-thumbnails`
+parancs készíti el őket, folyamatkészletben.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow nélkül nincs bélyegkép, az eredeti fotó látszik
+    Image = None
+
+
+SIZES = (64, 128, 512)  # Hosszabbik oldal (px)
+SQUARE_MAX = 128  # Eddig a méretig négyzetesre vágott (avatar) változat
+URL_PREFIX = '/static/uploads/'
+THUMB_DIR = 'thumbs'
+
+if Image is not None and features.check('webp'):
+    THUMB_FORMAT, THUMB_EXT, SAVE_OPTIONS = 'WEBP', 'webp', {'quality': 80, 'method': 4}
+else:
+    THUMB_FORMAT, THUMB_EXT, SAVE_OPTIONS = 'JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}
+
+
+class ThumbnailError(Exception):
+    """A feltöltött fájl nem olvasható képként"""
+
+
+def is_available():
+    return Image is not None
+
+
+def thumb_dir(upload_folder):
+    return os.path.join(upload_folder, THUMB_DIR)
+
+
+def _thumb_name(filename, size):
+    return f'{os.path.splitext(filename)[0]}_{size}.{THUMB_EXT}'
+
+
+# ==================== KÉSZÍTÉS ====================
+
+def generate_thumbnails(source_path, target_dir):
+    """
+    Az összes változat elkészítése egy képfájlból.
+    Folyamatkészletből is hívható (csak fájlútvonalakkal dolgozik).
+
+    Returns:
+        list: az elkészült bélyegkép fájlnevek
+    """
+    if Image is None:
+        raise ThumbnailError('A Pillow nincs telepítve')
+
+    os.makedirs(target_dir, exist_ok=True)
+    filename = os.path.basename(source_path)
+    written = []
+    try:
+        with Image.open(source_path) as image:
+            # JPEG-nél a dekódolás eleve kisebb méretben (DCT skálázás) - a
+            # nagy telefonképeknél ez a költség nagy része
+            image.draft('RGB', (max(SIZES), max(SIZES)))
+            image = ImageOps.exif_transpose(image)
+            has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+            image = image.convert('RGBA' if has_alpha and THUMB_FORMAT == 'WEBP' else 'RGB')
+
+            # A nagyobb változatból kicsinyítjük a kisebbet
+            for size in sorted(SIZES, reverse=True):
+                if size <= SQUARE_MAX:
+                    image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+                else:
+                    image.thumbnail((size, size), Image.LANCZOS)
+                name = _thumb_name(filename, size)
+                path = os.path.join(target_dir, name)
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                image.save(tmp_path, THUMB_FORMAT, **SAVE_OPTIONS)
+                os.replace(tmp_path, path)
+                written.append(name)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ThumbnailError(f'A kép nem olvasható: {filename}') from e
+    return written
+
+
+def remove_thumbnails(filename, target_dir):
+    for size in SIZES:
+        try:
+            os.remove(os.path.join(target_dir, _thumb_name(filename, size)))
+        except OSError:
+            pass
+
+
+def _upload_filename(photo_path):
+    """A /static/uploads/ alatti fájlnév, vagy None (külső URL, hiányzó kép)"""
+    if not photo_path or not photo_path.startswith(URL_PREFIX):
+        return None
+    filename = photo_path[len(URL_PREFIX):]
+    return filename if filename and '/' not in filename else None
+
+
+# ==================== URL-EK ====================
+
+# A thumbs könyvtár tartalma, a könyvtár módosítási idejéhez kötve: a fa
+# adataihoz így nem kell személyenként fájlrendszer hívás
+_listing = (None, frozenset())
+
+
+def _existing_thumbs(target_dir):
+    global _listing
+    try:
+        mtime = os.stat(target_dir).st_mtime_ns
+    except OSError:
+        return frozenset()
+    cached_mtime, names = _listing
+    if cached_mtime != mtime:
+        names = frozenset(entry.name for entry in os.scandir(target_dir))
+        _listing = (mtime, names)
+    return names
+
+
+def thumbnail_urls(photo_path):
+    """
+    A profilkép létező változatainak URL-jei.
+
+    Returns:
+        dict | None: {méret: URL}, pl. {64: '/static/uploads/thumbs/x_64.webp', ...}
+    """
+    filename = _upload_filename(photo_path)
+    if filename is None:
+        return None
+    existing = _existing_thumbs(thumb_dir(current_app.config['UPLOAD_FOLDER']))
+    urls = {
+        size: f'{URL_PREFIX}{THUMB_DIR}/{_thumb_name(filename, size)}'
+        for size in SIZES if _thumb_name(filename, size) in existing
+    }
+    return urls or None
+
+
+# ==================== UTÓLAGOS GENERÁLÁS ====================
+
+def _is_stale(source_path, target_dir, filename):
+    try:
+        source_mtime = os.path.getmtime(source_path)
+        return any(os.path.getmtime(os.path.join(target_dir, _thumb_name(filename, size))) < source_mtime
+                   for size in SIZES)
+    except OSError:
+        return True
+
+
+def backfill(photo_paths, upload_folder, force=False, max_workers=None):
+    """
+    A hiányzó (vagy az eredetinél régebbi) bélyegképek elkészítése.
+
+    Returns:
+        dict: statisztika (fotók, elkészült, naprakész, hiányzó, hibás, idő)
+    """
+    if Image is None:
+        raise ThumbnailError('A Pillow nincs telepítve')
+
+    started = time.perf_counter()
+    target_dir = thumb_dir(upload_folder)
+    os.makedirs(target_dir, exist_ok=True)
+
+    filenames = sorted({name for name in map(_upload_filename, photo_paths) if name})
+    sources, missing = [], 0
+    for filename in filenames:
+        source_path = os.path.join(upload_folder, filename)
+        if not os.path.isfile(source_path):
+            missing += 1
+        elif force or _is_stale(source_path, target_dir, filename):
+            sources.append(source_path)
+
+    generated, failed = 0, []
+    if sources:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(generate_thumbnails, path, target_dir) for path in sources]
+            for future in futures:
+                try:
+                    future.result()
+                    generated += 1
+                except ThumbnailError as e:
+                    failed.append(str(e))
+
+    return {
+        'photos': len(filenames),
+        'generated': generated,
+        'skipped': len(filenames) - len(sources) - missing,
+        'missing': missing,
+        'failed': failed,
+        'duration_ms': round((time.perf_counter() - started) * 1000),
+    }
@@ -0,0 +1,305 @@
+"""
+Tartalom-címzett feltöltés tároló.
+
+A feltöltött fájl egy ideiglenes fájlba íródik, közben számolódik a
+SHA-256 hash-e (a teljes fájl nem kerül a memóriába), majd a
+static/uploads/<sha256>.<kiterjesztés> néven tárolódik. Ugyanaz a tartalom
+(pl. egy irat tíz rokonhoz feltöltve) így egyszer foglal helyet, és egy
+azonos nevű újrafeltöltés sem írja felül egy másik fájlját.
+
+A személyek profilképe és a dokumentumok a blobra az upload_refs táblán
+keresztül hivatkoznak. A háttérben futó takarítás (UploadCollector) törli
+az elavult hivatkozásokat (véglegesen törölt entitás, lecserélt fotó) és a
+már nem hivatkozott blobokat a bélyegképeikkel együtt. Használatban lévőnek
+számít minden blob, amire hivatkozás VAGY a persons.photo_path /
+documents.file_path oszlop mutat (az importált és visszaállított sorok
+hivatkozás nélkül is), és minden fájl, amire egy megőrzött mentés vagy a
+változásnapló mutat - egy visszaállítás így nem hoz vissza törött képet.
+
+A korábbi, név szerint tárolt feltöltések a `flask migrate-uploads`
+paranccsal konvertálhatók. A régi fájlok addig maradnak, amíg egy
+megőrzött mentés vagy a napló hivatkozik rájuk; utána a takarítás törli.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+from sqlalchemy import delete, literal, select
+
+from app import db
+from app import thumbnails
+
+
+BLOB_PATTERN = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+LEGACY_PATTERN = re.compile(r'^(person|doc)_.+')  # A név szerint tárolt régi feltöltések
+URL_PREFIX = '/static/uploads/'
+READ_SIZE = 1024 * 1024
+TMP_PREFIX = '.upload-'
+
+
+class UploadStoreError(Exception):
+    """A feltöltés nem tárolható"""
+
+
+def _ref_columns():
+    """Entitás típus -> (modell, a fájl URL-t tároló oszlop)"""
+    from app.models import Document, Person
+
+    return {
+        'person': (Person, Person.photo_path),
+        'document': (Document, Document.file_path),
+    }
+
+
+def blob_url(name):
+    return URL_PREFIX + name
+
+
+def upload_name(path):
+    """A /static/uploads/ alatti fájlnév, vagy None (külső URL, alkönyvtár)"""
+    if not path or not path.startswith(URL_PREFIX):
+        return None
+    name = path[len(URL_PREFIX):]
+    return name if name and '/' not in name else None
+
+
+def extension(filename):
+    ext = re.sub(r'[^a-z0-9]', '', filename.rsplit('.', 1)[1].lower()) if '.' in filename else ''
+    return ext or 'bin'
+
+
+# ==================== TÁROLÁS ====================
+
+def save_stream(stream, ext, directory):
+    """
+    Egy feltöltés tárolása a tartalma hash-e alapján.
+
+    Returns:
+        tuple: (blob név, új-e) - ha a tartalom már megvolt, nem íródik újra
+    """
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(prefix=TMP_PREFIX, suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                data = stream.read(READ_SIZE)
+                if not data:
+                    break
+                digest.update(data)
+                out.write(data)
+
+        name = f'{digest.hexdigest()}.{ext}'
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            # A meglévő blob frissnek számít: a takarítás türelmi ideje erre is vonatkozik
+            os.utime(path)
+            os.remove(tmp_path)
+            return name, False
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+        return name, True
+    except OSError as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise UploadStoreError(f'A feltöltés nem menthető: {e}') from e
+
+
+def set_reference(entity_type, entity_id, name):
+    """Az entitás fájl hivatkozásának beállítása (a hívó commitol)"""
+    from app.models import UploadRef
+
+    ref = UploadRef.query.filter_by(entity_type=entity_type, entity_id=entity_id).first()
+    if ref is None:
+        ref = UploadRef(entity_type=entity_type, entity_id=entity_id)
+        db.session.add(ref)
+    ref.blob = name
+    return ref
+
+
+# ==================== MENTÉSEK HIVATKOZÁSAI ====================
+
+def database_references(path):
+    """
+    Egy adatbázis fájl (mentés) által hivatkozott feltöltött fájlnevek.
+    A hiányzó tábla / oszlop (régi séma) kimarad.
+
+    Returns:
+        list: rendezett fájlnevek
+    """
+    names = set()
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        for model, column in _ref_columns().values():
+            try:
+                rows = conn.execute(
+                    f'SELECT DISTINCT "{column.name}" FROM "{model.__table__.name}" WHERE "{column.name}" LIKE ?',
+                    (URL_PREFIX + '%',)
+                )
+                names.update(filter(None, (upload_name(value) for (value,) in rows)))
+            except sqlite3.OperationalError:
+                continue
+    finally:
+        conn.close()
+    return sorted(names)
+
+
+def restorable_references():
+    """
+    A visszaállítással elérhető állapotok fájlnevei: a megőrzött mentések
+    és a változásnapló (pont-időpontra visszaállítás) hivatkozásai.
+    """
+    from app.backup import backup_manager
+    from app.journal import journal
+
+    names = backup_manager.referenced_uploads()
+    columns = {model.__table__.name: column.name for model, column in _ref_columns().values()}
+    names.update(filter(None, map(upload_name, journal.referenced_values(columns))))
+    return names
+
+
+# ==================== TAKARÍTÁS ====================
+
+def collect_garbage(directory, grace_seconds):
+    """
+    Elavult hivatkozások, nem hivatkozott blobok és régi feltöltések törlése.
+    A grace_seconds-nál frissebb blobok (folyamatban lévő feltöltés) maradnak.
+
+    Returns:
+        dict: statisztika (törölt hivatkozások, blobok, felszabadult bájtok, elhalasztott blobok)
+    """
+    from app.models import UploadRef
+
+    # Hivatkozás csak addig él, amíg az entitás létezik és még erre a blobra mutat
+    stale_refs = 0
+    for entity_type, (model, column) in _ref_columns().items():
+        current = select(model.id).where(model.id == UploadRef.entity_id, column == literal(URL_PREFIX) + UploadRef.blob)
+        stale_refs += db.session.execute(
+            delete(UploadRef).where(UploadRef.entity_type == entity_type, ~current.exists())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    db.session.commit()
+
+    # Hivatkozás nélkül is használatban van, amire egy útvonal mutat (JSON import,
+    # kézi photo_path, visszaállított régi mentés) - ezek soha nem törlődnek
+    referenced = set(db.session.execute(select(UploadRef.blob).distinct()).scalars())
+    for _model, column in _ref_columns().values():
+        paths = db.session.execute(select(column).where(column.like(URL_PREFIX + '%')).distinct()).scalars()
+        referenced.update(filter(None, map(upload_name, paths)))
+    # A mentésekből és a naplóból visszaállítható állapotok fájljai is
+    referenced |= restorable_references()
+
+    thumb_dir = thumbnails.thumb_dir(directory)
+    now = time.time()
+    removed = freed = deferred = 0
+    for entry in os.scandir(directory):
+        is_upload = BLOB_PATTERN.match(entry.name) is not None or (
+            LEGACY_PATTERN.match(entry.name) is not None and entry.is_file())
+        if not (is_upload or entry.name.startswith(TMP_PREFIX)) or entry.name in referenced:
+            continue
+        try:
+            # Friss stat: egy közben érkezett azonos tartalmú feltöltés frissíti
+            stat = os.stat(entry.path)
+            if now - stat.st_mtime < grace_seconds:
+                deferred += is_upload
+                continue
+            os.remove(entry.path)
+        except OSError:
+            continue
+        if is_upload:
+            thumbnails.remove_thumbnails(entry.name, thumb_dir)
+            removed += 1
+            freed += stat.st_size
+
+    return {'stale_refs': stale_refs, 'removed_blobs': removed, 'freed_bytes': freed, 'deferred_blobs': deferred}
+
+
+class UploadCollector:
+    """Késleltetett háttér takarítás feltöltés / végleges törlés után"""
+
+    DELAY = 60  # Az esemény után ennyivel fut (több esemény egy futás)
+    GRACE = 10 * 60  # Ennél frissebb blob nem törlődik (másodperc)
+
+    def __init__(self):
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def schedule(self, app, delay=None):
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self.DELAY if delay is None else delay, self._run, args=(app,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _run(self, app):
+        with self._lock:
+            self._timer = None
+        with app.app_context():
+            try:
+                result = collect_garbage(app.config['UPLOAD_FOLDER'], self.GRACE)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Feltöltés takarítás hiba')
+                return
+            finally:
+                db.session.remove()
+        if result['deferred_blobs']:
+            # A türelmi időn belüli blobokra később még visszatérünk
+            self.schedule(app, self.GRACE)
+
+
+# ==================== RÉGI FELTÖLTÉSEK ====================
+
+def migrate_legacy(directory):
+    """
+    A név szerint tárolt (person_*, doc_*) feltöltések átalakítása blobokká:
+    az útvonalak átírása, hivatkozások létrehozása, majd a régi fájlok törlése.
+
+    A megőrzött mentések és a napló által hivatkozott régi fájlok maradnak
+    (egy visszaállítás még rájuk mutathat) - ezeket később a takarítás törli.
+
+    Returns:
+        dict: statisztika (átalakított, új blobok, hiányzó fájlok, törölt régi fájlok)
+    """
+    converted = created_blobs = missing = 0
+    legacy_files = set()
+    for entity_type, (model, column) in _ref_columns().items():
+        for instance in model.query.filter(column.like(URL_PREFIX + '%')).all():
+            name = getattr(instance, column.key)[len(URL_PREFIX):]
+            if '/' in name:
+                continue
+            if BLOB_PATTERN.match(name):
+                set_reference(entity_type, instance.id, name)
+                continue
+            source = os.path.join(directory, name)
+            if not os.path.isfile(source):
+                missing += 1
+                continue
+            with open(source, 'rb') as f:
+                blob, created = save_stream(f, extension(name), directory)
+            setattr(instance, column.key, blob_url(blob))
+            set_reference(entity_type, instance.id, blob)
+            legacy_files.add(name)
+            converted += 1
+            created_blobs += created
+    db.session.commit()
+
+    thumb_dir = thumbnails.thumb_dir(directory)
+    removable = legacy_files - restorable_references()
+    for name in removable:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+        thumbnails.remove_thumbnails(name, thumb_dir)
+
+    return {'converted': converted, 'blobs': created_blobs, 'missing': missing, 'removed_files': len(removable)}
+
+
+# Singleton instance
+upload_collector = UploadCollector()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Soft delete szűrés benchmark: listázó lekérdezés késleltetése a lomtár méretének függvényében.
+
+Összehasonlított stratégiák:
+  - not_exists:         korrelált NOT EXISTS a deleted_records táblára, index nélkül (régi)
+  - not_exists_indexed: ugyanez egyedi (entity_type, entity_id) indexszel
+  - deleted_at:         indexelt deleted_at oszlop az entitás táblán (jelenlegi)
+
+Használat: python benchmarks/soft_delete.py [--persons 40000] [--trash 0,1000,10000,40000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+
+QUERIES = {
+    'not_exists': """
+        SELECT id, first_name, last_name FROM persons p
+        WHERE NOT EXISTS (
+            SELECT 1 FROM deleted_records dr
+            WHERE dr.entity_type = 'person' AND dr.entity_id = p.id
+        )
+    """,
+    'deleted_at': """
+        SELECT id, first_name, last_name FROM persons WHERE deleted_at IS NULL
+    """,
+}
+
+COUNT_QUERIES = {
+    'not_exists': """
+        SELECT COUNT(*) FROM persons p
+        WHERE NOT EXISTS (
+            SELECT 1 FROM deleted_records dr
+            WHERE dr.entity_type = 'person' AND dr.entity_id = p.id
+        )
+    """,
+    'deleted_at': "SELECT COUNT(*) FROM persons WHERE deleted_at IS NULL",
+}
+
+
+def build_db(path, persons):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE persons (
+            id INTEGER PRIMARY KEY,
+            first_name VARCHAR(100) NOT NULL,
+            last_name VARCHAR(100) NOT NULL,
+            deleted_at DATETIME
+        );
+        CREATE INDEX ix_persons_deleted_at ON persons (deleted_at);
+        CREATE TABLE deleted_records (
+            id INTEGER PRIMARY KEY,
+            entity_type VARCHAR(50) NOT NULL,
+            entity_id INTEGER NOT NULL,
+            deleted_at DATETIME
+        );
+    """)
+    conn.executemany(
+        'INSERT INTO persons (id, first_name, last_name) VALUES (?, ?, ?)',
+        ((i, f'Keresztnév{i}', f'Vezetéknév{i % 500}') for i in range(1, persons + 1))
+    )
+    conn.commit()
+    return conn
+
+
+def fill_trash(conn, persons, trash_size):
+    """A lomtár feltöltése: fele személy, fele egyéb entitás"""
+    conn.execute('DELETE FROM deleted_records')
+    conn.execute('UPDATE persons SET deleted_at = NULL')
+    person_ids = random.sample(range(1, persons + 1), min(trash_size // 2, persons))
+    conn.executemany(
+        "INSERT INTO deleted_records (entity_type, entity_id, deleted_at) VALUES ('person', ?, CURRENT_TIMESTAMP)",
+        ((pid,) for pid in person_ids)
+    )
+    conn.executemany(
+        "INSERT INTO deleted_records (entity_type, entity_id, deleted_at) VALUES ('event', ?, CURRENT_TIMESTAMP)",
+        ((i,) for i in range(trash_size - len(person_ids)))
+    )
+    conn.executemany('UPDATE persons SET deleted_at = CURRENT_TIMESTAMP WHERE id = ?', ((pid,) for pid in person_ids))
+    conn.commit()
+
+
+def timed(conn, sql, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--persons', type=int, default=40000)
+    parser.add_argument('--trash', default='0,1000,10000,40000')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    trash_sizes = [int(x) for x in args.trash.split(',')]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = build_db(os.path.join(tmp, 'bench.db'), args.persons)
+
+        print(f'Személyek: {args.persons}, ismétlés: {args.repeat} (legjobb idő, ms)')
+        print(f"{'lomtár':>8} | {'lista/not_exists':>17} | {'lista/+index':>13} | {'lista/deleted_at':>17} | "
+              f"{'count/not_exists':>17} | {'count/deleted_at':>17}")
+
+        for trash_size in trash_sizes:
+            fill_trash(conn, args.persons, trash_size)
+
+            conn.execute('DROP INDEX IF EXISTS uq_deleted_records_entity')
+            list_old = timed(conn, QUERIES['not_exists'], args.repeat)
+            count_old = timed(conn, COUNT_QUERIES['not_exists'], args.repeat)
+
+            conn.execute('CREATE UNIQUE INDEX uq_deleted_records_entity ON deleted_records (entity_type, entity_id)')
+            list_indexed = timed(conn, QUERIES['not_exists'], args.repeat)
+
+            list_new = timed(conn, QUERIES['deleted_at'], args.repeat)
+            count_new = timed(conn, COUNT_QUERIES['deleted_at'], args.repeat)
+
+            print(f'{trash_size:>8} | {list_old:>17.1f} | {list_indexed:>13.1f} | {list_new:>17.1f} | '
+                  f'{count_old:>17.1f} | {count_new:>17.1f}')
+
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+SQLite párhuzamossági benchmark: vegyes olvasás/írás több folyamatból,
+ahogy a gunicorn workerek használják az adatbázist.
+
+Profilok:
+  - default: alapértelmezett rollback journal, PRAGMA-k nélkül (régi működés)
+  - tuned:   az app/sqlite_tuning.py beállításai (WAL, busy_timeout, ...)
+             a környezeti változókkal együtt (SQLITE_*)
+
+Használat: python benchmarks/sqlite_concurrency.py [--workers 4] [--seconds 10] [--write-ratio 0.2]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.sqlite_tuning import apply_pragmas, load_pragma_settings  # noqa: E402
+
+
+PERSONS = 20000
+FAMILIES = 8000
+
+
+def build_db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE persons (
+            id INTEGER PRIMARY KEY,
+            first_name VARCHAR(100) NOT NULL,
+            last_name VARCHAR(100) NOT NULL,
+            notes TEXT,
+            parent_family_id INTEGER,
+            deleted_at DATETIME
+        );
+        CREATE INDEX ix_persons_parent_family_id ON persons (parent_family_id);
+        CREATE TABLE events (
+            id INTEGER PRIMARY KEY,
+            person_id INTEGER NOT NULL,
+            event_type VARCHAR(100) NOT NULL,
+            description TEXT
+        );
+        CREATE INDEX ix_events_person_id ON events (person_id);
+    """)
+    conn.executemany(
+        'INSERT INTO persons (id, first_name, last_name, parent_family_id) VALUES (?, ?, ?, ?)',
+        ((i, f'K{i}', f'V{i % 300}', random.randint(1, FAMILIES)) for i in range(1, PERSONS + 1))
+    )
+    conn.commit()
+    conn.close()
+
+
+def connect(path, profile):
+    if profile == 'tuned':
+        conn = sqlite3.connect(path, timeout=0)
+        apply_pragmas(conn, load_pragma_settings())
+    else:
+        # A pysqlite alapértelmezése: 5 mp várakozás, rollback journal
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA journal_mode = DELETE')
+    return conn
+
+
+def worker(path, profile, seconds, write_ratio, seed, queue):
+    random.seed(seed)
+    conn = connect(path, profile)
+    reads, writes, errors = [], [], 0
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        is_write = random.random() < write_ratio
+        start = time.perf_counter()
+        try:
+            if is_write:
+                person_id = random.randint(1, PERSONS)
+                conn.execute('UPDATE persons SET notes = ? WHERE id = ?', (f'jegyzet {start}', person_id))
+                conn.execute(
+                    "INSERT INTO events (person_id, event_type, description) VALUES (?, 'other', ?)",
+                    (person_id, 'benchmark')
+                )
+                conn.commit()
+            else:
+                family_id = random.randint(1, FAMILIES)
+                conn.execute(
+                    'SELECT id, first_name, last_name FROM persons '
+                    'WHERE parent_family_id = ? AND deleted_at IS NULL', (family_id,)
+                ).fetchall()
+                conn.execute('SELECT COUNT(*) FROM persons WHERE deleted_at IS NULL').fetchone()
+        except sqlite3.OperationalError:
+            errors += 1
+            conn.rollback()
+            continue
+        elapsed = (time.perf_counter() - start) * 1000
+        (writes if is_write else reads).append(elapsed)
+
+    conn.close()
+    queue.put((reads, writes, errors))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_profile(profile, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        build_db(path)
+
+        queue = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(
+                target=worker, args=(path, profile, args.seconds, args.write_ratio, i, queue)
+            )
+            for i in range(args.workers)
+        ]
+        for p in procs:
+            p.start()
+        results = [queue.get() for _ in procs]
+        for p in procs:
+            p.join()
+
+    reads = [x for r, _, _ in results for x in r]
+    writes = [x for _, w, _ in results for x in w]
+    errors = sum(e for _, _, e in results)
+    return {
+        'profile': profile,
+        'reads_per_s': len(reads) / args.seconds,
+        'writes_per_s': len(writes) / args.seconds,
+        'read_p95': percentile(reads, 95),
+        'write_p95': percentile(writes, 95),
+        'read_max': max(reads) if reads else 0.0,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f'Workerek: {args.workers}, időtartam: {args.seconds} mp, írási arány: {args.write_ratio}')
+    print(f"{'profil':>8} | {'olvasás/s':>10} | {'írás/s':>8} | {'olv. p95 ms':>11} | "
+          f"{'írás p95 ms':>11} | {'olv. max ms':>11} | {'locked hiba':>11}")
+    for profile in ('default', 'tuned'):
+        r = run_profile(profile, args)
+        print(f"{r['profile']:>8} | {r['reads_per_s']:>10.0f} | {r['writes_per_s']:>8.0f} | "
+              f"{r['read_p95']:>11.2f} | {r['write_p95']:>11.2f} | {r['read_max']:>11.1f} | {r['errors']:>11}")
+
+
+if __name__ == '__main__':
+    main()
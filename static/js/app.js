@@ -262,7 +262,7 @@ function renderPersonsList() {
     grid.innerHTML = filtered.map(person => `
         <div class="person-card ${person.gender} ${!person.is_alive ? 'deceased' : ''}" 
              onclick="openPersonModal(${person.id})">
-              <img src="${person.photo_path || '/static/img/placeholder-avatar.svg'}" 
+              <img src="${photoUrl(person.photo_path, person.photo_thumbs, 128)}" 
                  alt="${person.full_name}" class="person-photo">
             <div class="person-info">
                 <h3>${person.display_name}</h3>
@@ -631,7 +631,7 @@ async function fillPersonForm(person) {
     
     document.getElementById('father_id').value = fatherId;
     document.getElementById('mother_id').value = motherId;
-    document.getElementById('preview-photo').src = person.photo_path || '/static/img/placeholder-avatar.svg';
+    document.getElementById('preview-photo').src = photoUrl(person.photo_path, person.photo_thumbs, 512);
 }
 
 async function populateParentSelectors() {
@@ -1133,7 +1133,7 @@ async function uploadPhoto(file) {
     
     try {
         const result = await API.uploadFile(`/persons/${currentPersonId}/photo`, formData);
-        document.getElementById('preview-photo').src = result.photo_path;
+        document.getElementById('preview-photo').src = photoUrl(result.photo_path, result.photo_thumbs, 512);
         showNotification('Fénykép feltöltve', 'success');
         persons = await API.get('/persons');
     } catch (error) {
@@ -1345,6 +1345,9 @@ async function exportGEDCOM() {
 }
 
 async function importJSON(file) {
+    if (file.name.toLowerCase().endsWith('.ndjson')) {
+        return importNDJSON(file);
+    }
     try {
         const text = await file.text();
         const data = JSON.parse(text);
@@ -1380,6 +1383,37 @@ async function importJSON(file) {
     }
 }
 
+// NDJSON (teljes export): a fájl változatlanul, folyamként megy fel
+async function importNDJSON(file) {
+    const confirmed = confirm(
+        `⚠️ FIGYELEM!\n\n` +
+        `Az import FELÜLÍRJA az összes meglévő adatot!\n\n` +
+        `Fájl: ${file.name}\n\n` +
+        `A régi adatbázisról automatikusan mentés készül.\n\n` +
+        `Biztosan folytatod?`
+    );
+    if (!confirmed) {
+        showNotification('Import megszakítva', 'info');
+        return;
+    }
+    try {
+        const response = await fetch('/api/import/json', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/x-ndjson' },
+            body: file
+        });
+        const result = await response.json();
+        if (!response.ok) throw new Error(result.error || 'API hiba');
+        showNotification(
+            `Import sikeres! ${result.imported_persons || 0} személy, ${result.imported_marriages || 0} házasság`,
+            'success'
+        );
+        location.reload();
+    } catch (error) {
+        showNotification('Import hiba: ' + (error.message || 'Ismeretlen hiba'), 'error');
+    }
+}
+
 function downloadFile(blob, filename) {
     const url = URL.createObjectURL(blob);
     const a = document.createElement('a');
@@ -1409,27 +1443,33 @@ function initSearch() {
         
         searchTimeout = setTimeout(async () => {
             try {
-                const results = await API.get(`/search?q=${encodeURIComponent(query)}`);
+                // Könnyű javaslat végpont: csak név, évszámok és kép
+                const results = await API.get(`/persons/suggest?q=${encodeURIComponent(query)}`);
                 
                 if (results.length === 0) {
                     searchResults.innerHTML = '<div class="search-result-item">Nincs találat</div>';
                 } else {
-                    searchResults.innerHTML = results.map(p => `
+                    searchResults.innerHTML = results.map(p => {
+                        const years = p.birth_year || p.death_year
+                            ? `${p.birth_year || '?'}${p.death_year ? ' – ' + p.death_year : ''}`
+                            : '';
+                        return `
                         <div class="search-result-item" onclick="openPersonModal(${p.id}); document.getElementById('search-results').classList.remove('show');">
-                            <img src="${p.photo_path || '/static/img/default-avatar.png'}" alt="">
+                            <img src="${photoUrl(p.photo_path, p.photo_thumbs, 64, '/static/img/default-avatar.png')}" alt="">
                             <div>
-                                <strong>${p.full_name}</strong>
-                                <br><small>${formatDate(p.birth_date) || ''}</small>
+                                <strong>${p.display_name}</strong>
+                                <br><small>${years}</small>
                             </div>
                         </div>
-                    `).join('');
+                    `;
+                    }).join('');
                 }
                 
                 searchResults.classList.add('show');
             } catch (error) {
                 console.error('Keresési hiba:', error);
             }
-        }, 300);
+        }, 150);
     });
     
     // Keresés bezárása kattintáskor
@@ -1539,6 +1579,16 @@ function initFilters() {
 }
 
 // ==================== SEGÉDFÜGGVÉNYEK ====================
+// Profilkép URL: a legkisebb, legalább `size` px-es bélyegkép, különben az eredeti
+function photoUrl(photoPath, thumbs, size, fallback = '/static/img/placeholder-avatar.svg') {
+    if (thumbs) {
+        const sizes = Object.keys(thumbs).map(Number).sort((a, b) => a - b);
+        const best = sizes.find(s => s >= size) || sizes[sizes.length - 1];
+        if (best) return thumbs[best];
+    }
+    return photoPath || fallback;
+}
+
 function formatDate(dateStr) {
     if (!dateStr) return null;
     const date = new Date(dateStr);
@@ -1750,9 +1800,9 @@ async function loadBackups() {
                     <i class="fas fa-archive"></i>
                     <strong>${stats.total_backups}</strong> mentés
                 </span>
-                <span class="stat-item">
+                <span class="stat-item" title="Visszaállítva: ${stats.total_size_mb} MB">
                     <i class="fas fa-hdd"></i>
-                    <strong>${stats.total_size_mb}</strong> MB
+                    <strong>${stats.disk_size_mb}</strong> MB
                 </span>
                 ${stats.last_backup ? `
                 <span class="stat-item">
@@ -1760,6 +1810,12 @@ async function loadBackups() {
                     Utolsó: ${formatBackupDate(stats.last_backup.created_at)}
                 </span>
                 ` : ''}
+                ${stats.auto_backup && stats.auto_backup.dirty ? `
+                <span class="stat-item" title="Automatikus mentésre vár (${stats.auto_backup.lag_seconds} mp óta)">
+                    <i class="fas fa-hourglass-half"></i>
+                    ${stats.auto_backup.pending_changes} mentetlen módosítás
+                </span>
+                ` : ''}
             </div>
         `;
         
@@ -1817,10 +1873,17 @@ async function createBackup() {
     btn.disabled = true;
     
     try {
-        const result = await API.post('/backups', {
+        let job = await API.post('/backups', {
             description: 'Manuális mentés - ' + new Date().toLocaleString('hu-HU')
         });
         
+        // A mentés háttérben fut: állapot lekérdezése a befejezésig
+        while (job.status === 'running') {
+            await new Promise(resolve => setTimeout(resolve, 500));
+            job = await API.get(`/backups/jobs/${job.job_id}`);
+        }
+        if (job.status === 'error') throw new Error(job.error);
+        
         showNotification('Biztonsági mentés sikeresen létrehozva!', 'success');
         loadBackups();
         
@@ -7,6 +7,7 @@ let rootPersonId = null;
 
 // Elmentett egyedi pozíciók (drag & drop után)
 let savedPositions = {}; // { personId: { x, y } }
+let avatarAtlas = null; // Profilkép sprite atlasz: { url, size, width, height, sprites: { personId: [x, y] } }
 let isDragging = false;
 let positionedNodesCache = []; // Aktuális pozícionált node-ok cache-elése újrarajzoláshoz
 let currentFanChartPersonId = null; // Track current fan chart person for refresh
@@ -402,6 +403,7 @@ function initTree() {
 async function updateTree() {
     try {
         treeData = await API.get('/tree/data');
+        const atlasRequest = loadAvatarAtlas(treeData.nodes);
         
         // Elmentett pozíciók betöltése ha van root person
         if (rootPersonId) {
@@ -410,12 +412,26 @@ async function updateTree() {
             savedPositions = {};
         }
         
+        avatarAtlas = await atlasRequest;
         renderTree();
     } catch (error) {
         console.error('Fa adatok betöltési hiba:', error);
     }
 }
 
+// Egy kép az összes profilképpel (kártyánként külön kérés helyett)
+async function loadAvatarAtlas(nodes) {
+    const ids = nodes.filter(n => n.photo_thumbs).map(n => n.id);
+    if (ids.length < 2) return null;
+    try {
+        const atlas = await API.post('/tree/avatars', { ids, size: 128 });
+        return atlas.url ? atlas : null;
+    } catch (error) {
+        console.error('Profilkép atlasz betöltési hiba:', error);
+        return null;
+    }
+}
+
 // ==================== POZÍCIÓK MENTÉSE/BETÖLTÉSE ====================
 async function loadSavedPositions(rootId) {
     try {
@@ -1007,14 +1023,33 @@ function renderTree() {
             .attr('cy', 0)
             .attr('r', 25);
         
-        nodes.append('image')
-            .attr('xlink:href', d => d.photo || '/static/img/placeholder-avatar.svg')
-            .attr('x', -cardWidth / 2 + 5)
-            .attr('y', -25)
-            .attr('width', 50)
-            .attr('height', 50)
-            .attr('clip-path', d => `url(#clip-${d.id})`)
-            .style('opacity', d => d.is_alive ? 1 : (settings.deceased_opacity || 0.7));
+        nodes.each(function(d) {
+            const photo = d3.select(this).append('g')
+                .attr('clip-path', `url(#clip-${d.id})`)
+                .style('opacity', d.is_alive ? 1 : (settings.deceased_opacity || 0.7));
+            const sprite = avatarAtlas && avatarAtlas.sprites[d.id];
+            
+            if (sprite) {
+                // Az atlasz a személy cellájára vágva (viewBox)
+                photo.append('svg')
+                    .attr('x', -cardWidth / 2 + 5)
+                    .attr('y', -25)
+                    .attr('width', 50)
+                    .attr('height', 50)
+                    .attr('viewBox', `${sprite[0]} ${sprite[1]} ${avatarAtlas.size} ${avatarAtlas.size}`)
+                    .append('image')
+                    .attr('xlink:href', avatarAtlas.url)
+                    .attr('width', avatarAtlas.width)
+                    .attr('height', avatarAtlas.height);
+            } else {
+                photo.append('image')
+                    .attr('xlink:href', photoUrl(d.photo, d.photo_thumbs, 128))
+                    .attr('x', -cardWidth / 2 + 5)
+                    .attr('y', -25)
+                    .attr('width', 50)
+                    .attr('height', 50);
+            }
+        });
     }
     
     // Név
@@ -0,0 +1,152 @@
+"""Feltöltés tároló: a takarítás nem törölheti a használatban lévő blobokat"""
+
+import io
+import json
+import os
+
+import pytest
+from flask import Flask
+
+from app import db
+from app import upload_store
+from app.backup import BackupManager, backup_manager
+from app.journal import journal
+from app.json_import import JsonImporter
+from app.models import Person
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / 'test.db')
+    app.config['DATA_DIR'] = str(tmp_path)
+    app.config['UPLOAD_FOLDER'] = str(tmp_path / 'uploads')
+    os.makedirs(app.config['UPLOAD_FOLDER'])
+    os.makedirs(tmp_path / 'backups')
+    # A mentések is a teszt könyvtárba kerüljenek
+    monkeypatch.setattr(BackupManager, 'backup_dir', property(lambda self: str(tmp_path / 'backups')))
+    monkeypatch.setattr(BackupManager, 'db_path', property(lambda self: str(tmp_path / 'test.db')))
+    monkeypatch.setattr(backup_manager, '_store', None)
+    db.init_app(app)
+    journal.init_app(app, db.session)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def _store(app, content):
+    name, _created = upload_store.save_stream(io.BytesIO(content), 'jpg', app.config['UPLOAD_FOLDER'])
+    return name
+
+
+def test_imported_photo_survives_collection(app):
+    # A JSON import hivatkozás (upload_refs sor) nélkül írja vissza a photo_path-ot
+    kept = _store(app, b'imported photo')
+    orphan = _store(app, b'orphan upload')
+    export = {'persons': [{'id': 1, 'first_name': 'Anna', 'last_name': 'Kiss',
+                           'photo_path': upload_store.blob_url(kept)}]}
+    JsonImporter().run(io.BytesIO(json.dumps(export).encode()))
+    assert Person.query.one().photo_path == upload_store.blob_url(kept)
+
+    result = upload_store.collect_garbage(app.config['UPLOAD_FOLDER'], 0)
+
+    assert os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], kept))
+    assert not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], orphan))
+    assert result['removed_blobs'] == 1
+
+
+def test_referenced_blob_survives_collection(app):
+    name = _store(app, b'uploaded photo')
+    person = Person(first_name='Béla', last_name='Nagy', photo_path=upload_store.blob_url(name))
+    db.session.add(person)
+    db.session.flush()
+    upload_store.set_reference('person', person.id, name)
+    db.session.commit()
+
+    upload_store.collect_garbage(app.config['UPLOAD_FOLDER'], 0)
+
+    assert os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], name))
+
+
+def _exists(app, name):
+    return os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], name))
+
+
+def test_photo_in_backup_survives_replacement(app):
+    old = _store(app, b'old photo')
+    person = Person(first_name='Anna', last_name='Kiss', photo_path=upload_store.blob_url(old))
+    db.session.add(person)
+    db.session.commit()
+    assert backup_manager.create_backup(trigger='manual')['success']
+
+    new = _store(app, b'new photo')
+    person.photo_path = upload_store.blob_url(new)
+    db.session.commit()
+    # A napló nélkül csak a mentés hivatkozik a régi fotóra
+    db.session.execute(db.text('DELETE FROM change_journal'))
+    db.session.commit()
+
+    upload_store.collect_garbage(app.config['UPLOAD_FOLDER'], 0)
+    assert _exists(app, old) and _exists(app, new)
+
+    # A mentés törlése után már törölhető
+    for backup in backup_manager.list_backups():
+        backup_manager.delete_backup(backup['id'])
+    upload_store.collect_garbage(app.config['UPLOAD_FOLDER'], 0)
+    assert not _exists(app, old) and _exists(app, new)
+
+
+def test_manifest_without_upload_list_is_scanned(app):
+    name = _store(app, b'photo from an old backup')
+    person = Person(first_name='Béla', last_name='Nagy', photo_path=upload_store.blob_url(name))
+    db.session.add(person)
+    db.session.commit()
+    filename = backup_manager.create_backup(trigger='manual')['filename']
+
+    # A lista bevezetése előtti manifest
+    manifest = backup_manager.store.load_manifest(filename)
+    del manifest['metadata']['uploads']
+    backup_manager.store._write_manifest(filename, manifest)
+
+    db.session.delete(person)
+    db.session.execute(db.text('DELETE FROM change_journal'))
+    db.session.commit()
+
+    upload_store.collect_garbage(app.config['UPLOAD_FOLDER'], 0)
+    assert _exists(app, name)
+    assert backup_manager.store.load_manifest(filename)['metadata']['uploads'] == [name]
+
+
+def test_photo_in_journal_survives_replacement(app):
+    old = _store(app, b'journaled photo')
+    person = Person(first_name='Cecília', last_name='Tóth', photo_path=upload_store.blob_url(old))
+    db.session.add(person)
+    db.session.commit()
+    person.photo_path = None
+    db.session.commit()
+
+    upload_store.collect_garbage(app.config['UPLOAD_FOLDER'], 0)
+    assert _exists(app, old)
+
+
+def test_migration_keeps_legacy_files_referenced_by_backups(app):
+    legacy = 'person_1_portrait.jpg'
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], legacy), 'wb') as f:
+        f.write(b'legacy photo')
+    db.session.add(Person(first_name='Dénes', last_name='Kovács', photo_path=upload_store.URL_PREFIX + legacy))
+    db.session.commit()
+    assert backup_manager.create_backup(trigger='manual')['success']
+
+    result = upload_store.migrate_legacy(app.config['UPLOAD_FOLDER'])
+    assert result['converted'] == 1 and result['removed_files'] == 0
+    assert _exists(app, legacy)
+
+    # Ha már sem mentés, sem napló nem hivatkozik rá, a takarítás törli
+    for backup in backup_manager.list_backups():
+        backup_manager.delete_backup(backup['id'])
+    db.session.execute(db.text('DELETE FROM change_journal'))
+    db.session.commit()
+    upload_store.collect_garbage(app.config['UPLOAD_FOLDER'], 0)
+    assert not _exists(app, legacy)
+    assert _exists(app, upload_store.upload_name(Person.query.one().photo_path))